@@ -0,0 +1,139 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from lib.backtest.backtest import Backtest, combination_bets, single_bets
+
+
+# 10年分相当のレースで、券種ごとに条件を変えた回収率を一度に求める時間を測る
+# 着順・オッズ・払い戻しは乱数で作る（払い戻しは的中の確率から控除率を引いたもので、
+# どの買い方でも回収率は 0.7〜0.8 程度になる）
+#   python -m bench.bench_backtest --races 35000
+
+
+def make_runs(n_races, n_horses, rng):
+    race_id = np.repeat([f"{2015 + i * 10 // n_races}{i:08d}" for i in range(n_races)],
+                        n_horses)
+    umaban = np.tile(np.arange(1, n_horses + 1), n_races)
+    strength = rng.gamma(2.0, 1.0, n_races * n_horses)
+    runs = pd.DataFrame({"race_id": race_id, "umaban": umaban,
+                         "waku": (umaban + 1) // 2})
+    # 勝つ確率は強さの比（share）。着順は指数分布の到着順で決める（Plackett-Luce）
+    runs["share"] = strength / runs.assign(s=strength).groupby("race_id")["s"].transform("sum")
+    by_race = runs.assign(key=rng.exponential(1.0, len(runs)) / strength,
+                          neg=-strength).groupby("race_id")
+    runs["rank"] = by_race["key"].rank(method="first").astype(int).to_numpy()
+    runs["popular"] = by_race["neg"].rank(method="first").astype(int).to_numpy()
+    runs["odds"] = np.maximum(1.0, (0.8 / runs["share"]).round(1))
+    return runs
+
+
+def make_payouts(runs, rng):
+    top = runs[runs["rank"] <= 3].sort_values(["race_id", "rank"])
+    race_id = top["race_id"].to_numpy()[::3]
+    (h1, w1, p1), (h2, w2, p2), (h3, w3, p3) = (
+        top[["umaban", "waku", "share"]].to_numpy()[i::3].T for i in range(3))
+    n = len(race_id)
+
+    # 的中の確率（Harville の式）から、控除率を引いた払い戻しにする
+    def frame(bet_type, horses, rate, probability):
+        horses = [np.asarray(h, dtype=float) for h in horses] + [np.full(n, np.nan)] * (3 - len(horses))
+        payout = np.maximum(100, np.round(rate * 10 / np.minimum(probability, 1)) * 10)
+        return pd.DataFrame({"race_id": race_id, "bet_type": bet_type,
+                             "horse_1": horses[0], "horse_2": horses[1],
+                             "horse_3": horses[2], "payout": payout.astype(int)})
+
+    def exacta(a, b):
+        return a * b / (1 - a)
+
+    def trifecta(a, b, c):
+        return exacta(a, b) * c / (1 - a - b)
+
+    def quinella(a, b):
+        return exacta(a, b) + exacta(b, a)
+
+    trio = sum(trifecta(*order) for order in (
+        (p1, p2, p3), (p1, p3, p2), (p2, p1, p3), (p2, p3, p1), (p3, p1, p2), (p3, p2, p1)))
+    frames = [frame("tansho", [h1], 0.8, p1),
+              # 1枠に2頭ずつなので、枠の組み合わせの確率は馬の組み合わせの3倍程度
+              frame("wakuren", [w1, w2], 0.775, quinella(p1, p2) * 3.2),
+              frame("umaren", [h1, h2], 0.775, quinella(p1, p2)),
+              frame("umatan", [h1, h2], 0.75, exacta(p1, p2)),
+              frame("fuku3", [h1, h2, h3], 0.75, trio),
+              frame("tan3", [h1, h2, h3], 0.725, trifecta(p1, p2, p3))]
+    for h, p in ((h1, p1), (h2, p2), (h3, p3)):
+        frames.append(frame("fukusho", [h], 0.8, 3 * p))
+    for (ha, pa), (hb, pb) in (((h1, p1), (h2, p2)), ((h1, p1), (h3, p3)),
+                               ((h2, p2), (h3, p3))):
+        frames.append(frame("wide", [ha, hb], 0.775, 3 * quinella(pa, pb)))
+    payouts = pd.concat(frames, ignore_index=True)
+    # 枠連・ワイドなどの組み合わせは小さい順（払い戻しの表と同じ）
+    horses = payouts[["horse_1", "horse_2", "horse_3"]].to_numpy()
+    unordered = ~payouts["bet_type"].isin(["umatan", "tan3"]).to_numpy()
+    horses[unordered] = np.sort(horses[unordered], axis=1)
+    payouts[["horse_1", "horse_2", "horse_3"]] = horses
+    # 枠連のゾロ目などで同じ組み合わせが2回出ることがあるので1件にする
+    return payouts.drop_duplicates(["race_id", "bet_type", "horse_1", "horse_2", "horse_3"])
+
+
+def measure(label, func):
+    start = time.perf_counter()
+    value = func()
+    print(f"{label:<40} {time.perf_counter() - start:>8.2f} s")
+    return value
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--races", type=int, default=35000)
+    parser.add_argument("--horses", type=int, default=14)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    runs = make_runs(args.races, args.horses, rng)
+    payouts = make_payouts(runs, rng)
+    print(f"{args.races} races, {len(runs)} runs, {len(payouts)} payouts")
+
+    backtest = measure("Backtest (index payouts)", lambda: Backtest(payouts))
+
+    # 単勝・複勝: 人気の上限 × オッズの範囲
+    odds_bands = [(1, 3), (3, 5), (5, 10), (10, 20), (20, 50), (50, 1000)]
+    reports = []
+    start = time.perf_counter()
+    for bet_type in ("tansho", "fukusho"):
+        bets = single_bets(runs, np.ones(len(runs), dtype=bool), bet_type,
+                           columns=["popular", "odds"])
+        popular = bets["popular"].to_numpy()
+        odds = bets["odds"].to_numpy()
+        masks = {(bet_type, max_popular, lo, hi):
+                 (popular <= max_popular) & (odds >= lo) & (odds < hi)
+                 for max_popular in range(1, args.horses + 1)
+                 for lo, hi in odds_bands}
+        reports.append(backtest.sweep(bets, masks))
+
+    # 組み合わせ: 人気上位 k 頭のボックス
+    for bet_type in ("wakuren", "umaren", "wide", "umatan", "fuku3", "tan3"):
+        bets = combination_bets(runs, runs["popular"] <= 6, bet_type,
+                                columns=["popular"])
+        worst = np.max([bets[column].to_numpy() for column in bets
+                        if column.startswith("popular_")], axis=0)
+        masks = {(bet_type, k, 0, 0): worst <= k for k in range(2, 7)}
+        reports.append(backtest.sweep(bets, masks))
+    elapsed = time.perf_counter() - start
+    report = pd.concat(reports)
+    report.index.names = ["bet_type", "max_popular", "min_odds", "max_odds"]
+    print(f"{'sweep (' + str(len(report)) + ' conditions)':<40} {elapsed:>8.2f} s")
+
+    # 1件ずつ辞書で引いた場合と同じ結果になる
+    lookup = {(r.race_id, r.bet_type, r.horse_1, r.horse_2, r.horse_3): r.payout
+              for r in payouts.fillna(-1).itertuples()}
+    check = combination_bets(runs, runs["popular"] <= 3, "wide")
+    expected = [lookup.get((r.race_id, r.bet_type, r.horse_1, r.horse_2, -1.0), 0)
+                for r in check.astype({"race_id": str, "bet_type": str}).itertuples()]
+    assert np.array_equal(backtest.settle(check), expected)
+
+    pd.set_option("display.width", 120)
+    print(report.sort_values("roi", ascending=False).head(10))
+    print(report.xs("umaren", level="bet_type"))
@@ -0,0 +1,98 @@
+import argparse
+import shutil
+import tempfile
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+import pyarrow.compute as pc
+
+from lib.storage.race_dataset import RaceDataset
+
+
+# 学習用の Parquet の読み込み時間を測る（DB には接続しない）
+# 10年分の race_result 相当の行を一時ディレクトリに年ごとに追記してから、
+# 全件・年や競馬場の絞り込み・列の絞り込み・条件の絞り込みで読む
+#   python -m bench.bench_dataset --years 10
+
+
+def make_race_results(year, n_places, n_races, rng):
+    # 1場あたり n_races レース、1レース 14頭
+    n = n_places * n_races * 14
+    race = np.arange(n) // 14
+    place = race // n_races + 1
+    race_no = race % n_races
+    race_id = [f"{year}{p:02d}{r // 12 // 8 + 1:02d}{r // 12 % 8 + 1:02d}{r % 12 + 1:02d}"
+               for p, r in zip(place, race_no)]
+    umaban = np.arange(n) % 14 + 1
+    time_sec = rng.normal(95, 3, n).round(1)
+    return pd.DataFrame({
+        "race_id": race_id,
+        "race_date": [date(year, 1, 5) + timedelta(days=int(r // 12 // 8 * 14 + r // 12 % 8))
+                      for r in race_no],
+        "rank": rng.permuted(np.tile(np.arange(1, 15), n // 14)),
+        "waku": (umaban + 1) // 2,
+        "umaban": umaban,
+        "horse_name": [f"ホース{i}" for i in rng.integers(0, 50000, n)],
+        "horse_sex": rng.choice(["牡", "牝", "セ"], n),
+        "horse_age": rng.integers(2, 9, n),
+        "jockey_weight": rng.choice([54.0, 55.0, 56.0, 57.0, 58.0], n),
+        "jockey_name": [f"騎手{i}" for i in rng.integers(0, 300, n)],
+        "time": [f"{int(t // 60)}:{t % 60:04.1f}" for t in time_sec],
+        "popular": rng.integers(1, 15, n),
+        "odds": rng.gamma(1.5, 20, n).round(1) + 1,
+        "agari": rng.normal(35, 1, n).round(1),
+        "trainer_place": rng.choice(["美浦", "栗東"], n),
+        "trainer_name": [f"調教師{i}" for i in rng.integers(0, 400, n)],
+        "horse_weight": rng.integers(400, 560, n),
+        "horse_weight_delta": rng.integers(-10, 11, n),
+        "horse_id": [f"{year - 3}{i:06d}" for i in rng.integers(0, 50000, n)],
+        "jockey_id": [f"{i:05d}" for i in rng.integers(0, 300, n)],
+        "trainer_id": [f"{i:05d}" for i in rng.integers(0, 400, n)],
+        "time_sec": time_sec,
+        **{f"corner_{i}": rng.integers(1, 15, n) for i in range(1, 5)},
+    })
+
+
+def measure(label, func):
+    start = time.perf_counter()
+    value = func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<32} {len(value):>9} rows {elapsed * 1000:>8.0f} ms")
+    return value
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--places", type=int, default=10)
+    # 1場1年あたりのレース数（中央競馬は 10場で年 3400 レースほど）
+    parser.add_argument("--races", type=int, default=350)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    root = tempfile.mkdtemp()
+    try:
+        dataset = RaceDataset(root)
+        first = 2024 - args.years + 1
+        start = time.perf_counter()
+        for year in range(first, 2025):
+            dataset.append("race_result", make_race_results(
+                year, args.places, args.races, rng))
+        print(f"append {args.years} years: {time.perf_counter() - start:.1f} s")
+
+        # 同じ年を書き直しても行は増えない
+        dataset.append("race_result", make_race_results(
+            2024, args.places, args.races, rng))
+
+        frame = measure("read all", lambda: dataset.read("race_result"))
+        assert len(frame) == args.years * args.places * args.races * 14
+        measure("read 1 year", lambda: dataset.read("race_result", years=[2024]))
+        measure("read 1 place", lambda: dataset.read("race_result", places=["05"]))
+        measure("read 3 columns", lambda: dataset.read(
+            "race_result", columns=["race_id", "horse_id", "rank"]))
+        measure("read rank == 1", lambda: dataset.read(
+            "race_result", filter=pc.field("rank") == 1))
+    finally:
+        shutil.rmtree(root)
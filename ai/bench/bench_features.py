@@ -0,0 +1,89 @@
+import argparse
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from bench.bench_dataset import make_race_results
+from lib.features.feature_store import HORSE_FEATURES, PERSON_FEATURES, FeatureStore
+from lib.storage.race_dataset import RaceDataset
+
+
+# FeatureStore の全件の計算と、開催日を1日分足したときの update() の時間を測る
+# あわせて次の2つを確かめる
+#   - update() で書き足した特徴量が、全件から求め直したものと同じ
+#   - ある日の特徴量が、その日以降のレースを除いて求めたものと同じ（未来の情報を使っていない）
+#   python -m bench.bench_features --years 5
+
+
+def make_race_infos(race_results, rng):
+    race_ids = race_results["race_id"].unique()
+    n = len(race_ids)
+    return pd.DataFrame({
+        "race_id": race_ids,
+        "kind": rng.choice(["芝", "ダ"], n),
+        "length": rng.choice([1200, 1400, 1600, 1800, 2000, 2400, 3000], n),
+        "state": rng.choice(["良", "稍", "重", "不"], n, p=[0.7, 0.15, 0.1, 0.05]),
+    })
+
+
+def measure(label, func):
+    start = time.perf_counter()
+    value = func()
+    print(f"{label:<24} {time.perf_counter() - start:>8.2f} s")
+    return value
+
+
+def assert_same(left, right):
+    columns = list(HORSE_FEATURES + PERSON_FEATURES)
+    left = left.sort_values(["race_id", "umaban"]).reset_index(drop=True)
+    right = right.sort_values(["race_id", "umaban"]).reset_index(drop=True)
+    assert (left["race_id"].astype(str) == right["race_id"].astype(str)).all()
+    np.testing.assert_allclose(left[columns].to_numpy(dtype=float, na_value=np.nan),
+                               right[columns].to_numpy(dtype=float, na_value=np.nan),
+                               rtol=1e-9)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--places", type=int, default=10)
+    parser.add_argument("--races", type=int, default=350)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    root = tempfile.mkdtemp()
+    try:
+        dataset = RaceDataset(f"{root}/dataset")
+        store = FeatureStore(dataset, f"{root}/features")
+        last = None
+        for year in range(2025 - args.years, 2025):
+            race_results = make_race_results(year, args.places, args.races, rng)
+            dataset.append("race_info", make_race_infos(race_results, rng))
+            if year == 2024:
+                # 最後の開催日を後から足す
+                is_last = race_results["race_date"] == race_results["race_date"].max()
+                last = race_results[is_last]
+                race_results = race_results[~is_last]
+            dataset.append("race_result", race_results)
+        n_rows = len(dataset.to_table("race_result", columns=["race_id"]))
+
+        n_races = measure(f"update ({n_rows} rows)", store.update)
+        dataset.append("race_result", last)
+        n_new = measure(f"update (+{len(last)} rows)", store.update)
+        print(f"{n_races} + {n_new} races")
+
+        runs = store.load_runs()
+        full = measure("compute (all)", lambda: FeatureStore.compute(runs))
+        assert_same(store.read(), full)
+
+        dates = np.sort(runs["race_date"].unique())
+        day = dates[len(dates) // 2]
+        before = runs[runs["race_date"] <= day].reset_index(drop=True)
+        assert_same(FeatureStore.compute(before, before["race_date"] == day),
+                    full[full["race_date"] == day])
+        print("ok")
+    finally:
+        shutil.rmtree(root)
@@ -0,0 +1,82 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from bench.synthetic_pages import horse_page, ped_page
+from lib.dao.race_result_dao import DSN
+from lib.scraping.html_parser import HtmlParser
+from lib.scraping.pipeline import HorsePipeline, PedigreePipeline
+from lib.scraping.scraping import Scraper
+from lib.storage.page_store import FilePageStore
+
+
+# 馬・血統表ページの解析速度を測る（1プロセスあたりのページ/秒）
+# --dsn を指定すると、プロセスプールで解析して DB に投入するまでも測る
+#   python -m bench.bench_horse_parser -n 500
+#   python -m bench.bench_horse_parser -n 5000 --dsn postgresql://...
+
+# 1プロセスあたりの目標（ページ/秒、lxml + 部分解析で）
+# 馬 50万頭を 8 プロセスで解析して、馬・血統表それぞれ1時間程度に収まる速さ
+TARGETS = {
+    "horse": 20,
+    "ped": 30,
+}
+
+DRIVEFUNCS = {
+    "horse": Scraper._scrape_horse_drivefunc,
+    "ped": Scraper._scrape_ped_drivefunc,
+}
+
+PIPELINES = {
+    "horse": HorsePipeline,
+    "ped": PedigreePipeline,
+}
+
+
+def make_corpus(root, n, seed=0):
+    rng = random.Random(seed)
+    store = FilePageStore(root)
+    keys = []
+    for kind in ("horse", "ped"):
+        os.makedirs(f"{root}/{kind}", exist_ok=True)
+    for i in range(n):
+        horse_id = f"2019{i:06d}"
+        store.write("horse", horse_id, horse_page(horse_id, rng))
+        store.write("ped", horse_id, ped_page(horse_id, rng))
+        keys.append(horse_id)
+    return store, keys
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--pages", type=int, default=200)
+    parser.add_argument("--dsn", default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        store, keys = make_corpus(root, args.pages)
+
+        for kind, drivefunc in DRIVEFUNCS.items():
+            for html_parser in (HtmlParser(), HtmlParser("lxml"),
+                                HtmlParser("lxml", partial=True)):
+                start = time.perf_counter()
+                for key in keys:
+                    drivefunc(store, html_parser, key)
+                rate = len(keys) / (time.perf_counter() - start)
+                label = html_parser.engine + (" (partial)" if html_parser.partial else "")
+                status = "ok" if rate >= TARGETS[kind] else "BELOW TARGET"
+                print(f"{kind:<6} {label:<20} {rate:>8.1f} pages/s "
+                      f"(target {TARGETS[kind]}) {status}")
+
+        if args.dsn:
+            for kind, pipeline_class in PIPELINES.items():
+                pipeline = pipeline_class(
+                    store, HtmlParser("lxml", partial=True),
+                    dao_factory=lambda: pipeline_class.DAO(args.dsn or DSN))
+                start = time.perf_counter()
+                n_heads, n_rows = pipeline.run(keys, total=len(keys))
+                elapsed = time.perf_counter() - start
+                print(f"{kind:<6} parse+load {len(keys) / elapsed:>8.1f} pages/s "
+                      f"({n_heads} + {n_rows} rows)")
@@ -0,0 +1,84 @@
+import argparse
+import re
+import time
+
+import numpy as np
+
+from bench.bench_race_result_dao import make_race_results
+from lib.dao.race_result_dao import RaceResultDAO
+from lib.scraping.normalizer import RaceResultNormalizer
+
+
+# 1行ずつ変換する場合と、バッチ単位の RaceResultNormalizer を比べる
+# RaceResultNormalizer は DataFrame の作成から投入用のタプルにするまでを測る
+# （DataFrame の作成とタプルへの変換だけで1行ずつの変換より時間がかかるので、
+#   バッチの方が遅い。normalize() 自体の変換は列ごとに pyarrow.compute で行う）
+#   python -m bench.bench_normalizer -n 100000
+
+
+# 1行ずつ変換する場合の、RaceResultNormalizer と同じ書式の解釈
+TIME_RE = re.compile(r"(?:(\d+):)?(\d+(?:\.\d+)?)")
+MARGIN_RE = re.compile(r"(\d+)?(?:\.?(\d)/(\d))?")
+CORNERS_RE = re.compile(r"\d+(?:-\d+)*")
+
+
+def time_sec(value):
+    match = isinstance(value, str) and TIME_RE.fullmatch(value)
+    if not match:
+        return np.nan
+    minutes, seconds = match.groups()
+    return int(minutes or 0) * 60 + float(seconds)
+
+
+def margin(value):
+    if not isinstance(value, str):
+        return np.nan
+    if value in RaceResultNormalizer.MARGINS:
+        return RaceResultNormalizer.MARGINS[value]
+    match = MARGIN_RE.fullmatch(value)
+    if not match or not value:
+        return np.nan
+    whole, num, den = match.groups()
+    return int(whole or 0) + (int(num) / int(den) if num else 0)
+
+
+def measure(label, n, func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<32} {n:>8} rows {elapsed:>8.3f} s {n / elapsed:>10.0f} rows/s")
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--rows", type=int, default=100000)
+    # RaceResultPipeline の1チャンク分（64レース）程度
+    parser.add_argument("-b", "--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    rows = list(make_race_results(args.rows))
+    normalizer = RaceResultNormalizer()
+
+    def normalize_batches():
+        for i in range(0, len(rows), args.batch_size):
+            frame, _ = normalizer.normalize(
+                normalizer.to_frame(rows[i:i + args.batch_size]))
+            list(normalizer.to_tuples(
+                frame, RaceResultDAO.TYPED_RACE_RESULT_COLUMNS))
+
+    # 同じ列を1行ずつ求める場合（タイム・着差・通過順の変換を含む）
+    def per_row_values(row):
+        passage = row.passage_rate or ""
+        return RaceResultDAO._race_result_values(row) + (
+            time_sec(row.time_1),
+            margin(row.time_2),
+            "{" + passage.replace("-", ",") + "}"
+            if CORNERS_RE.fullmatch(passage) else None,
+        )
+
+    per_row = measure("per row", args.rows, lambda: [
+        per_row_values(row) for row in rows])
+    batch = measure(f"RaceResultNormalizer (x{args.batch_size})", args.rows,
+                    normalize_batches)
+    print(f"per row / batch: x{per_row / batch:.2f}")
@@ -0,0 +1,93 @@
+import argparse
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from bench.bench_dataset import make_race_results
+from lib.features.pace import SECTION, load_pace, pace_features
+from lib.storage.race_dataset import RaceDataset
+
+
+# ラップタイムを RaceDataset に保存して読み直し、全レースのペースを求める時間を測る
+# 前半・後半 3F はレースごとに Python で求めたものと同じになることも確かめる
+#   python -m bench.bench_pace --years 10
+
+LENGTHS = [1000, 1150, 1200, 1400, 1600, 1700, 1800, 2000, 2400, 2500, 3000, 3600]
+
+
+def make_race_infos(race_results, rng):
+    races = race_results.drop_duplicates("race_id")[["race_id", "race_date"]] \
+        .reset_index(drop=True)
+    n = len(races)
+    length = rng.choice(LENGTHS, n)
+    laps = []
+    for distance, pace in zip(length, rng.normal(0, 0.4, n)):
+        n_laps = -(-distance // SECTION)
+        first = distance - SECTION * (n_laps - 1)
+        # 前半が速いほど後半が遅くなるラップ
+        section = 12.0 + pace * np.linspace(-1, 1, n_laps) + rng.normal(0, 0.2, n_laps)
+        section[0] = section[0] * first / SECTION - 0.5
+        laps.append(section.round(1).tolist())
+    return races.assign(
+        kind=rng.choice(["芝", "ダ"], n), length=length,
+        state=rng.choice(["良", "稍", "重", "不"], n), laps=laps)
+
+
+def furlongs_by_race(laps, length):
+    # 1レースずつ、スタートからの距離を足していく
+    first_3f, last_3f = [], []
+    for values, distance in zip(laps, length):
+        values = list(values)
+        total, covered = 0.0, 0
+        section = distance - SECTION * (len(values) - 1)
+        for value in values:
+            take = min(section, 600 - covered)
+            total += value * take / section
+            covered += take
+            section = SECTION
+            if covered >= 600:
+                break
+        first_3f.append(round(total, 1))
+        last_3f.append(round(sum(values[-3:]), 1))
+    return np.array(first_3f), np.array(last_3f)
+
+
+def measure(label, func):
+    start = time.perf_counter()
+    value = func()
+    print(f"{label:<24} {time.perf_counter() - start:>8.2f} s")
+    return value
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--places", type=int, default=10)
+    parser.add_argument("--races", type=int, default=350)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    root = tempfile.mkdtemp()
+    try:
+        dataset = RaceDataset(root)
+        for year in range(2025 - args.years, 2025):
+            race_results = make_race_results(year, args.places, args.races, rng)
+            dataset.append("race_info", make_race_infos(race_results, rng))
+
+        pace = measure("load_pace", lambda: load_pace(dataset))
+        races = dataset.read("race_info", columns=["race_id", "race_date", "kind",
+                                                   "length", "laps"])
+        measure("pace_features", lambda: pace_features(races))
+        first_3f, last_3f = measure("by race (3F only)", lambda: furlongs_by_race(
+            races["laps"], races["length"].to_numpy(dtype=int)))
+        print(f"{len(pace)} races")
+        print(pd.crosstab(pace["pace"], races["kind"].astype(str)))
+
+        np.testing.assert_allclose(pace["first_3f"], first_3f, atol=0.051)
+        np.testing.assert_allclose(pace["last_3f"], last_3f, atol=0.051)
+        print("ok")
+    finally:
+        shutil.rmtree(root)
@@ -0,0 +1,99 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from bench.synthetic_pages import race_list_page, race_result_page
+from lib.dao.race_result_dao import _Record
+from lib.scraping.html_parser import HtmlParser
+from lib.scraping.scraping import Scraper, race_list_key
+from lib.storage.page_store import FilePageStore
+from lib.storage.parse_cache import ParseCache
+
+
+# レース結果・レース一覧の解析を ParseCache あり・なしで比べる
+#   none: 毎回解析する（今までの動作）
+#   cold: 解析して結果を保存する（1回目）
+#   warm: 保存済みの結果を読むだけ（2回目以降）
+#   read: ページを読んでハッシュを求めるだけ（warm の下限）
+# warm の結果が解析し直したものと同じこと、race_result のバージョンを上げても
+# race_list の保存済みの結果はそのまま使われることも確かめる
+#   python -m bench.bench_parse_cache -n 300
+
+
+def make_corpus(root, n, seed=0):
+    rng = random.Random(seed)
+    store = FilePageStore(root)
+    for kind in ("race_result", "race_list"):
+        os.makedirs(f"{root}/{kind}", exist_ok=True)
+    race_ids = []
+    kaisai_dates = []
+    for i in range(0, n, 12):
+        kaisai_date = datetime(2024, 1, 6) + timedelta(days=i // 12)
+        ids = [f"{kaisai_date:%Y}{i // 12:06d}{j + 1:02d}" for j in range(min(12, n - i))]
+        for race_id in ids:
+            store.write("race_result", race_id, race_result_page(race_id, rng))
+        store.write("race_list", race_list_key(kaisai_date), race_list_page(ids, rng))
+        race_ids += ids
+        kaisai_dates.append(kaisai_date)
+    return store, race_ids, kaisai_dates
+
+
+def run(store, parser, race_ids, kaisai_dates):
+    results = [Scraper._scrape_race_result_drivefunc(store, parser, race_id)
+               for race_id in race_ids]
+    lists = [Scraper._scrape_race_list_drivefunc(store, parser, kaisai_date)
+             for kaisai_date in kaisai_dates]
+    return results, lists
+
+
+def plain(value):
+    # 比べられるように、レコードを値のタプルにする
+    if isinstance(value, _Record):
+        return plain(value.__getstate__())
+    if isinstance(value, (list, tuple)):
+        return [plain(v) for v in value]
+    if isinstance(value, dict):
+        return {k: plain(v) for k, v in value.items()}
+    return value
+
+
+def measure(label, n, func):
+    start = time.perf_counter()
+    value = func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<8} {elapsed:>8.2f} s {n / elapsed:>10.1f} pages/s")
+    return value
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--pages", type=int, default=300)
+    parser.add_argument("--engine", choices=HtmlParser.ENGINES, default="lxml")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        store, race_ids, kaisai_dates = make_corpus(f"{root}/pages", args.pages)
+        n = len(race_ids) + len(kaisai_dates)
+        cache = ParseCache(f"{root}/cache")
+
+        expected = measure("none", n, lambda: run(
+            store, HtmlParser(args.engine, partial=True), race_ids, kaisai_dates))
+        cached_parser = HtmlParser(args.engine, partial=True, cache=cache)
+        measure("cold", n, lambda: run(store, cached_parser, race_ids, kaisai_dates))
+        warm = measure("warm", n, lambda: run(store, cached_parser, race_ids, kaisai_dates))
+        measure("read", n, lambda: [
+            ParseCache.key(store.read("race_result", race_id)) for race_id in race_ids])
+        print(f"hits {cache.hits}, misses {cache.misses}")
+        assert plain(warm) == plain(expected)
+
+        # race_result のバージョンだけ上げると、race_list は保存済みの結果を使う
+        hits, misses = cache.hits, cache.misses
+        Scraper.PARSER_VERSIONS["race_result"] += 1
+        run(store, cached_parser, race_ids, kaisai_dates)
+        assert cache.misses - misses == len(race_ids)
+        assert cache.hits - hits == len(kaisai_dates)
+        print(f"pruned {cache.prune('race_result', Scraper.PARSER_VERSIONS['race_result'])}")
+        print("ok")
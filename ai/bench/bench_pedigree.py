@@ -0,0 +1,104 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from lib.features.pedigree_features import pedigree_features
+from lib.pedigree.pedigree_graph import GENERATIONS, PedigreeGraph
+
+
+# 合成した血統（世代ごとに種牡馬を人気の偏った分布から選ぶ）で、
+# PedigreeGraph の構築・閉包・インブリード係数・子孫の検索・父系の特徴量の時間を測る
+# インブリード係数は、1頭ずつ経路を列挙して求めたものと同じになることも確かめる
+#   python -m bench.bench_pedigree --horses 300000
+
+
+def make_edges(n_horses, n_cohorts, rng):
+    # 世代（cohort）ごとに、前の世代までの牡馬・牝馬から父母を選ぶ
+    cohort = np.sort(rng.integers(0, n_cohorts, n_horses))
+    male = rng.random(n_horses) < 0.5
+    sire = np.full(n_horses, -1)
+    dam = np.full(n_horses, -1)
+    for c in range(1, n_cohorts):
+        children = np.flatnonzero(cohort == c)
+        older = np.flatnonzero(cohort < c)
+        stallions = older[male[older]][-2000:]
+        mares = older[~male[older]][-50000:]
+        # 種牡馬の人気は Zipf 風（少数の種牡馬に集中する）
+        weights = 1.0 / np.arange(1, len(stallions) + 1)
+        sire[children] = rng.choice(stallions[::-1], len(children), p=weights / weights.sum())
+        dam[children] = rng.choice(mares, len(children))
+    ids = np.array([f"{2000 + c}{i:06d}" for i, c in enumerate(cohort)], dtype=object)
+    edges = [(ids[i], side, ids[p]) for side, parents in (("s", sire), ("d", dam))
+             for i, p in enumerate(parents) if p >= 0]
+    return ids, edges
+
+
+def inbreeding_by_paths(graph, node, generations=GENERATIONS):
+    # 1頭ずつ、父側・母側の祖先への経路を列挙して Wright の式で求める
+    def paths(start, depth):
+        result = [(start, ())]
+        frontier = [(start, ())]
+        for _ in range(depth - 1):
+            frontier = [(parent, via + (horse,))
+                        for horse, via in frontier
+                        for parent in (graph.sire[horse], graph.dam[horse]) if parent >= 0]
+            result += frontier
+        return result
+
+    f = 0.0
+    sire, dam = graph.sire[node], graph.dam[node]
+    if sire < 0 or dam < 0:
+        return f
+    for a1, via1 in paths(sire, generations):
+        for a2, via2 in paths(dam, generations):
+            if a1 == a2 and not set(via1) & set(via2):
+                f += 0.5 ** (len(via1) + len(via2) + 1)
+    return f
+
+
+def measure(label, func):
+    start = time.perf_counter()
+    value = func()
+    print(f"{label:<28} {time.perf_counter() - start:>8.2f} s")
+    return value
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--horses", type=int, default=300000)
+    parser.add_argument("--cohorts", type=int, default=30)
+    parser.add_argument("--runs", type=int, default=500000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    ids, edges = make_edges(args.horses, args.cohorts, rng)
+    graph = measure(f"from_edges ({len(edges)})", lambda: PedigreeGraph.from_edges(edges))
+    measure("ancestor_matrix", lambda: graph.ancestor_matrix())
+    n_rows = measure("closure", lambda: sum(1 for _ in graph.closure_tuples()))
+    print(f"{n_rows} closure rows")
+    f = measure("inbreeding", lambda: graph.inbreeding())
+    print(f"inbred: {np.count_nonzero(f)} / {len(f)}, max {f.max():.4f}")
+
+    top_sire = pd.Series(graph.sire[graph.sire >= 0]).value_counts().index[0]
+    descendants = measure("descendants (top sire)",
+                          lambda: graph.descendants(graph.ids[top_sire]))
+    print(f"{len(descendants)} descendants")
+
+    runs = pd.DataFrame({
+        "race_id": np.arange(args.runs) // 14,
+        "umaban": np.arange(args.runs) % 14 + 1,
+        "horse_id": rng.choice(ids[-len(ids) // 3:], args.runs),
+        "race_date": pd.Timestamp("2015-01-01")
+        + pd.to_timedelta(np.arange(args.runs) // 14 // 40, unit="D"),
+        "rank": np.tile(np.arange(1, 15), args.runs // 14 + 1)[:args.runs],
+        "kind": rng.choice(["芝", "ダ"], args.runs),
+        "length": rng.choice([1200, 1600, 2000, 2400], args.runs),
+    })
+    measure(f"pedigree_features ({args.runs})", lambda: pedigree_features(runs, graph))
+
+    sample = rng.choice(np.flatnonzero(f > 0), 200)
+    expected = [inbreeding_by_paths(graph, node) for node in sample]
+    np.testing.assert_allclose(f[sample], expected)
+    print("ok")
@@ -0,0 +1,118 @@
+import argparse
+import gc
+import pickle
+import random
+import time
+import tracemalloc
+
+from lib.dao.race_result_dao import (HaronTime, PayoutRow, RaceInfo,
+                                    RaceResult, RaceResult_Row)
+from lib.scraping.race_result_batch import RaceResultBatch
+from bench.bench_race_result_dao import make_race_infos, make_race_results
+
+
+# 解析結果の持ち方ごとに、メモリ使用量と pickle（プロセス間の受け渡し）の速さを比べる
+#   dict:  __dict__ を持つ以前のクラス、払い戻し・ラップは dict のリスト
+#   slots: __slots__ のクラス、払い戻し・ラップは NamedTuple
+#   batch: RaceResultBatch（列ごとの配列）
+#   python -m bench.bench_race_records -n 5000
+
+
+# __slots__ を持たない以前と同じ形のクラス
+def dict_class(cls):
+    def __init__(self):
+        for name in cls.__slots__:
+            setattr(self, name, None)
+    return type(f"Dict{cls.__name__}", (), {"__init__": __init__})
+
+
+DictRaceInfo = dict_class(RaceInfo)
+DictRaceResult_Row = dict_class(RaceResult_Row)
+DictRaceResult = dict_class(RaceResult)
+
+
+def make_results(n_races, seed=0):
+    rng = random.Random(seed)
+    rows = list(make_race_results(n_races * 16))
+    results = []
+    for i, info in enumerate(make_race_infos(n_races)):
+        result = RaceResult()
+        result.race_id = info.race_id
+        result.race_info = info
+        result.race_order = rows[i * 16:(i + 1) * 16]
+        result.payout = {
+            kind: [PayoutRow(f"{rng.randint(100, 99999):,}円",
+                             str(rng.randint(1, 16)), str(rng.randint(1, 16)))
+                   for _ in range(3 if kind in ("fukusho", "wide") else 1)]
+            for kind in ("tansho", "fukusho", "wakuren", "umaren", "wide",
+                         "umatan", "fuku3", "tan3")}
+        result.rap_pace = [HaronTime(f"{(j + 1) * 200}m", f"{12 + j}.0",
+                                     f"{rng.uniform(11, 13):.1f}")
+                           for j in range(8)]
+        results.append(result)
+    return results
+
+
+def as_dict_class(obj, cls):
+    copy = cls()
+    for name in type(obj).__slots__:
+        setattr(copy, name, getattr(obj, name))
+    return copy
+
+
+def to_dict_results(results):
+    converted = []
+    for result in results:
+        copy = as_dict_class(result, DictRaceResult)
+        copy.race_info = as_dict_class(result.race_info, DictRaceInfo)
+        copy.race_order = [as_dict_class(row, DictRaceResult_Row)
+                           for row in result.race_order]
+        copy.payout = {kind: [row._asdict() for row in rows]
+                       for kind, rows in result.payout.items()}
+        copy.rap_pace = [row._asdict() for row in result.rap_pace]
+        converted.append(copy)
+    return converted
+
+
+# 作成した構造が確保しているメモリ（バイト）と構造
+def allocated(build):
+    gc.collect()
+    tracemalloc.start()
+    obj = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size, obj
+
+
+def timed(func):
+    start = time.perf_counter()
+    value = func()
+    return time.perf_counter() - start, value
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--races", type=int, default=5000)
+    args = parser.parse_args()
+
+    results = make_results(args.races)
+    # 文字列も含めて各構造が自分の分を持つよう、pickle を通して作り直したものを測る
+    dict_results = pickle.dumps(to_dict_results(results))
+    slots_results = pickle.dumps(results)
+    builds = {
+        "dict": lambda: pickle.loads(dict_results),
+        "slots": lambda: pickle.loads(slots_results),
+        "batch": lambda: RaceResultBatch.from_results(results)[0],
+    }
+
+    print(f"{args.races} races, {args.races * 16} rows")
+    print(f"{'':<6} {'memory':>10} {'pickle':>10} {'dumps':>9} {'loads':>9}")
+    for label, build in builds.items():
+        size, obj = allocated(build)
+        dump_time, data = timed(lambda: pickle.dumps(obj, protocol=5))
+        load_time, _ = timed(lambda: pickle.loads(data))
+        print(f"{label:<6} {size / 2**20:>8.1f}MB {len(data) / 2**20:>8.1f}MB "
+              f"{dump_time * 1000:>7.0f}ms {load_time * 1000:>7.0f}ms")
+        if label == "batch":
+            pandas_time, _ = timed(obj.to_pandas)
+            print(f"batch.to_pandas: {pandas_time * 1000:.0f}ms")
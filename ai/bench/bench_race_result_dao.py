@@ -0,0 +1,97 @@
+import argparse
+import random
+import time
+
+from lib.dao.race_result_dao import DSN, RaceInfo, RaceResult_Row, RaceResultDAO
+
+
+# 1行ずつ INSERT + commit する経路と COPY による一括投入を比較する
+# 一時テーブルに投入するため、既存のデータには影響しない
+#   python -m bench.bench_race_result_dao -n 20000
+
+
+def make_race_infos(n):
+    for i in range(n):
+        info = RaceInfo()
+        info.race_id = f"2024{i:08d}"
+        info.no = str(i % 12 + 1)
+        info.name = "サンプルステークス"
+        info.time = "15:40"
+        info.kind = "芝"
+        info.length = "1600"
+        info.direction = "右"
+        info.weather = "晴"
+        info.state = "良"
+        info.course = "3回"
+        yield info
+
+
+def make_race_results(n):
+    for i in range(n):
+        row = RaceResult_Row()
+        row.race_id = f"2024{i // 16:08d}"
+        row.rank = str(i % 16 + 1)
+        row.waku = str(i % 8 + 1)
+        row.umaban = str(i % 16 + 1)
+        row.horse_name = "サンプルホース"
+        row.horse_sex = "牡"
+        row.horse_age = "3"
+        row.jockey_weight = "57.0"
+        row.jockey_name = "騎手"
+        row.time_1 = "1:34.5"
+        row.time_2 = "クビ"
+        row.odds_1 = str(i % 16 + 1)
+        row.odds_2 = f"{random.uniform(1, 300):.1f}"
+        row.time_3 = "34.1"
+        row.passage_rate = "3-3-2-1"
+        row.trainer_place = "美浦"
+        row.trainer_name = "調教師"
+        row.horse_weight = "480"
+        row.horse_weight_delta = "+2"
+        row.horse_id = f"2021{i:06d}"
+        row.jockey_id = "01234"
+        row.trainer_id = "01234"
+        yield row
+
+
+def create_temp_tables(dao):
+    with dao.conn.cursor() as curs:
+        curs.execute("DROP TABLE IF EXISTS pg_temp.race_info")
+        curs.execute("DROP TABLE IF EXISTS pg_temp.race_result")
+        curs.execute("CREATE TEMP TABLE race_info (LIKE public.race_info INCLUDING INDEXES)")
+        curs.execute("CREATE TEMP TABLE race_result (LIKE public.race_result INCLUDING INDEXES)")
+    dao.conn.commit()
+
+
+def measure(label, n, func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {n:>8} rows {elapsed:>8.3f} s {n / elapsed:>10.0f} rows/s")
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--rows", type=int, default=10000)
+    parser.add_argument("-c", "--chunk-size", type=int,
+                        default=RaceResultDAO.CHUNK_SIZE)
+    parser.add_argument("--dsn", default=DSN)
+    args = parser.parse_args()
+
+    dao = RaceResultDAO(args.dsn)
+    n_info = max(args.rows // 16, 1)
+
+    create_temp_tables(dao)
+    per_row = measure("insert_race_info (per row)", n_info, lambda: [
+        dao.insert_race_info(info) for info in make_race_infos(n_info)])
+    per_row += measure("insert_race_result (per row)", args.rows, lambda: [
+        dao.insert_race_result(row) for row in make_race_results(args.rows)])
+
+    create_temp_tables(dao)
+    batch = measure("insert_race_infos (COPY)", n_info, lambda: dao.insert_race_infos(
+        make_race_infos(n_info), args.chunk_size))
+    batch += measure("insert_race_results (COPY)", args.rows, lambda: dao.insert_race_results(
+        make_race_results(args.rows), args.chunk_size))
+
+    print(f"speedup: x{per_row / batch:.1f}")
@@ -0,0 +1,148 @@
+import argparse
+import random
+import statistics
+import time
+from datetime import date, timedelta
+
+from lib.dao.race_result_dao import DSN, RaceResultDAO, copy_rows
+
+
+# 主キー・インデックス・年ごとの分割の有無で、よく使う検索の時間を比べる
+#   flat:  旧構成（主キー、インデックスなし）
+#   keyed: sql/race_result/create_table.sql の構成
+# それぞれ専用のスキーマに同じデータを入れて測り、最後にスキーマごと消す
+#   python -m bench.bench_race_result_queries -n 20000
+
+CREATE_TABLE_SQL = "sql/race_result/create_table.sql"
+SCHEMAS = ("bench_flat", "bench_keyed")
+FIRST_YEAR = 2000
+N_YEARS = 25
+
+
+def make_rows(n_races, seed=0):
+    rng = random.Random(seed)
+    infos = []
+    results = []
+    for i in range(n_races):
+        year = FIRST_YEAR + i * N_YEARS // n_races
+        race_id = f"{year}{i:08d}"
+        race_date = date(year, 1, 1) + timedelta(days=i * 365 * N_YEARS // n_races % 365)
+        infos.append((race_id, i % 12 + 1, "芝", 1600, "右", "サンプル",
+                      "15:40", "晴", "良", "3回") + (None,) * 8 + (race_date,))
+        for umaban in range(1, 17):
+            results.append((
+                race_id, umaban, (umaban + 1) // 2, umaban, "サンプルホース",
+                "牡", 3, 57.0, "騎手", "1:34.5", "クビ", umaban,
+                rng.uniform(1, 300), 34.1, "3-3-2-1", "美浦", "調教師", 480, 2,
+                f"{year - 3}{rng.randrange(n_races):06d}",
+                f"{rng.randrange(200):05d}", f"{rng.randrange(300):05d}",
+            ))
+    return infos, results
+
+
+def create_schemas(dao):
+    with dao.conn.cursor() as curs:
+        for schema in SCHEMAS:
+            curs.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+            curs.execute(f"CREATE SCHEMA {schema}")
+        curs.execute("SET search_path TO bench_keyed")
+        with open(CREATE_TABLE_SQL) as f:
+            curs.execute(f.read())
+        curs.execute("SET search_path TO bench_flat")
+        curs.execute("CREATE TABLE race_info (LIKE bench_keyed.race_info)")
+        curs.execute("CREATE TABLE race_result (LIKE bench_keyed.race_result)")
+    dao.conn.commit()
+
+
+def drop_schemas(dao):
+    with dao.conn.cursor() as curs:
+        curs.execute("RESET search_path")
+        for schema in SCHEMAS:
+            curs.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+    dao.conn.commit()
+
+
+def load(dao, schema, infos, results, conflict=False):
+    with dao.conn.cursor() as curs:
+        curs.execute(f"SET search_path TO {schema}")
+    info_columns = RaceResultDAO.RACE_INFO_COLUMNS + ("race_date",)
+    copy_rows(dao.conn, "race_info", info_columns, infos, dao.CHUNK_SIZE,
+              RaceResultDAO.RACE_INFO_KEYS if conflict else None)
+    copy_rows(dao.conn, "race_result", RaceResultDAO.RACE_RESULT_COLUMNS,
+              results, dao.CHUNK_SIZE,
+              RaceResultDAO.RACE_RESULT_KEYS if conflict else None)
+    with dao.conn.cursor() as curs:
+        curs.execute("ANALYZE race_info")
+        curs.execute("ANALYZE race_result")
+    dao.conn.commit()
+
+
+def latency(dao, sql, params_list):
+    times = []
+    with dao.conn.cursor() as curs:
+        for params in params_list:
+            start = time.perf_counter()
+            curs.execute(sql, params)
+            curs.fetchall()
+            times.append((time.perf_counter() - start) * 1000)
+    dao.conn.rollback()
+    return statistics.median(times)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--races", type=int, default=20000)
+    parser.add_argument("-r", "--repeat", type=int, default=20)
+    parser.add_argument("--dsn", default=DSN)
+    args = parser.parse_args()
+
+    infos, results = make_rows(args.races)
+    rng = random.Random(1)
+    samples = [rng.choice(results) for _ in range(args.repeat)]
+    queries = {
+        "race by race_id": (
+            "SELECT * FROM race_result WHERE race_id = %s",
+            [(row[0],) for row in samples]),
+        "horse history": (
+            "SELECT * FROM race_result WHERE horse_id = %s",
+            [(row[19],) for row in samples]),
+        "jockey, last 3 years": (
+            "SELECT * FROM race_result WHERE jockey_id = %s AND race_id >= %s",
+            [(row[20], str(FIRST_YEAR + N_YEARS - 3)) for row in samples]),
+        "trainer": (
+            "SELECT * FROM race_result WHERE trainer_id = %s",
+            [(row[21],) for row in samples]),
+        "races in a week": (
+            """SELECT r.* FROM race_info i JOIN race_result r USING (race_id)
+            WHERE i.race_date BETWEEN %s AND %s::date + 6""",
+            [(info[-1], info[-1]) for info in rng.sample(infos, args.repeat)]),
+    }
+
+    dao = RaceResultDAO(args.dsn)
+    try:
+        create_schemas(dao)
+        load(dao, "bench_flat", infos, results)
+        load(dao, "bench_keyed", infos, results, conflict=True)
+
+        print(f"{'query':<24} {'flat':>10} {'keyed':>10}")
+        for label, (sql, params_list) in queries.items():
+            medians = []
+            for schema in SCHEMAS:
+                with dao.conn.cursor() as curs:
+                    curs.execute(f"SET search_path TO {schema}")
+                medians.append(latency(dao, sql, params_list))
+            print(f"{label:<24} {medians[0]:>8.2f}ms {medians[1]:>8.2f}ms "
+                  f"x{medians[0] / medians[1]:.1f}")
+
+        # 同じデータを投入し直しても行数が変わらないこと
+        start = time.perf_counter()
+        load(dao, "bench_keyed", infos, results, conflict=True)
+        elapsed = time.perf_counter() - start
+        with dao.conn.cursor() as curs:
+            curs.execute("SELECT count(*) FROM race_result")
+            n_rows = curs.fetchone()[0]
+        dao.conn.rollback()
+        print(f"reload: {elapsed:.2f} s, race_result {n_rows} rows "
+              f"({'ok' if n_rows == len(results) else 'DUPLICATED'})")
+    finally:
+        drop_schemas(dao)
@@ -0,0 +1,110 @@
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+from selenium.common.exceptions import InvalidSessionIdException
+
+from bench.synthetic_pages import race_result_page
+from lib.metrics.metrics import get_metrics
+from lib.scraping.retry import RetryPolicy
+from lib.scraping.scraping import Downloader
+from lib.scraping.selenium_pool import SeleniumPool
+from lib.storage.page_store import FilePageStore
+
+
+# SeleniumPool のセッション数ごとのレース結果の取得速度を、読み込みに latency 秒かかる
+# 模擬のドライバで測る（Selenium サーバなしで、並行に読み込む効果だけを見る）
+# セッションが max_pages ページで作り直されること、切れたセッションに接続し直して
+# 取得を続けられることも確かめる
+#   python -m bench.bench_selenium_pool -n 48 --latency 0.2
+
+
+class FakeElement():
+    def is_displayed(self):
+        return True
+
+
+class FakeDriver():
+    # webdriver.Remote のうち Downloader が使うものだけ
+    # die_after ページ読み込んだらセッションが切れる
+    created = 0
+    lock = threading.Lock()
+
+    def __init__(self, latency, die_after=None):
+        with FakeDriver.lock:
+            FakeDriver.created += 1
+        self.latency = latency
+        self.die_after = die_after
+        self.pages = 0
+        self.url = None
+
+    def get(self, url):
+        self.pages += 1
+        if self.die_after is not None and self.pages > self.die_after:
+            raise InvalidSessionIdException("invalid session id")
+        time.sleep(self.latency * random.uniform(0.5, 1.5))
+        self.url = url
+
+    def find_element(self, by, value):
+        return FakeElement()
+
+    # page_validator の検証を通るレース結果のページ
+    @property
+    def page_source(self):
+        race_id = self.url.rsplit("=", 1)[-1]
+        return race_result_page(race_id, random.Random(race_id))
+
+    def execute_script(self, script):
+        return 64 << 20
+
+    def quit(self):
+        pass
+
+
+def run(size, race_ids, latency, max_pages=SeleniumPool.MAX_PAGES, die_after=None):
+    with tempfile.TemporaryDirectory() as root:
+        os.makedirs(f"{root}/race_result")
+        pool = SeleniumPool(None, size, max_pages=max_pages,
+                            factory=lambda: FakeDriver(latency, die_after))
+        downloader = Downloader(0, store=FilePageStore(root), rate=1000, burst=size,
+                                retry=RetryPolicy(base=0.01), selenium=pool)
+        start = time.perf_counter()
+        downloader.download_race_results(race_ids)
+        elapsed = time.perf_counter() - start
+        saved = sum(downloader.store.exists("race_result", race_id)
+                    for race_id in race_ids)
+        return elapsed, saved
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--pages", type=int, default=48)
+    parser.add_argument("--latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    race_ids = [f"2024050101{i:02d}" for i in range(args.pages)]
+    base = None
+    for size in (1, 2, 4, 8):
+        elapsed, saved = run(size, race_ids, args.latency)
+        base = base or elapsed
+        print(f"sessions {size}: {args.pages / elapsed:>6.1f} pages/s "
+              f"(x{base / elapsed:.1f}), saved {saved}")
+        assert saved == len(race_ids)
+
+    # 10 ページごとに作り直す
+    FakeDriver.created = 0
+    _, saved = run(2, race_ids, 0.001, max_pages=10)
+    print(f"recycle: {FakeDriver.created} sessions for {saved} pages")
+    assert FakeDriver.created >= len(race_ids) // 10
+
+    # 7 ページ目でセッションが切れても、接続し直して全部取得する
+    FakeDriver.created = 0
+    _, saved = run(2, race_ids, 0.001, die_after=7)
+    print(f"reconnect: {FakeDriver.created} sessions, saved {saved}")
+    assert saved == len(race_ids)
+    print({name: value for (name, labels), value in get_metrics().counters.items()
+           if name in ("selenium_sessions_recycled_total", "retries_total")})
+    print("ok")
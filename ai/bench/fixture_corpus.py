@@ -0,0 +1,156 @@
+import argparse
+import json
+import os
+import random
+import shutil
+from datetime import date, datetime
+
+from bench.synthetic_pages import (calendar_page, horse_page, ped_page,
+                                   race_list_page, race_result_page)
+from lib.scraping.html_parser import HtmlParser
+from lib.scraping.scraping import Scraper
+from lib.storage.page_store import FilePageStore
+from tools.check_parser_equivalence import as_plain
+
+
+# ベンチマーク用のページ（bench/fixtures/pages/{kind}/{key}.html、FilePageStore と同じ配置）と、
+# それぞれの解析結果（bench/fixtures/expected.json）
+# 解析結果が変わったページ（解析処理の退行）は check で分かる
+# make_corpus は固定のページに synthetic_pages で生成したページを足して件数を増やす
+#   python -m bench.fixture_corpus           # 全エンジンの解析結果が expected.json と同じか
+#   python -m bench.fixture_corpus --update  # ページと expected.json を作り直す
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+PAGES = os.path.join(FIXTURES, "pages")
+EXPECTED = os.path.join(FIXTURES, "expected.json")
+KINDS = ("race_calendar", "race_list", "race_result", "horse", "ped")
+PARSERS = (
+    HtmlParser(),
+    HtmlParser("lxml"),
+    HtmlParser("lxml", partial=True),
+)
+
+
+def parser_label(parser: HtmlParser) -> str:
+    return parser.engine + ("+partial" if parser.partial else "")
+
+
+# kind ごとのページ1枚の解析（Scraper の drivefunc）
+def parse_page(kind, store, parser, key):
+    if kind == "race_calendar":
+        return Scraper._scrape_race_calendar_drivefunc(store, parser, key)
+    if kind == "race_list":
+        return Scraper._scrape_race_list_drivefunc(
+            store, parser, datetime.strptime(key, "%Y-%m-%d"))
+    if kind == "race_result":
+        return Scraper._scrape_race_result_drivefunc(store, parser, key)
+    if kind == "horse":
+        return Scraper._scrape_horse_drivefunc(store, parser, key)
+    if kind == "ped":
+        return Scraper._scrape_ped_drivefunc(store, parser, key)
+    raise ValueError(f"unknown kind: {kind}")
+
+
+def to_json(value):
+    # expected.json と比べられる形（日付は文字列）
+    return json.loads(json.dumps(as_plain(value), ensure_ascii=False, default=str))
+
+
+# (kind, key, ページ) を返す。同じ seed なら同じページ
+def generate_pages(n_dates, seed=0, start=date(2024, 5, 4)):
+    rng = random.Random(seed)
+    kaisai_dates = [date.fromordinal(start.toordinal() + 7 * i) for i in range(n_dates)]
+    months = sorted({(d.year, d.month) for d in kaisai_dates})
+    for year, month in months:
+        yield ("race_calendar", f"{year}-{month}", calendar_page(
+            year, month, [d for d in kaisai_dates if (d.year, d.month) == (year, month)],
+            rng))
+    for i, kaisai_date in enumerate(kaisai_dates):
+        race_ids = [f"{kaisai_date.year}05{i // 8 + 1:02d}{i % 8 + 1:02d}{r:02d}"
+                    for r in range(1, 13)]
+        yield ("race_list",
+               f"{kaisai_date.year}-{kaisai_date.month}-{kaisai_date.day}",
+               race_list_page(race_ids, rng))
+        for race_id in race_ids:
+            yield "race_result", race_id, race_result_page(race_id, rng)
+    for i in range(n_dates * 12):
+        horse_id = f"2020{seed:02d}{i:04d}"
+        yield "horse", horse_id, horse_page(horse_id, rng)
+        yield "ped", horse_id, ped_page(horse_id, rng)
+
+
+def write_pages(root, pages) -> dict[str, list[str]]:
+    store = FilePageStore(root)
+    keys = {kind: [] for kind in KINDS}
+    for kind in KINDS:
+        os.makedirs(os.path.join(root, kind), exist_ok=True)
+    for kind, key, page in pages:
+        store.write(kind, key, page)
+        keys[kind].append(key)
+    return keys
+
+
+def fixture_store() -> FilePageStore:
+    return FilePageStore(PAGES)
+
+
+def fixture_keys() -> dict[str, list[str]]:
+    store = fixture_store()
+    return {kind: store.keys(kind) for kind in KINDS}
+
+
+# 固定のページと、kind ごとにおよそ scale 枚になるよう生成したページを root に置く
+def make_corpus(root, scale=0, seed=1) -> tuple[FilePageStore, dict[str, list[str]]]:
+    shutil.copytree(PAGES, root, dirs_exist_ok=True)
+    # 開催日1日あたり レース一覧1、レース結果12、馬・血統表12
+    write_pages(root, generate_pages(-(-scale // 12), seed, date(2023, 1, 7)))
+    store = FilePageStore(root)
+    return store, {kind: store.keys(kind) for kind in KINDS}
+
+
+# expected.json と違うページの [(解析器, kind, key)]
+def check(parsers=PARSERS) -> list[tuple[str, str, str]]:
+    with open(EXPECTED) as f:
+        expected = json.load(f)
+    store = fixture_store()
+    mismatches = []
+    for parser in parsers:
+        for kind, keys in fixture_keys().items():
+            for key in keys:
+                if to_json(parse_page(kind, store, parser, key)) != expected[kind][key]:
+                    mismatches.append((parser_label(parser), kind, key))
+    return mismatches
+
+
+def update(n_dates=2, seed=0) -> None:
+    shutil.rmtree(PAGES, ignore_errors=True)
+    keys = write_pages(PAGES, generate_pages(n_dates, seed))
+    # 数を絞る（レース結果・馬・血統表は開催日ごとに 3 枚）
+    for kind in ("race_result", "horse", "ped"):
+        for i, key in enumerate(keys[kind]):
+            if i % 12 >= 3:
+                os.remove(os.path.join(PAGES, kind, f"{key}.html"))
+    store = fixture_store()
+    expected = {kind: {key: to_json(parse_page(kind, store, HtmlParser(), key))
+                       for key in keys}
+                for kind, keys in fixture_keys().items()}
+    with open(EXPECTED, "w") as f:
+        json.dump(expected, f, ensure_ascii=False, indent=1, sort_keys=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--update", action="store_true",
+                        help="ページと expected.json を作り直す")
+    args = parser.parse_args()
+
+    if args.update:
+        update()
+    counts = {kind: len(keys) for kind, keys in fixture_keys().items()}
+    print(f"fixtures: {counts}")
+    mismatches = check()
+    for label, kind, key in mismatches:
+        print(f"mismatch: {label} {kind}/{key}")
+    if mismatches:
+        raise SystemExit(f"{len(mismatches)} pages differ from {EXPECTED}")
+    print("ok")
@@ -0,0 +1,263 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import tempfile
+import time
+import traceback
+import uuid
+from datetime import datetime
+
+import psycopg2
+
+from bench.fixture_corpus import (KINDS, PARSERS, make_corpus, parse_page,
+                                  parser_label)
+from lib.scraping.html_parser import HtmlParser
+from lib.scraping.pipeline import (HorsePipeline, PedigreePipeline,
+                                   RaceResultPipeline)
+from lib.scraping.race_result_batch import RaceResultBatch
+from lib.scraping.scraping import Scraper
+from lib.storage.page_store import FilePageStore
+
+
+# 解析・正規化・DB 投入の速さをまとめて測り、コミットごとに比べられる JSON に書く
+# 測る対象（ケース）は1つずつ別のプロセスで動かし、そのプロセスの最大 RSS も記録する
+#   parse/{kind}/{解析器}: ページ/秒（--repeat 回のうち最速）
+#   extract/{関数}:        解析済みのツリーから値を取り出す関数の1回あたりの時間
+#   normalize/race_result: RaceResultBatch.from_results のレース/秒
+#   load/{kind}:           --dsn の DB で、一時スキーマへの解析＋投入のページ/秒
+# ページは bench/fixtures の固定のページに、--scale 枚ずつ生成したページを足したもの
+#   python -m bench.suite -o bench_$(git rev-parse --short HEAD).json
+#   python -m bench.suite --dsn postgresql://... --compare bench_old.json
+
+LOAD_PIPELINES = {
+    "race_result": RaceResultPipeline,
+    "horse": HorsePipeline,
+    "ped": PedigreePipeline,
+}
+
+SQL_FILES = (
+    "sql/race_result/create_table.sql",
+    "sql/horse/create_table.sql",
+    "sql/crawl_state/create_table.sql",
+)
+
+# 比べた値がこれより悪くなったら退行とする
+REGRESSION = 0.10
+
+EXTRACT_PARSER = HtmlParser("lxml", partial=True)
+
+
+def _best(repeat, func):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def parse_case(root, keys, repeat, kind, parser):
+    store = FilePageStore(root)
+    elapsed = _best(repeat, lambda: [parse_page(kind, store, parser, key)
+                                     for key in keys[kind]])
+    return len(keys[kind]) / elapsed, "pages/s"
+
+
+# 取り出す関数ごとの (ページの kind, 部分解析の対象, 関数)
+EXTRACTORS = {
+    "race_info": ("race_result", Scraper.RACE_RESULT_PARTS,
+                  lambda soup, key: Scraper._get_race_info(soup)),
+    "order": ("race_result", Scraper.RACE_RESULT_PARTS,
+              lambda soup, key: Scraper._get_order(soup)),
+    "payout": ("race_result", Scraper.RACE_RESULT_PARTS,
+               lambda soup, key: Scraper._get_payout(soup)),
+    "rap_pace": ("race_result", Scraper.RACE_RESULT_PARTS,
+                 lambda soup, key: Scraper._get_rap_pace(soup)),
+    "horse_profile": ("horse", Scraper.HORSE_PARTS, Scraper._get_horse_profile),
+    "horse_history": ("horse", Scraper.HORSE_PARTS, Scraper._get_horse_history),
+    "blood_table": ("ped", Scraper.PED_PARTS, Scraper._get_blood_table),
+}
+
+
+def extract_case(root, keys, repeat, name):
+    kind, parts, extract = EXTRACTORS[name]
+    store = FilePageStore(root)
+    soups = [(EXTRACT_PARSER.parse(store.read(kind, key), parts), key)
+             for key in keys[kind]]
+    elapsed = _best(repeat, lambda: [extract(soup, key) for soup, key in soups])
+    return elapsed / len(soups) * 1e6, "us/call"
+
+
+def normalize_case(root, keys, repeat):
+    store = FilePageStore(root)
+    results = [parse_page("race_result", store, EXTRACT_PARSER, key)
+               for key in keys["race_result"]]
+    elapsed = _best(repeat, lambda: RaceResultBatch.from_results(results))
+    return len(results) / elapsed, "races/s"
+
+
+def schema_dsn(dsn, schema):
+    separator = "&" if "?" in dsn else "?"
+    return f"{dsn}{separator}options=-csearch_path%3D{schema}"
+
+
+def load_case(root, keys, repeat, kind, dsn):
+    # 一時スキーマにテーブルを作って投入し、終わったら消す
+    schema = f"bench_{uuid.uuid4().hex[:8]}"
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn.cursor() as curs:
+            curs.execute(f"CREATE SCHEMA {schema}")
+            curs.execute(f"SET search_path TO {schema}")
+            for path in SQL_FILES:
+                with open(path) as f:
+                    curs.execute(f.read())
+        conn.commit()
+
+        pipeline_class = LOAD_PIPELINES[kind]
+        pipeline = pipeline_class(
+            FilePageStore(root), EXTRACT_PARSER,
+            dao_factory=lambda: pipeline_class.DAO(schema_dsn(dsn, schema)))
+        start = time.perf_counter()
+        pipeline.run(keys[kind], total=len(keys[kind]))
+        elapsed = time.perf_counter() - start
+    finally:
+        conn.rollback()
+        with conn.cursor() as curs:
+            curs.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+        conn.commit()
+        conn.close()
+    return len(keys[kind]) / elapsed, "pages/s"
+
+
+def cases(args):
+    result = {}
+    for kind in KINDS:
+        for parser in PARSERS:
+            result[f"parse/{kind}/{parser_label(parser)}"] = (parse_case, (kind, parser))
+    for name in EXTRACTORS:
+        result[f"extract/{name}"] = (extract_case, (name,))
+    result["normalize/race_result"] = (normalize_case, ())
+    if args.dsn:
+        for kind in LOAD_PIPELINES:
+            result[f"load/{kind}"] = (load_case, (kind, args.dsn))
+    return result
+
+
+def _run_case(conn, func, root, keys, repeat, case_args):
+    try:
+        value, unit = func(root, keys, repeat, *case_args)
+        # Linux の ru_maxrss は KB。プロセスプールを使うケースは子プロセスの最大も見る
+        rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                  resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+        conn.send({"value": value, "unit": unit, "peak_rss_mb": rss / 1024})
+    except Exception:
+        conn.send({"error": traceback.format_exc()})
+    conn.close()
+
+
+# ケースを新しいプロセスで動かす（前のケースのメモリが最大 RSS に混ざらないように）
+def run_case(func, root, keys, repeat, case_args):
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_run_case,
+                              args=(sender, func, root, keys, repeat, case_args))
+    process.start()
+    sender.close()
+    result = receiver.recv()
+    process.join()
+    return result
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                                    capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        commit, dirty = None, None
+    return {
+        "commit": commit,
+        "dirty": dirty,
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def higher_is_better(unit) -> bool:
+    return unit.endswith("/s")
+
+
+# 前回の結果と比べて (ケース名, 前回, 今回, 比) を表示し、退行したケースを返す
+def compare(old, new, threshold=REGRESSION) -> list[str]:
+    regressions = []
+    print(f"\ncompare with {old['environment']['commit']}")
+    if old["settings"] != new["settings"]:
+        # ページ数などが違うと、同じケースでも値はそのまま比べられない
+        print(f"settings differ: {old['settings']} -> {new['settings']}")
+    for name, result in new["results"].items():
+        before = old["results"].get(name)
+        if "value" not in result or not before or "value" not in before:
+            continue
+        ratio = result["value"] / before["value"]
+        if not higher_is_better(result["unit"]):
+            ratio = 1 / ratio
+        status = ""
+        if ratio < 1 - threshold:
+            status = "REGRESSION"
+            regressions.append(name)
+        print(f"{name:<40} {before['value']:>10.1f} -> {result['value']:>10.1f} "
+              f"{result['unit']:<8} x{ratio:.2f} {status}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=int, default=120,
+                        help="固定のページに加えて生成する、kind ごとのおよそのページ数")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--dsn", default=None,
+                        help="指定すると一時スキーマへの投入も測る")
+    parser.add_argument("-k", "--filter", default=None,
+                        help="名前にこの文字列を含むケースだけ測る")
+    parser.add_argument("-o", "--output", default=None)
+    parser.add_argument("--compare", default=None, help="前回の結果の JSON")
+    args = parser.parse_args()
+
+    report = {"environment": environment(),
+              "settings": {"scale": args.scale, "repeat": args.repeat, "seed": args.seed},
+              "results": {}}
+    with tempfile.TemporaryDirectory() as root:
+        _, keys = make_corpus(root, args.scale, args.seed)
+        report["settings"]["pages"] = {kind: len(keys[kind]) for kind in KINDS}
+        print(f"pages: {report['settings']['pages']}")
+        for name, (func, case_args) in cases(args).items():
+            if args.filter and args.filter not in name:
+                continue
+            result = run_case(func, root, keys, args.repeat, case_args)
+            report["results"][name] = result
+            if "error" in result:
+                print(f"{name:<40} ERROR")
+                print(result["error"])
+            else:
+                print(f"{name:<40} {result['value']:>10.1f} {result['unit']:<8} "
+                      f"{result['peak_rss_mb']:>7.1f} MB")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report)
+        if regressions:
+            raise SystemExit(f"{len(regressions)} regressions")
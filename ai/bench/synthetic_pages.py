@@ -0,0 +1,222 @@
+import random
+
+
+# netkeiba のページと同じ構造の HTML を生成する（ベンチマーク用）
+# 解析に使わない部分の重さも実物に近づけるため、ノイズの要素を混ぜる
+
+
+def noise(rng: random.Random, n=200):
+    return "".join(
+        f"<div class=\"Noise\"><p>お知らせ{i} &amp; {rng.random():.6f}"
+        f" <a href=\"/news/{i}/\">詳細</a></p><script>var v{i}={i};</script></div>"
+        for i in range(n))
+
+
+def _horse_id(rng):
+    return f"{rng.randint(1990, 2022)}{rng.randint(100000, 109999)}"
+
+
+def _blood_cell(rng, rowspan, horse_id=None):
+    horse_id = horse_id or _horse_id(rng)
+    attr = f" rowspan=\"{rowspan}\"" if rowspan > 1 else ""
+    return (f"<td{attr} class=\"b_ml\"><a href=\"/horse/{horse_id}/\">"
+            f"ウマ{horse_id}</a><br>{rng.randint(1980, 2015)} 鹿毛"
+            f"<br><a href=\"/horse/sire/{horse_id}/\">産駒</a></td>")
+
+
+# generations 代の血統表（行は 2 ** generations 行）
+def blood_table(rng: random.Random, generations, css="blood_table"):
+    n_rows = 2 ** generations
+    rows = []
+    for i in range(n_rows):
+        cells = []
+        for generation in range(1, generations + 1):
+            rowspan = n_rows // 2 ** generation
+            if i % rowspan == 0:
+                cells.append(_blood_cell(rng, rowspan))
+        rows.append(f"<tr>{''.join(cells)}</tr>")
+    return f"<table class=\"{css}\" summary=\"血統表\">{''.join(rows)}</table>"
+
+
+HORSE_HISTORY_HEADERS = (
+    "日付", "開催", "天気", "R", "レース名", "映像", "頭数", "枠番", "馬番",
+    "オッズ", "人気", "着順", "騎手", "斤量", "距離", "馬場", "馬場指数",
+    "タイム", "着差", "ﾀｲﾑ指数", "通過", "ペース", "上り", "馬体重",
+    "厩舎ｺﾒﾝﾄ", "備考", "勝ち馬(2着馬)", "賞金",
+)
+
+
+def _history_row(rng, i):
+    year = 2024 - i // 8
+    month = rng.randint(1, 12)
+    day = rng.randint(1, 28)
+    race_id = f"{year}{rng.randint(1, 10):02d}{rng.randint(1, 5):02d}{rng.randint(1, 8):02d}{rng.randint(1, 12):02d}"
+    cells = (
+        f"<a href=\"/race/list/{year}{month:02d}{day:02d}/\">{year}/{month:02d}/{day:02d}</a>",
+        "<a href=\"/race/sum/05/20241124/\">5東京8</a>",
+        "晴",
+        str(rng.randint(1, 12)),
+        f"<a href=\"/race/{race_id}/\" title=\"サンプル\">サンプルステークス(G1)</a>",
+        "",
+        str(rng.randint(8, 18)),
+        str(rng.randint(1, 8)),
+        str(rng.randint(1, 18)),
+        f"{rng.uniform(1, 200):.1f}",
+        str(rng.randint(1, 18)),
+        str(rng.randint(1, 18)),
+        f"<a href=\"/jockey/result/recent/0{rng.randint(1000, 1999)}/\">騎手</a>",
+        "57",
+        f"{rng.choice('芝ダ')}{rng.choice((1200, 1600, 2000, 2400))}",
+        rng.choice(("良", "稍", "重", "不")),
+        "**",
+        f"1:{rng.randint(8, 59):02d}.{rng.randint(0, 9)}",
+        f"{rng.uniform(-1, 3):.1f}",
+        "**",
+        f"{rng.randint(1, 18)}-{rng.randint(1, 18)}",
+        f"{rng.uniform(34, 38):.1f}-{rng.uniform(33, 38):.1f}",
+        f"{rng.uniform(32, 40):.1f}",
+        f"{rng.randint(420, 540)}(+{rng.randint(0, 10)})",
+        "",
+        "",
+        "<a href=\"/horse/2019100000/\">勝ち馬</a>",
+        f"{rng.randint(0, 30000):,}.0",
+    )
+    return "<tr>" + "".join(f"<td>{c}</td>" for c in cells) + "</tr>"
+
+
+def horse_page(horse_id, rng: random.Random, n_races=None):
+    n_races = rng.randint(1, 40) if n_races is None else n_races
+    headers = "".join(f"<th>{h}</th>" for h in HORSE_HISTORY_HEADERS)
+    history = "".join(_history_row(rng, i) for i in range(n_races))
+    return f"""<!DOCTYPE html>
+<html lang="ja"><head><meta charset="EUC-JP"><title>{horse_id}</title></head><body>
+{noise(rng)}
+<div class="horse_title"><h1>ウマ{horse_id}&nbsp;</h1>
+<p class="txt_01">現役　牡{rng.randint(2, 9)}歳　鹿毛</p></div>
+<table class="db_prof_table no_OwnerUnit" summary="のプロフィール">
+<tr><th>生年月日</th><td>2019年3月23日</td></tr>
+<tr><th>調教師</th><td><a href="/trainer/01126/" title="調教師">調教師</a> (美浦)</td></tr>
+<tr><th>馬主</th><td><a href="/owner/226800/" title="馬主">馬主</a></td></tr>
+<tr><th>生産者</th><td><a href="/breeder/373126/" title="生産者">生産者</a></td></tr>
+<tr><th>産地</th><td>安平町</td></tr>
+<tr><th>セリ取引価格</th><td>-</td></tr>
+<tr><th>獲得賞金 (中央)</th><td>{rng.randint(0, 200000):,}万円</td></tr>
+<tr><th>通算成績</th><td><a href="#">{n_races}戦{n_races // 4}勝</a></td></tr>
+</table>
+{blood_table(rng, 2)}
+<table class="db_h_race_results nk_tb_common" summary="競走成績">
+<thead><tr>{headers}</tr></thead><tbody>{history}</tbody></table>
+{noise(rng)}
+</body></html>"""
+
+
+def ped_page(horse_id, rng: random.Random):
+    return f"""<!DOCTYPE html>
+<html lang="ja"><head><meta charset="EUC-JP"><title>{horse_id}</title></head><body>
+{noise(rng)}
+{blood_table(rng, 5, "blood_table detail")}
+{noise(rng)}
+</body></html>"""
+
+
+def _result_row(rng, rank, umaban, n_horses, time_sec):
+    horse_id = _horse_id(rng)
+    passage = "-".join(str(rng.randint(1, n_horses)) for _ in range(rng.choice((2, 4))))
+    return f"""<tr class="HorseList">
+<td class="Result_Num"><div class="Rank">{rank}</div></td>
+<td class="Num Waku{(umaban + 1) // 2}"><div>{(umaban + 1) // 2}</div></td>
+<td class="Num Txt_C"><div>{umaban}</div></td>
+<td class="Horse_Info"><span class="Horse_Name"><a href="https://db.netkeiba.com/horse/{horse_id}" target="_blank">ウマ{horse_id}</a></span></td>
+<td class="Horse_Info Txt_C"><span class="Lgt_Txt Txt_C">{rng.choice("牡牝セ")}{rng.randint(2, 8)}</span></td>
+<td class="Jockey_Info"><span class="JockeyWeight">{rng.choice((54, 55, 56, 57, 58))}.0</span></td>
+<td class="Jockey"><a href="https://db.netkeiba.com/jockey/result/recent/0{rng.randint(1000, 1999)}/" target="_blank">騎手</a></td>
+<td class="Time"><span class="RaceTime">{int(time_sec // 60)}:{time_sec % 60:04.1f}</span></td>
+<td class="Time"><span class="RaceTime">{"" if rank == 1 else rng.choice(("クビ", "ハナ", "1/2", "1", "1.1/2", "3"))}</span></td>
+<td class="Odds Txt_C"><span class="OddsPeople">{rng.randint(1, n_horses)}</span></td>
+<td class="Odds Txt_R"><span class="Odds_Ninki">{rng.uniform(1.1, 300):.1f}</span></td>
+<td class="Time">{rng.uniform(33, 40):.1f}</td>
+<td class="PassageRate">{passage}</td>
+<td class="Trainer"><span class="Label1">{rng.choice(("美浦", "栗東"))}</span><a href="https://db.netkeiba.com/trainer/result/recent/0{rng.randint(1000, 1999)}/" target="_blank">調教師</a></td>
+<td class="Weight">{rng.randint(420, 540)}<small>({rng.randint(-10, 10):+d})</small></td>
+</tr>"""
+
+
+def _payout_row(css, label, results, payouts, ninki):
+    if css in ("Tansho", "Fukusho"):
+        # 単勝・複勝は1頭につき div が3つ
+        cells = "".join(f"<div><span>{r}</span></div><div><span></span></div>"
+                        "<div><span></span></div>" for r in results)
+    else:
+        cells = "".join("<ul>" + "".join(f"<li><span>{n}</span></li>" for n in r.split("-"))
+                        + "</ul>" for r in results)
+    return (f"<tr class=\"{css}\"><th>{label}</th><td class=\"Result\">{cells}</td>"
+            f"<td class=\"Payout\"><span>{'<br>'.join(f'{p:,}円' for p in payouts)}</span></td>"
+            f"<td class=\"Ninki\">{''.join(f'<span>{n}人気</span>' for n in ninki)}</td></tr>")
+
+
+def race_result_page(race_id, rng: random.Random, n_horses=None):
+    n_horses = rng.randint(8, 18) if n_horses is None else n_horses
+    length = rng.choice((1200, 1400, 1600, 1800, 2000, 2400, 2500))
+    winner = length / 16.5
+    order = rng.sample(range(1, n_horses + 1), n_horses)
+    rows = "".join(_result_row(rng, rank, umaban, n_horses, winner + (rank - 1) * 0.1)
+                   for rank, umaban in enumerate(order, 1))
+    first, second, third = order[:3]
+    payout = "".join((
+        _payout_row("Tansho", "単勝", [first], [rng.randint(110, 5000)], [1]),
+        _payout_row("Fukusho", "複勝", order[:3],
+                    [rng.randint(100, 2000) for _ in range(3)], [1, 2, 3]),
+        _payout_row("Umaren", "馬連", [f"{min(first, second)}-{max(first, second)}"],
+                    [rng.randint(200, 50000)], [1]),
+        _payout_row("Tan3", "3連単", [f"{first}-{second}-{third}"],
+                    [rng.randint(1000, 900000)], [1]),
+    ))
+    n_laps = -(-length // 200)
+    headers = [length - 200 * (n_laps - 1 - i) for i in range(n_laps)]
+    laps = [round(rng.uniform(11, 13) * (h - (headers[i - 1] if i else 0)) / 200, 1)
+            for i, h in enumerate(headers)]
+    cumulative = [round(sum(laps[:i + 1]), 1) for i in range(n_laps)]
+    return f"""<!DOCTYPE html>
+<html lang="ja"><head><meta charset="UTF-8"><title>{race_id}</title></head><body>
+{noise(rng)}
+<div class="RaceList_NameBox"><div class="RaceList_Item01"><span class="RaceNum">{int(race_id[-2:])}R</span></div>
+<div class="RaceList_Item02"><h1 class="RaceName">サンプルステークス
+<span class="Icon_GradeType Icon_GradeType1"></span></h1>
+<div class="RaceData01">15:40発走 /<span> {rng.choice("芝ダ")}{length}m</span> (右 A)
+/ 天候:{rng.choice(("晴", "曇", "雨"))}<span class="Icon_Weather Weather01"></span>
+<span class="Item03">/ 馬場:{rng.choice(("良", "稍", "重", "不"))}</span></div>
+<div class="RaceData02"><span>5回</span><span>東京</span><span>8日目</span><span>サラ系３歳以上</span><span>オープン</span><span>(国際)</span><span>定量</span><span>{n_horses}頭</span><span>本賞金:3000万円</span></div></div></div>
+<table id="All_Result_Table" class="RaceTable01"><thead><tr><th>着順</th></tr></thead><tbody>{rows}</tbody></table>
+<div class="FullWrap"><table class="Payout_Detail_Table"><tbody>{payout}</tbody></table></div>
+<div class="Race_HaronTime"><table class="RaceCommon_Table"><tbody>
+<tr class="Header">{"".join(f"<th>{h}m</th>" for h in headers)}</tr>
+<tr class="HaronTime">{"".join(f"<td>{t}</td>" for t in cumulative)}</tr>
+<tr class="HaronTime">{"".join(f"<td>{t}</td>" for t in laps)}</tr>
+</tbody></table></div>
+{noise(rng)}
+</body></html>"""
+
+
+def race_list_page(race_ids, rng: random.Random):
+    items = "".join(
+        f"<li class=\"RaceList_DataItem\"><a href=\"../race/result.html?race_id={race_id}"
+        f"&rf=race_list\"><div class=\"Race_Num\">{int(race_id[-2:])}R</div></a></li>"
+        for race_id in race_ids)
+    return f"""<!DOCTYPE html>
+<html lang="ja"><head><meta charset="UTF-8"></head><body>
+{noise(rng, 50)}
+<div id="RaceTopRace"><dl class="RaceList_DataList"><dd><ul>{items}</ul></dd></dl></div>
+</body></html>"""
+
+
+# kaisai_dates: その月の開催日（datetime.date）
+def calendar_page(year, month, kaisai_dates, rng: random.Random):
+    cells = "".join(
+        f"<td class=\"RaceCellBox\"><a href=\"../top/race_list.html?kaisai_date="
+        f"{d:%Y%m%d}\"><span class=\"Day\">{d.day}</span></a></td>"
+        for d in kaisai_dates)
+    return f"""<!DOCTYPE html>
+<html lang="ja"><head><meta charset="UTF-8"><title>{year}/{month}</title></head><body>
+{noise(rng, 50)}
+<table class="Calendar_Table"><tr class="Week">{cells}<td class="RaceCellBox"></td></tr></table>
+</body></html>"""
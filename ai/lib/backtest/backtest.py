@@ -0,0 +1,182 @@
+import numpy as np
+import pandas as pd
+
+from lib.dao.race_result_dao import BET_TYPES, ORDERED_BET_TYPES
+from lib.storage.race_dataset import RaceDataset
+
+
+# 券種ごとの組み合わせの頭数と、組み合わせに使う番号の列
+BET_SIZES = {
+    "tansho": 1, "fukusho": 1, "wakuren": 2, "umaren": 2, "wide": 2,
+    "umatan": 2, "fuku3": 3, "tan3": 3,
+}
+BET_NUMBERS = {bet_type: "waku" if bet_type == "wakuren" else "umaban"
+               for bet_type in BET_TYPES}
+# 組み合わせの空き（horse_2 / horse_3 がない券種）を表す番号（馬番・枠番より大きい）
+_EMPTY = 31
+BET_COLUMNS = ["race_id", "bet_type", "horse_1", "horse_2", "horse_3"]
+
+
+def _horses(frame: pd.DataFrame) -> np.ndarray:
+    return np.stack([frame[f"horse_{i}"].to_numpy(dtype=float, na_value=np.nan)
+                     for i in (1, 2, 3)], axis=1)
+
+
+def _category(values, categories=None) -> pd.Categorical:
+    # race_id / bet_type は同じ値が多いので category 型で持つ（精算時の照合もコードで行う）
+    if categories is None:
+        return pd.Categorical(values)
+    return pd.Categorical.from_codes(values, categories=categories)
+
+
+# runs の mask の行それぞれに1点ずつ賭ける（単勝・複勝）
+#   runs: race_id と umaban の列を持つ DataFrame（race_result など）
+#   columns: 結果に残す runs の列
+def single_bets(runs: pd.DataFrame, mask, bet_type="tansho",
+                columns=()) -> pd.DataFrame:
+    selected = runs.loc[np.asarray(mask), ["race_id", "umaban", *columns]]
+    return pd.DataFrame({
+        "race_id": _category(selected["race_id"].to_numpy()),
+        "bet_type": _category(np.zeros(len(selected), dtype=int), [bet_type]),
+        "horse_1": selected["umaban"].to_numpy(dtype=float, na_value=np.nan),
+        "horse_2": np.nan,
+        "horse_3": np.nan,
+        **{column: selected[column].to_numpy() for column in columns},
+    })
+
+
+# runs の mask の行から、レースごとに bet_type の組み合わせを全部作る（ボックス買い）
+# レースごとにループするのではなく、レース順に並べた行の番号を np.repeat で組み合わせる
+#   columns: 組み合わせの各馬の値を {列名}_1.. として残す runs の列
+def combination_bets(runs: pd.DataFrame, mask, bet_type,
+                     columns=()) -> pd.DataFrame:
+    size = BET_SIZES[bet_type]
+    ordered = bet_type in ORDERED_BET_TYPES
+    number = BET_NUMBERS[bet_type]
+    selected = np.flatnonzero(np.asarray(mask))
+    races, race_ids = pd.factorize(runs["race_id"].to_numpy()[selected])
+    order = np.argsort(races, kind="stable")
+    selected, races = selected[order], races[order]
+    # 各行が属するレースの先頭の位置と頭数
+    first = np.searchsorted(races, races, side="left")
+    count = np.searchsorted(races, races, side="right") - first
+
+    legs = [np.arange(len(selected))]
+    for _ in range(1, size):
+        left = legs[-1]
+        n = count[left]
+        repeat = np.repeat(np.arange(len(left)), n)
+        right = first[left][repeat] + np.arange(len(repeat)) \
+            - np.repeat(np.cumsum(n) - n, n)
+        legs = [leg[repeat] for leg in legs]
+        # 順番のある券種は同じ馬を含まない並び、それ以外は小さい順の並びだけ残す
+        keep = np.all([right != leg for leg in legs], axis=0) if ordered \
+            else right > legs[-1]
+        legs = [leg[keep] for leg in legs] + [right[keep]]
+
+    numbers = runs[number].to_numpy(dtype=float, na_value=np.nan)[selected]
+    horses = np.full((len(legs[0]), 3), np.nan)
+    for i, leg in enumerate(legs):
+        horses[:, i] = numbers[leg]
+    if number == "waku":
+        horses[:, :size] = np.sort(horses[:, :size], axis=1)
+    bets = pd.DataFrame({
+        "race_id": _category(races[legs[0]], race_ids),
+        "bet_type": _category(np.zeros(len(horses), dtype=int), [bet_type]),
+        **{f"horse_{i + 1}": horses[:, i] for i in range(3)},
+        **{f"{column}_{i + 1}": runs[column].to_numpy()[selected][leg]
+           for column in columns for i, leg in enumerate(legs)},
+    })
+    if number == "waku":
+        # 枠連は別の馬でも同じ枠の組み合わせになるので1点にまとめる
+        bets = bets.drop_duplicates(["race_id", "horse_1", "horse_2"]) \
+            .reset_index(drop=True)
+    return bets
+
+
+class Backtest():
+    # 払い戻しの表（race_payout）を組み合わせのキーで引けるように並べておき、
+    # 賭け方の表（bets: BET_COLUMNS の列）をまとめて精算する
+    # キーは (レース, 券種, 番号1, 番号2, 番号3) を1つの整数にしたもので、
+    # 精算は searchsorted 1回（レースや賭け方ごとのループはない）
+    def __init__(self, payouts: pd.DataFrame):
+        race_ids = pd.Categorical(payouts["race_id"])
+        self.races = pd.Index(race_ids.categories.astype(str))
+        keys = self._keys(payouts)
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        self.payouts = payouts["payout"].to_numpy(
+            dtype=float, na_value=0)[order]
+
+    @classmethod
+    def from_dataset(cls, dataset: RaceDataset = None, years=None) -> "Backtest":
+        dataset = dataset or RaceDataset()
+        return cls(dataset.read("race_payout", years=years))
+
+    @classmethod
+    def _codes(cls, values, index: pd.Index) -> np.ndarray:
+        # values の各値の index での位置（ない値は -1）。重複のない値だけを照合する
+        values = values if isinstance(values, pd.Categorical) else pd.Categorical(values)
+        positions = index.get_indexer(values.categories.astype(str))
+        return np.where(values.codes < 0, -1, positions[values.codes]).astype(np.int64)
+
+    def _keys(self, frame: pd.DataFrame) -> np.ndarray:
+        races = self._codes(frame["race_id"].array, self.races)
+        types = self._codes(frame["bet_type"].array, pd.Index(BET_TYPES))
+        horses = _horses(frame)
+        numbers = np.where(np.isnan(horses), _EMPTY, horses).astype(np.int64)
+        # 順番のない券種は番号の小さい順にそろえる（空きは最後）
+        unordered = ~np.isin(types, [BET_TYPES.index(t) for t in ORDERED_BET_TYPES])
+        numbers[unordered] = np.sort(numbers[unordered], axis=1)
+        keys = races
+        keys = keys * 16 + types
+        for i in range(3):
+            keys = keys * 32 + numbers[:, i]
+        # 払い戻しの表にないレースは -1
+        return np.where((races < 0) | (types < 0), -1, keys)
+
+    # bets の各行の100円あたりの払い戻し（外れは 0、払い戻しの表にないレースは NaN）
+    def settle(self, bets: pd.DataFrame) -> np.ndarray:
+        keys = self._keys(bets)
+        index = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        hit = self.keys[index] == keys
+        return np.where(keys < 0, np.nan, np.where(hit, self.payouts[index], 0.0))
+
+    @classmethod
+    def _report(cls, n_bets, n_hits, returns, stake) -> pd.DataFrame:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return pd.DataFrame({
+                "bets": n_bets.astype(np.int64),
+                "hits": n_hits.astype(np.int64),
+                "hit_rate": n_hits / n_bets,
+                "stake": n_bets * stake,
+                "return": returns * stake / 100,
+                "roi": returns / (n_bets * 100),
+            })
+
+    # 全部の賭け方をまとめた成績（roi は 払い戻し / 賭け金）
+    def evaluate(self, bets: pd.DataFrame, stake=100) -> pd.Series:
+        payouts = self.settle(bets)
+        payouts = payouts[~np.isnan(payouts)]
+        return self._report(np.array([len(payouts)]),
+                            np.array([np.count_nonzero(payouts)]),
+                            np.array([payouts.sum()]), stake).iloc[0]
+
+    # 条件ごとの成績。masks は {条件名: bets のどの行に賭けるかの bool 配列}
+    # 条件 × 賭け方の行列と払い戻しの積で、全部の条件をまとめて集計する
+    def sweep(self, bets: pd.DataFrame, masks: dict, stake=100,
+              chunk_size=16) -> pd.DataFrame:
+        payouts = self.settle(bets)
+        valid = ~np.isnan(payouts)
+        values = np.stack([np.where(valid, payouts, 0.0),
+                           payouts > 0, valid], axis=1).astype(float)
+        labels = list(masks)
+        totals = np.empty((len(labels), 3))
+        for start in range(0, len(labels), chunk_size):
+            chunk = np.stack([np.asarray(masks[label], dtype=float)
+                              for label in labels[start:start + chunk_size]])
+            totals[start:start + len(chunk)] = chunk @ values
+        report = self._report(totals[:, 2], totals[:, 1], totals[:, 0], stake)
+        report.index = pd.Index(labels, name="condition") \
+            if not isinstance(labels[0], tuple) else pd.MultiIndex.from_tuples(labels)
+        return report
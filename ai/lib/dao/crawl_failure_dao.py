@@ -0,0 +1,85 @@
+import threading
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from lib.dao.race_result_dao import DSN
+
+
+class CrawlFailureDAO():
+    # 再試行しても取得できなかったページ（dead letter）を理由と一緒に記録する
+    # --retry-failed で、ここに残っているページだけを取得し直す
+    def __init__(self, dsn=DSN):
+        self.conn = psycopg2.connect(dsn)
+        self._lock = threading.Lock()
+
+    def __del__(self):
+        self.conn.close()
+
+    RECORD_SQL = """
+        INSERT INTO crawl_failure AS f (kind, key, url, error_class, error)
+        VALUES %s
+        ON CONFLICT (kind, key) DO UPDATE SET
+            url = EXCLUDED.url,
+            error_class = EXCLUDED.error_class,
+            error = EXCLUDED.error,
+            failures = CASE WHEN f.resolved_at IS NULL
+                            THEN f.failures + 1 ELSE 1 END,
+            last_failed_at = now(),
+            resolved_at = NULL
+        """
+
+    def record(self, kind, key, url, error_class, error) -> None:
+        self.record_many([(kind, key, url, error_class, error)])
+
+    # rows: (kind, key, url, error_class, error) のイテラブル
+    def record_many(self, rows) -> None:
+        with self._lock:
+            with self.conn.cursor() as curs:
+                execute_values(curs, self.RECORD_SQL, rows, page_size=1000)
+            self.conn.commit()
+
+    def resolve(self, kind, keys) -> int:
+        sql = """
+        UPDATE crawl_failure SET resolved_at = now()
+        WHERE kind = %s AND key = ANY(%s) AND resolved_at IS NULL
+        """
+        with self._lock:
+            with self.conn.cursor() as curs:
+                curs.execute(sql, (kind, list(keys)))
+                count = curs.rowcount
+            self.conn.commit()
+        return count
+
+    # まだ取得できていない (kind, key)。kinds・error_classes で絞れる
+    def unresolved(self, kinds=None, error_classes=None) -> list[tuple[str, str]]:
+        sql = """
+        SELECT kind, key FROM crawl_failure
+        WHERE resolved_at IS NULL
+          AND (%s::text[] IS NULL OR kind = ANY(%s::text[]))
+          AND (%s::text[] IS NULL OR error_class = ANY(%s::text[]))
+        ORDER BY kind, key
+        """
+        kinds = list(kinds) if kinds else None
+        error_classes = list(error_classes) if error_classes else None
+        with self._lock:
+            with self.conn.cursor() as curs:
+                curs.execute(sql, (kinds, kinds, error_classes, error_classes))
+                rows = curs.fetchall()
+            self.conn.commit()
+        return rows
+
+    # 種類・理由ごとの件数
+    def summary(self) -> list[tuple[str, str, int]]:
+        sql = """
+        SELECT kind, error_class, count(*) FROM crawl_failure
+        WHERE resolved_at IS NULL
+        GROUP BY kind, error_class
+        ORDER BY kind, error_class
+        """
+        with self._lock:
+            with self.conn.cursor() as curs:
+                curs.execute(sql)
+                rows = curs.fetchall()
+            self.conn.commit()
+        return rows
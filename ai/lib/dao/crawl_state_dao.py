@@ -0,0 +1,154 @@
+import hashlib
+import threading
+from datetime import datetime, timezone
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from lib.dao.race_result_dao import DSN
+
+
+class CrawlStateDAO():
+    # ページ（kind, key）ごとに取得・解析・投入した日時と内容のハッシュを記録する
+    # 差分更新（--incremental）で、新しいもの・変わったものだけを処理するのに使う
+    # 記録はバッファに溜め、FLUSH_SIZE 件ごとまたは flush() でまとめて書き込む
+    FLUSH_SIZE = 1000
+
+    def __init__(self, dsn=DSN):
+        self.conn = psycopg2.connect(dsn)
+        self._buffer: dict[tuple[str, str], dict] = {}
+        self._lock = threading.Lock()
+
+    def __del__(self):
+        self.conn.close()
+
+    def _record(self, kind, key, **fields):
+        with self._lock:
+            self._buffer.setdefault((kind, key), {}).update(fields)
+            full = len(self._buffer) >= self.FLUSH_SIZE
+        if full:
+            self.flush()
+
+    def record_fetched(self, kind, key, source) -> None:
+        content_hash = hashlib.sha1(source.encode("utf-8")).hexdigest()
+        self._record(kind, key, content_hash=content_hash,
+                     fetched_at=datetime.now(timezone.utc))
+
+    def record_discovered(self, kind, key, entity_date) -> None:
+        self._record(kind, key, entity_date=entity_date)
+
+    def record_parsed(self, kind, key) -> None:
+        self._record(kind, key, parsed_at=datetime.now(timezone.utc))
+
+    def record_loaded(self, kind, key) -> None:
+        self._record(kind, key, loaded_at=datetime.now(timezone.utc))
+
+    def flush(self) -> None:
+        with self._lock:
+            buffer, self._buffer = self._buffer, {}
+        if not buffer:
+            return
+
+        # 値が None の列は既存の値を残す
+        # 取得したページのハッシュが前回と違うときだけ changed_at を進める
+        sql = """
+        INSERT INTO crawl_state AS s (
+            kind, key, entity_date, content_hash, fetched_at, changed_at,
+            parsed_at, loaded_at
+        ) VALUES %s
+        ON CONFLICT (kind, key) DO UPDATE SET
+            entity_date = COALESCE(EXCLUDED.entity_date, s.entity_date),
+            content_hash = COALESCE(EXCLUDED.content_hash, s.content_hash),
+            fetched_at = COALESCE(EXCLUDED.fetched_at, s.fetched_at),
+            changed_at = CASE
+                WHEN EXCLUDED.content_hash IS NOT NULL
+                     AND EXCLUDED.content_hash IS DISTINCT FROM s.content_hash
+                THEN EXCLUDED.fetched_at
+                ELSE s.changed_at
+            END,
+            parsed_at = COALESCE(EXCLUDED.parsed_at, s.parsed_at),
+            loaded_at = COALESCE(EXCLUDED.loaded_at, s.loaded_at)
+        """
+        values = [(
+            kind,
+            key,
+            fields.get("entity_date"),
+            fields.get("content_hash"),
+            fields.get("fetched_at"),
+            fields.get("fetched_at"),
+            fields.get("parsed_at"),
+            fields.get("loaded_at"),
+        ) for (kind, key), fields in buffer.items()]
+        with self.conn.cursor() as curs:
+            execute_values(curs, sql, values, page_size=1000)
+        self.conn.commit()
+
+    # 最後に取得した日時（記録がなければ None）
+    def fetched_at(self, kind, key):
+        return self.fetched_at_many(kind, [key]).get(key)
+
+    # keys の最後に取得した日時を1回の問い合わせでまとめて返す（記録のない key は含まない）
+    def fetched_at_many(self, kind, keys) -> dict:
+        sql = """
+        SELECT key, fetched_at FROM crawl_state
+        WHERE kind = %s AND key = ANY(%s) AND fetched_at IS NOT NULL
+        """
+        with self.conn.cursor() as curs:
+            curs.execute(sql, (kind, list(keys)))
+            rows = curs.fetchall()
+        # 読み取りだけのトランザクションを開いたままにしない
+        self.conn.commit()
+        result = dict(rows)
+        # まだ書き込んでいない記録を優先する
+        with self._lock:
+            for key in keys:
+                fields = self._buffer.get((kind, key), {})
+                if fields.get("fetched_at"):
+                    result[key] = fields["fetched_at"]
+        return result
+
+    # 対象日から settle_interval 以上経ってから取得し、その内容を解析済みのもの
+    # （もう変わらないので取得・解析し直す必要がない）
+    def settled_keys(self, kind, settle_interval) -> set[str]:
+        sql = """
+        SELECT key FROM crawl_state
+        WHERE kind = %s
+          AND parsed_at >= changed_at
+          AND fetched_at >= entity_date + %s::interval
+        """
+        with self.conn.cursor() as curs:
+            curs.execute(sql, (kind, settle_interval))
+            rows = curs.fetchall()
+        self.conn.commit()
+        return {row[0] for row in rows}
+
+    # 期間内でまだ確定していないものの (key, entity_date)
+    def unsettled_keys(self, kind, settle_interval, start, end) -> list[tuple]:
+        sql = """
+        SELECT key, entity_date FROM crawl_state
+        WHERE kind = %s
+          AND entity_date BETWEEN %s AND %s
+          AND NOT COALESCE(parsed_at >= changed_at
+                           AND fetched_at >= entity_date + %s::interval, false)
+        ORDER BY entity_date, key
+        """
+        with self.conn.cursor() as curs:
+            curs.execute(sql, (kind, start, end, settle_interval))
+            rows = curs.fetchall()
+        self.conn.commit()
+        return rows
+
+    # 期間内でまだ DB に投入していないもの
+    def unloaded_keys(self, kind, start, end) -> list[str]:
+        sql = """
+        SELECT key FROM crawl_state
+        WHERE kind = %s
+          AND entity_date BETWEEN %s AND %s
+          AND (loaded_at IS NULL OR loaded_at < changed_at)
+        ORDER BY key
+        """
+        with self.conn.cursor() as curs:
+            curs.execute(sql, (kind, start, end))
+            rows = curs.fetchall()
+        self.conn.commit()
+        return [row[0] for row in rows]
@@ -0,0 +1,165 @@
+import psycopg2
+from psycopg2.extras import execute_values
+
+from lib.dao.race_result_dao import DSN
+
+
+class CrawlTaskDAO():
+    # 複数ワーカーで取得対象を分け合うためのキュー（crawl_task テーブル）
+    # 取得中のタスクにはリース期限を付け、期限切れのものは再び取得対象になる
+    # 失敗したタスクは RETRY_DELAY 経ってから、確保した回数が MAX_ATTEMPTS に
+    # 達するまで再び取得対象になる（それ以降は status = 'pending' に戻すまで残る）
+    MAX_ATTEMPTS = 3
+    RETRY_DELAY = "1 hour"
+
+    def __init__(self, dsn=DSN):
+        self.conn = psycopg2.connect(dsn)
+
+    def __del__(self):
+        self.conn.close()
+
+    def enqueue(self, kind, keys) -> None:
+        sql = """
+        INSERT INTO crawl_task (kind, key) VALUES %s
+        ON CONFLICT (kind, key) DO NOTHING
+        """
+        with self.conn.cursor() as curs:
+            execute_values(curs, sql, ((kind, key) for key in keys),
+                           page_size=1000)
+        self.conn.commit()
+
+    # race_result に出てくる馬をサーバ側で直接キューに積む
+    # kinds に複数の kind（horse と ped など）を渡すと、馬の列挙は1回で済む
+    # 積み済みの馬は先に除くので、2回目以降はほとんど書き込まない
+    def enqueue_horse_ids(self, kinds) -> int:
+        if isinstance(kinds, str):
+            kinds = (kinds,)
+        sql = """
+        INSERT INTO crawl_task (kind, key)
+        SELECT k.kind, h.horse_id
+        FROM (
+            SELECT DISTINCT horse_id FROM race_result
+            WHERE horse_id IS NOT NULL
+        ) h
+        CROSS JOIN unnest(%s::text[]) k(kind)
+        WHERE NOT EXISTS (
+            SELECT 1 FROM crawl_task t
+            WHERE t.kind = k.kind AND t.key = h.horse_id
+        )
+        ON CONFLICT (kind, key) DO NOTHING
+        """
+        with self.conn.cursor() as curs:
+            curs.execute(sql, (list(kinds),))
+            count = curs.rowcount
+        self.conn.commit()
+        return count
+
+    # 前回取得した日以降のレースに出走した馬を、取得済みでもキューに戻す
+    # （前回の取得日は crawl_state、なければ crawl_task の完了日時）
+    # 戻したタスクには refetch を立て、保存済みのページがあっても取り直させる
+    def requeue_raced_horses(self, kind) -> int:
+        sql = """
+        UPDATE crawl_task t SET status = 'pending', lease_until = NULL,
+            refetch = true, updated_at = now()
+        FROM (
+            SELECT DISTINCT r.horse_id
+            FROM race_result r
+            JOIN crawl_state race
+              ON race.kind = 'race_result' AND race.key = r.race_id
+            JOIN crawl_task done
+              ON done.kind = %s AND done.key = r.horse_id
+             AND done.status = 'done'
+            LEFT JOIN crawl_state horse
+              ON horse.kind = %s AND horse.key = r.horse_id
+            WHERE race.entity_date >=
+                  COALESCE(horse.fetched_at, done.updated_at)::date
+        ) raced
+        WHERE t.kind = %s AND t.key = raced.horse_id
+        """
+        with self.conn.cursor() as curs:
+            curs.execute(sql, (kind, kind, kind))
+            count = curs.rowcount
+        self.conn.commit()
+        return count
+
+    # 未着手・リース切れ・再試行できる失敗のタスクを最大 limit 件確保する
+    # SKIP LOCKED により、他のワーカーが確保中の行は待たずに読み飛ばす
+    # (key, refetch) のリストを返す
+    def claim(self, kind, worker, limit, lease_seconds,
+              max_attempts=MAX_ATTEMPTS, retry_delay=RETRY_DELAY
+              ) -> list[tuple[str, bool]]:
+        sql = """
+        UPDATE crawl_task t SET
+            status = 'running',
+            worker = %s,
+            lease_until = now() + %s * interval '1 second',
+            attempts = t.attempts + 1,
+            updated_at = now()
+        FROM (
+            SELECT kind, key FROM crawl_task
+            WHERE kind = %s
+              AND (status = 'pending'
+                   OR (status = 'running' AND lease_until < now())
+                   OR (status = 'failed' AND attempts < %s
+                       AND updated_at < now() - %s::interval))
+            ORDER BY key
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        ) c
+        WHERE t.kind = c.kind AND t.key = c.key
+        RETURNING t.key, t.refetch
+        """
+        with self.conn.cursor() as curs:
+            curs.execute(sql, (worker, lease_seconds, kind, max_attempts,
+                               retry_delay, limit))
+            rows = curs.fetchall()
+        self.conn.commit()
+        return [(key, refetch) for key, refetch in rows]
+
+    # このプロセスが確保中の keys のリースを延長する
+    # （同じ名前で再起動したワーカーが、落ちたプロセスのタスクを延長し続けないよう
+    #   worker だけでなく key も指定する）
+    def heartbeat(self, kind, worker, keys, lease_seconds) -> int:
+        sql = """
+        UPDATE crawl_task SET
+            lease_until = now() + %s * interval '1 second',
+            updated_at = now()
+        WHERE kind = %s AND worker = %s AND key = ANY(%s)
+          AND status = 'running'
+        """
+        with self.conn.cursor() as curs:
+            curs.execute(sql, (lease_seconds, kind, worker, list(keys)))
+            count = curs.rowcount
+        self.conn.commit()
+        return count
+
+    def complete(self, kind, worker, keys) -> None:
+        sql = """
+        UPDATE crawl_task SET status = 'done', lease_until = NULL,
+            last_error = NULL, refetch = false, updated_at = now()
+        WHERE kind = %s AND worker = %s AND key = ANY(%s)
+        """
+        with self.conn.cursor() as curs:
+            curs.execute(sql, (kind, worker, list(keys)))
+        self.conn.commit()
+
+    def fail(self, kind, worker, keys, error=None) -> None:
+        sql = """
+        UPDATE crawl_task SET status = 'failed', lease_until = NULL,
+            last_error = %s, updated_at = now()
+        WHERE kind = %s AND worker = %s AND key = ANY(%s)
+        """
+        with self.conn.cursor() as curs:
+            curs.execute(sql, (error, kind, worker, list(keys)))
+        self.conn.commit()
+
+    def count_remaining(self, kind) -> int:
+        sql = """
+        SELECT count(*) FROM crawl_task
+        WHERE kind = %s AND status IN ('pending', 'running')
+        """
+        with self.conn.cursor() as curs:
+            curs.execute(sql, (kind,))
+            count = curs.fetchone()[0]
+        self.conn.commit()
+        return count
@@ -0,0 +1,289 @@
+import re
+from datetime import date
+from typing import Iterable, Iterator
+
+import psycopg2
+
+from lib.dao.race_result_dao import (DSN, _cursor_ids, _Record, _to_float,
+                                    _to_int, copy_rows)
+
+
+def _to_date(val):
+    # 2019年3月23日 / 2024/11/24
+    if not val:
+        return None
+    match = re.search(r"(\d{4})[年/](\d{1,2})[月/](\d{1,2})", val)
+    if not match:
+        return None
+    try:
+        return date(*map(int, match.groups()))
+    except ValueError:
+        return None
+
+
+class Horse(_Record):
+    __slots__ = (
+        "horse_id", "name", "status", "sex", "coat_color", "birthday",
+        "trainer_id", "trainer_name", "owner_id", "owner_name", "breeder_id",
+        "breeder_name", "birthplace", "sale_price", "prize_total", "record",
+        "sire_id", "dam_id", "damsire_id",
+    )
+
+    def __init__(self):
+        self.horse_id = None
+        self.name = None
+        self.status = None
+        self.sex = None
+        self.coat_color = None
+        self.birthday = None
+        self.trainer_id = None
+        self.trainer_name = None
+        self.owner_id = None
+        self.owner_name = None
+        self.breeder_id = None
+        self.breeder_name = None
+        self.birthplace = None
+        self.sale_price = None
+        self.prize_total = None
+        self.record = None
+        self.sire_id = None
+        self.dam_id = None
+        self.damsire_id = None
+
+
+class HorseHistory_Row(_Record):
+    __slots__ = (
+        "horse_id", "race_id", "date", "kaisai", "weather", "race_no",
+        "race_name", "field_size", "waku", "umaban", "odds", "popular", "rank",
+        "jockey_id", "jockey_name", "jockey_weight", "course", "state", "time",
+        "chakusa", "passage_rate", "pace", "agari", "horse_weight", "prize",
+    )
+
+    def __init__(self):
+        self.horse_id = None
+        self.race_id = None
+        self.date = None
+        self.kaisai = None
+        self.weather = None
+        self.race_no = None
+        self.race_name = None
+        self.field_size = None
+        self.waku = None
+        self.umaban = None
+        self.odds = None
+        self.popular = None
+        self.rank = None
+        self.jockey_id = None
+        self.jockey_name = None
+        self.jockey_weight = None
+        self.course = None
+        self.state = None
+        self.time = None
+        self.chakusa = None
+        self.passage_rate = None
+        self.pace = None
+        self.agari = None
+        self.horse_weight = None
+        self.prize = None
+
+
+class Pedigree_Row(_Record):
+    __slots__ = (
+        "horse_id", "position", "generation", "ancestor_id", "ancestor_name",
+    )
+
+    def __init__(self):
+        self.horse_id = None
+        self.position = None
+        self.generation = None
+        self.ancestor_id = None
+        self.ancestor_name = None
+
+
+class HorseDAO():
+    CHUNK_SIZE = 5000
+    # サーバ側カーソルから1回に受け取る行数
+    ITERSIZE = 10000
+
+    HORSE_COLUMNS = (
+        "horse_id", "name", "status", "sex", "coat_color", "birthday",
+        "trainer_id", "trainer_name", "owner_id", "owner_name", "breeder_id",
+        "breeder_name", "birthplace", "sale_price", "prize_total", "record",
+        "sire_id", "dam_id", "damsire_id",
+    )
+    HORSE_HISTORY_COLUMNS = (
+        "horse_id", "race_id", "date", "kaisai", "weather", "race_no",
+        "race_name", "field_size", "waku", "umaban", "odds", "popular", "rank",
+        "jockey_id", "jockey_name", "jockey_weight", "course", "state", "time",
+        "chakusa", "passage_rate", "pace", "agari", "horse_weight", "prize",
+    )
+    PEDIGREE_COLUMNS = (
+        "horse_id", "position", "generation", "ancestor_id", "ancestor_name",
+    )
+    PEDIGREE_CLOSURE_COLUMNS = (
+        "horse_id", "ancestor_id", "generation", "n_paths",
+    )
+
+    def __init__(self, dsn=DSN):
+        self.conn = psycopg2.connect(dsn)
+
+    def __del__(self):
+        self.conn.close()
+
+    @classmethod
+    def _horse_values(cls, horse: Horse) -> tuple:
+        return (
+            horse.horse_id,
+            horse.name,
+            horse.status,
+            horse.sex,
+            horse.coat_color,
+            _to_date(horse.birthday),
+            horse.trainer_id,
+            horse.trainer_name,
+            horse.owner_id,
+            horse.owner_name,
+            horse.breeder_id,
+            horse.breeder_name,
+            horse.birthplace,
+            horse.sale_price,
+            horse.prize_total,
+            horse.record,
+            horse.sire_id,
+            horse.dam_id,
+            horse.damsire_id,
+        )
+
+    @classmethod
+    def _horse_history_values(cls, row: HorseHistory_Row) -> tuple:
+        return (
+            row.horse_id,
+            row.race_id,
+            _to_date(row.date),
+            row.kaisai,
+            row.weather,
+            _to_int(row.race_no),
+            row.race_name,
+            _to_int(row.field_size),
+            _to_int(row.waku),
+            _to_int(row.umaban),
+            _to_float(row.odds),
+            _to_int(row.popular),
+            _to_int(row.rank),
+            row.jockey_id,
+            row.jockey_name,
+            _to_float(row.jockey_weight),
+            row.course,
+            row.state,
+            row.time,
+            row.chakusa,
+            row.passage_rate,
+            row.pace,
+            _to_float(row.agari),
+            row.horse_weight,
+            _to_float(row.prize.replace(",", "") if row.prize else None),
+        )
+
+    @classmethod
+    def _pedigree_values(cls, row: Pedigree_Row) -> tuple:
+        return (
+            row.horse_id,
+            row.position,
+            row.generation,
+            row.ancestor_id,
+            row.ancestor_name,
+        )
+
+    # 取り直した馬のページを投入し直せるよう、主キーが同じ行は上書きする
+    def insert_horse_tuples(self, values: Iterable[tuple],
+                            chunk_size=CHUNK_SIZE) -> int:
+        return copy_rows(self.conn, "horse", self.HORSE_COLUMNS, values,
+                         chunk_size, ("horse_id",))
+
+    def insert_horse_history_tuples(self, values: Iterable[tuple],
+                                    chunk_size=CHUNK_SIZE) -> int:
+        return copy_rows(self.conn, "horse_history",
+                         self.HORSE_HISTORY_COLUMNS, values, chunk_size,
+                         ("horse_id", "race_id"))
+
+    def insert_pedigree_tuples(self, values: Iterable[tuple],
+                               chunk_size=CHUNK_SIZE) -> int:
+        return copy_rows(self.conn, "pedigree", self.PEDIGREE_COLUMNS, values,
+                         chunk_size, ("horse_id", "position"))
+
+    def insert_horses(self, horses: Iterable[Horse],
+                      chunk_size=CHUNK_SIZE) -> int:
+        return self.insert_horse_tuples(
+            (self._horse_values(horse) for horse in horses), chunk_size)
+
+    def insert_horse_histories(self, rows: Iterable[HorseHistory_Row],
+                               chunk_size=CHUNK_SIZE) -> int:
+        return self.insert_horse_history_tuples(
+            (self._horse_history_values(row) for row in rows), chunk_size)
+
+    def insert_pedigrees(self, rows: Iterable[Pedigree_Row],
+                         chunk_size=CHUNK_SIZE) -> int:
+        return self.insert_pedigree_tuples(
+            (self._pedigree_values(row) for row in rows), chunk_size)
+
+    # PedigreeGraph.closure_tuples の結果を投入する（同じ馬と祖先の組は上書き）
+    def insert_pedigree_closure_tuples(self, values: Iterable[tuple],
+                                       chunk_size=CHUNK_SIZE) -> int:
+        return copy_rows(self.conn, "pedigree_closure",
+                         self.PEDIGREE_CLOSURE_COLUMNS, values, chunk_size,
+                         ("horse_id", "ancestor_id"))
+
+    # 血統の (子, 父母の別 's' / 'd', 親) の組を返す
+    #   pedigree: 位置 "sd" の親は、同じ血統表の位置 "s" の馬（1文字の位置は血統表の馬自身）
+    #   horse:    馬のページの父・母
+    # 同じ組が何度も出てくる（重複は PedigreeGraph.from_edges でまとめる）
+    def iter_parent_edges(self, itersize=ITERSIZE) -> Iterator[tuple[str, str, str]]:
+        sql = """
+        SELECT coalesce(c.ancestor_id, p.horse_id), right(p.position, 1),
+               p.ancestor_id
+        FROM pedigree p
+        LEFT JOIN pedigree c
+          ON c.horse_id = p.horse_id AND c.position = left(p.position, -1)
+        WHERE p.ancestor_id IS NOT NULL
+          AND (length(p.position) = 1 OR c.ancestor_id IS NOT NULL)
+        UNION ALL
+        SELECT horse_id, 's', sire_id FROM horse WHERE sire_id IS NOT NULL
+        UNION ALL
+        SELECT horse_id, 'd', dam_id FROM horse WHERE dam_id IS NOT NULL
+        """
+        try:
+            with self.conn.cursor(f"parent_edges_{next(_cursor_ids)}") as curs:
+                curs.itersize = itersize
+                curs.execute(sql)
+                yield from curs
+        finally:
+            # 名前付きカーソルのためのトランザクションを閉じる
+            self.conn.rollback()
+
+    # ancestor_id の子孫の (horse_id, 世代) を返す（pedigree_closure から引く）
+    def get_descendants(self, ancestor_id, max_generation=None) -> list[tuple]:
+        sql = """
+        SELECT horse_id, generation FROM pedigree_closure
+        WHERE ancestor_id = %s AND generation <= coalesce(%s, generation)
+        ORDER BY generation, horse_id
+        """
+        with self.conn.cursor() as curs:
+            curs.execute(sql, (ancestor_id, max_generation))
+            rows = curs.fetchall()
+        self.conn.commit()
+        return rows
+
+    # 2頭に共通する祖先の (ancestor_id, 1頭目からの世代, 2頭目からの世代) を返す
+    def get_common_ancestors(self, horse_id_1, horse_id_2) -> list[tuple]:
+        sql = """
+        SELECT a.ancestor_id, a.generation, b.generation
+        FROM pedigree_closure a
+        JOIN pedigree_closure b ON b.ancestor_id = a.ancestor_id
+        WHERE a.horse_id = %s AND b.horse_id = %s
+        ORDER BY a.generation + b.generation, a.ancestor_id
+        """
+        with self.conn.cursor() as curs:
+            curs.execute(sql, (horse_id_1, horse_id_2))
+            rows = curs.fetchall()
+        self.conn.commit()
+        return rows
@@ -0,0 +1,267 @@
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from lib.storage.race_dataset import DatasetTable, RaceDataset
+
+
+# 馬・騎手・調教師の過去の成績から、出走馬ごとの特徴量を求める
+# どの特徴量もそのレースの開催日より前のレースだけから求める（同じ日のレースも使わない）
+#   馬:         直近の着順、スピード（距離 / タイム）、勝ち馬とのタイム差、上がりの順位、
+#               通算・芝ダ別・距離別・馬場状態別の勝率
+#   騎手・調教師: 直近 FORM_DAYS 日の騎乗（出走）数・勝率・複勝率
+# 全件をまとめて NumPy の累積和で求めるので、馬や騎手ごとの Python のループはない
+
+# 距離の区分（この距離以下）
+DISTANCE_BANDS = (1400, 1800, 2200)
+RECENT = 5
+FORM_DAYS = 365
+
+HORSE_FEATURES = (
+    "horse_starts", "horse_win_rate", "horse_top3_rate",
+    "horse_rank_1", "horse_rank_2", "horse_rank_3", f"horse_rank_mean_{RECENT}",
+    f"horse_speed_mean_{RECENT}", "horse_speed_best",
+    f"horse_time_behind_mean_{RECENT}", f"horse_agari_mean_{RECENT}",
+    f"horse_agari_rank_mean_{RECENT}", "horse_days_since_last",
+    "horse_kind_starts", "horse_kind_win_rate",
+    "horse_distance_starts", "horse_distance_win_rate",
+    "horse_state_starts", "horse_state_win_rate",
+)
+PERSON_FEATURES = tuple(
+    f"{person}_{name}_{FORM_DAYS}"
+    for person in ("jockey", "trainer")
+    for name in ("starts", "win_rate", "top3_rate"))
+
+FEATURES = DatasetTable(
+    name="features",
+    query=None,
+    date_column="race_date",
+    keys=("race_id", "umaban"),
+    schema=pa.schema([
+        ("race_id", pa.string()),
+        ("umaban", pa.int8()),
+        ("race_date", pa.date32()),
+        ("horse_id", pa.string()),
+        *[(name, pa.float64()) for name in HORSE_FEATURES + PERSON_FEATURES],
+    ]),
+)
+
+
+def _group_starts(codes: np.ndarray) -> np.ndarray:
+    # 並べ替え済みの codes について、各行が属するグループの先頭の位置
+    new = np.ones(len(codes), dtype=bool)
+    new[1:] = codes[1:] != codes[:-1]
+    return np.maximum.accumulate(np.where(new, np.arange(len(codes)), 0))
+
+
+def _prior_sums(values: np.ndarray, lo: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # 各行 i について、values[lo[i]:i] の (合計, 欠損でない件数)
+    ok = ~np.isnan(values)
+    sums = np.concatenate(([0.0], np.cumsum(np.where(ok, values, 0.0))))
+    counts = np.concatenate(([0], np.cumsum(ok)))
+    i = np.arange(len(values))
+    return sums[i] - sums[lo], counts[i] - counts[lo]
+
+
+def _ratio(sums, counts):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+class _AsOf():
+    # key ごとに開催日の順に並べた状態で、各行より前の行の集計を求める
+    def __init__(self, keys: list[np.ndarray], days: np.ndarray):
+        codes = np.zeros(len(days), dtype=np.int64)
+        for key in keys:
+            key_codes = pd.factorize(key)[0]
+            codes = codes * (key_codes.max(initial=0) + 2) + key_codes + 1
+        self.order = np.lexsort((days, codes))
+        self.starts = _group_starts(codes[self.order])
+
+    def _restore(self, values):
+        restored = np.empty_like(values)
+        restored[self.order] = values
+        return restored
+
+    def _shift(self, sorted_values, k):
+        i = np.arange(len(self.starts)) - k
+        ok = i >= self.starts
+        return self._restore(np.where(ok, sorted_values[np.maximum(i, 0)], np.nan))
+
+    # 直前までの (合計, 件数)。window を指定すると直近 window 行だけ
+    def sums(self, values, window=None):
+        lo = self.starts if window is None else \
+            np.maximum(self.starts, np.arange(len(self.starts)) - window)
+        sums, counts = _prior_sums(values[self.order], lo)
+        return self._restore(sums), self._restore(counts)
+
+    def mean(self, values, window=None):
+        return _ratio(*self.sums(values, window))
+
+    # k 行前の値
+    def previous(self, values, k=1):
+        return self._shift(values[self.order], k)
+
+    # 直前までの最大値
+    def best(self, values):
+        best = pd.Series(values[self.order]).groupby(self.starts).cummax() \
+            .groupby(self.starts).ffill()
+        return self._shift(best.to_numpy(dtype=float), 1)
+
+
+def _form(codes: np.ndarray, days: np.ndarray, values: dict[str, np.ndarray],
+          window_days: int) -> dict[str, np.ndarray]:
+    # key ごとの、開催日の前日までの window_days 日間の合計（同じ日の他のレースは含めない）
+    daily = pd.DataFrame({"code": codes, "day": days, **values}) \
+        .groupby(["code", "day"], sort=True).sum()
+    daily_codes = daily.index.get_level_values("code").to_numpy()
+    daily_days = daily.index.get_level_values("day").to_numpy()
+    key = daily_codes.astype(np.int64) * (1 << 24) + daily_days
+    lo = np.maximum(np.searchsorted(key, key - window_days, side="left"),
+                    _group_starts(daily_codes))
+    index = np.searchsorted(key, codes.astype(np.int64) * (1 << 24) + days)
+    return {name: _prior_sums(daily[name].to_numpy(dtype=float), lo)[0][index]
+            for name in values}
+
+
+class FeatureStore():
+    # 特徴量を race_id ごとに Parquet（{root}/features/year=YYYY/）に保存しておく
+    # update() は RaceDataset にあって保存されていないレースだけを求めて書き足す
+    # その際に読むのは、対象の馬の過去のレースと、騎手・調教師の FORM_DAYS 日分のレースだけ
+    ROOT = "data/features"
+    RUN_COLUMNS = ["race_id", "umaban", "race_date", "horse_id", "jockey_id",
+                   "trainer_id", "rank", "time_sec", "agari"]
+    RACE_COLUMNS = ["race_id", "kind", "length", "state"]
+
+    def __init__(self, dataset: RaceDataset = None, root=ROOT):
+        self.dataset = dataset or RaceDataset()
+        self.store = RaceDataset(root, {FEATURES.name: FEATURES})
+
+    # race_result に race_info のコースの条件を付けたもの（開催日のないレースは除く）
+    def load_runs(self, filter=None) -> pd.DataFrame:
+        runs = self.dataset.read("race_result", columns=self.RUN_COLUMNS,
+                                 filter=filter)
+        races = self.dataset.read("race_info", columns=self.RACE_COLUMNS)
+        runs = runs.merge(races, on="race_id", how="left")
+        return runs[runs["race_date"].notna()].reset_index(drop=True)
+
+    # runs の各行（targets を指定するとその行だけ）の特徴量
+    # runs には対象の行より前の、関係する馬・騎手・調教師のレースが含まれていること
+    @classmethod
+    def compute(cls, runs: pd.DataFrame, targets=None) -> pd.DataFrame:
+        days = runs["race_date"].to_numpy(dtype="datetime64[D]").astype(np.int64)
+        rank = runs["rank"].to_numpy(dtype=float, na_value=np.nan)
+        time_sec = runs["time_sec"].to_numpy(dtype=float, na_value=np.nan)
+        agari = runs["agari"].to_numpy(dtype=float, na_value=np.nan)
+        length = runs["length"].to_numpy(dtype=float, na_value=np.nan)
+        finished = ~np.isnan(rank)
+        win = np.where(finished, rank == 1, np.nan)
+        top3 = np.where(finished, rank <= 3, np.nan)
+
+        # レース内での値（そのレースの後に使うので、レース全体を使ってよい）
+        by_race = pd.DataFrame({"race_id": runs["race_id"].to_numpy(),
+                                "time_sec": time_sec, "agari": agari}) \
+            .groupby("race_id", sort=False)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            speed = length / time_sec
+        time_behind = time_sec - by_race["time_sec"].transform("min").to_numpy()
+        agari_rank = by_race["agari"].rank(method="min").to_numpy(dtype=float)
+
+        features = {}
+        horse_id = runs["horse_id"].to_numpy(dtype=object)
+        horse = _AsOf([horse_id], days)
+        wins, starts = horse.sums(win)
+        features["horse_starts"] = horse.sums(np.ones(len(runs)))[0]
+        features["horse_win_rate"] = _ratio(wins, starts)
+        features["horse_top3_rate"] = horse.mean(top3)
+        for k in (1, 2, 3):
+            features[f"horse_rank_{k}"] = horse.previous(rank, k)
+        features[f"horse_rank_mean_{RECENT}"] = horse.mean(rank, RECENT)
+        features[f"horse_speed_mean_{RECENT}"] = horse.mean(speed, RECENT)
+        features["horse_speed_best"] = horse.best(speed)
+        features[f"horse_time_behind_mean_{RECENT}"] = horse.mean(time_behind, RECENT)
+        features[f"horse_agari_mean_{RECENT}"] = horse.mean(agari, RECENT)
+        features[f"horse_agari_rank_mean_{RECENT}"] = horse.mean(agari_rank, RECENT)
+        features["horse_days_since_last"] = days - horse.previous(days.astype(float))
+
+        # 今回と同じ条件（芝ダ・距離の区分・馬場状態）での成績
+        conditions = {
+            "kind": runs["kind"].astype(object).fillna("").to_numpy(),
+            "distance": np.searchsorted(DISTANCE_BANDS, length),
+            "state": runs["state"].astype(object).fillna("").to_numpy(),
+        }
+        for name, condition in conditions.items():
+            wins, starts = _AsOf([horse_id, condition], days).sums(win)
+            features[f"horse_{name}_starts"] = starts.astype(float)
+            features[f"horse_{name}_win_rate"] = _ratio(wins, starts)
+
+        for person in ("jockey", "trainer"):
+            codes = pd.factorize(runs[f"{person}_id"].to_numpy(dtype=object))[0]
+            form = _form(codes, days, {"starts": finished.astype(float),
+                                       "wins": np.nan_to_num(win),
+                                       "top3": np.nan_to_num(top3)}, FORM_DAYS)
+            # ID のない行は集計しない
+            missing = codes < 0
+            for name in form:
+                form[name][missing] = np.nan
+            features[f"{person}_starts_{FORM_DAYS}"] = form["starts"]
+            features[f"{person}_win_rate_{FORM_DAYS}"] = _ratio(form["wins"], form["starts"])
+            features[f"{person}_top3_rate_{FORM_DAYS}"] = _ratio(form["top3"], form["starts"])
+
+        # ID のない馬は集計しない
+        missing = pd.isna(horse_id)
+        for name in HORSE_FEATURES:
+            features[name][missing] = np.nan
+
+        frame = pd.DataFrame({
+            "race_id": runs["race_id"].array,
+            "umaban": runs["umaban"].array,
+            "race_date": runs["race_date"].array,
+            "horse_id": runs["horse_id"].array,
+            **{name: features[name] for name in HORSE_FEATURES + PERSON_FEATURES},
+        })
+        if targets is not None:
+            frame = frame[np.asarray(targets)].reset_index(drop=True)
+        return frame
+
+    # 保存されていないレースの特徴量を求めて書き足し、そのレース数を返す
+    # 途中の日付のレースが後から入った場合は、その日より後の保存済みのレースも求め直す
+    def update(self) -> int:
+        races = self.dataset.to_table(
+            "race_result", columns=["race_id", "race_date"]).group_by(
+            ["race_id", "race_date"]).aggregate([])
+        races = races.filter(pc.is_valid(races["race_date"]))
+        cached = self.store.to_table(FEATURES.name, columns=["race_id"])["race_id"]
+        new = races.filter(pc.invert(pc.is_in(races["race_id"],
+                                               value_set=pc.unique(cached))))
+        if len(new) == 0:
+            return 0
+        since = pc.min(new["race_date"]).as_py()
+        target_ids = pc.unique(pa.concat_arrays([
+            new["race_id"].combine_chunks(),
+            races.filter(pc.greater(races["race_date"], since))["race_id"]
+            .combine_chunks()]))
+
+        # 対象の馬が過去に出たレースと、騎手・調教師の成績に使う期間のレース
+        horses = self.dataset.to_table(
+            "race_result", columns=["horse_id"],
+            filter=pc.field("race_id").isin(target_ids))["horse_id"]
+        past = self.dataset.to_table(
+            "race_result", columns=["race_id"],
+            filter=pc.field("horse_id").isin(pc.unique(horses)))["race_id"]
+        runs = self.load_runs(
+            pc.field("race_id").isin(pc.unique(past))
+            | (pc.field("race_date") >= since - timedelta(days=FORM_DAYS)))
+
+        targets = runs["race_id"].isin(target_ids.to_pylist()).to_numpy()
+        self.store.append(FEATURES.name, self.compute(runs, targets))
+        return len(new)
+
+    # 保存済みの特徴量（race_ids を指定するとそのレースだけ）
+    def read(self, race_ids=None, years=None) -> pd.DataFrame:
+        filter = pc.field("race_id").isin(list(race_ids)) \
+            if race_ids is not None else None
+        return self.store.read(FEATURES.name, years=years, filter=filter)
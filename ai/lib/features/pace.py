@@ -0,0 +1,149 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from lib.features.feature_store import _form, _ratio
+from lib.storage.race_dataset import RaceDataset
+
+
+# ラップタイム（race_info.laps）からレースのペースを表す値を求める
+#   first_3f / last_3f: 前半・後半 600m のタイム
+#   pace_diff: first_3f - last_3f（マイナスほど前半が速い）
+#   pace: 前後半の差による区分（H: ハイペース、M: ミドル、S: スロー）
+#   *_dev: 同じ競馬場・芝ダ・距離の、開催日の前日までの NORM_DAYS 日間の平均との差
+# 全レースのラップを1つの行列にしてまとめて求める（レースごとのループはない）
+
+SECTION = 200
+FURLONGS = 3
+# 4250m（中山大障害）でも 22 区間
+MAX_LAPS = 24
+# pace_diff がこれ以下ならハイペース、これ以上ならスロー
+PACE_THRESHOLD = 1.0
+NORM_DAYS = 365 * 3
+
+PACE_FEATURES = (
+    "first_3f", "last_3f", "pace_diff",
+    "first_3f_dev", "last_3f_dev", "pace_diff_dev",
+)
+PACE_COLUMNS = ["race_id", "race_date", "kind", "length", "laps"]
+
+
+def _list_array(laps) -> pa.ListArray:
+    if isinstance(laps, pa.ChunkedArray):
+        laps = laps.combine_chunks()
+    if not isinstance(laps, pa.Array):
+        # pandas の列（値は NumPy の配列 or None）
+        laps = pa.array([None if values is None else np.asarray(values, dtype=float)
+                         for values in laps], type=pa.list_(pa.float64()))
+    return laps
+
+
+# laps（list<float> の列）を、最後の区間を右端にそろえた (レース数, width) の行列にする
+# 区間が width より少ないレースは左側が NaN（ラップのないレースは全部 NaN）
+def lap_matrix(laps, width=MAX_LAPS) -> np.ndarray:
+    laps = _list_array(laps)
+    lengths = pc.fill_null(pc.list_value_length(laps), 0).to_numpy()
+    values = pc.list_flatten(laps).to_numpy(zero_copy_only=False).astype(float)
+    rows = np.repeat(np.arange(len(lengths)), lengths)
+    ends = np.cumsum(lengths)
+    # 各値の、そのレースの最後の区間から数えた位置（0 が最後の区間）
+    from_end = np.repeat(ends, lengths) - 1 - np.arange(len(values))
+    keep = from_end < width
+    matrix = np.full((len(lengths), width), np.nan)
+    matrix[rows[keep], width - 1 - from_end[keep]] = values[keep]
+    return matrix
+
+
+# 行列の各区間のうち、スタートから distance m までに含まれる割合と、含まれる距離の合計
+# 最初の区間は 200m 未満のことがある（2500m なら 100m）ので、区間の長さは距離から求める
+def _head_weights(matrix: np.ndarray, length: np.ndarray,
+                  distance) -> tuple[np.ndarray, np.ndarray]:
+    width = matrix.shape[1]
+    n_laps = np.count_nonzero(~np.isnan(matrix), axis=1)
+    # 距離がない・ラップの数と合わないときは、全区間 200m とみなす
+    length = np.where(np.isnan(length), n_laps * SECTION, length)
+    length = np.clip(length, (n_laps - 1) * SECTION + 1, n_laps * SECTION)
+    # 区間 j の終わりまでの距離（右端が length）
+    ends = length[:, None] - SECTION * (width - 1 - np.arange(width))[None, :]
+    starts = np.maximum(ends - SECTION, 0)
+    covered = np.clip(np.minimum(ends, distance) - starts, 0, None)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        weights = np.where(ends > 0, covered / (ends - starts), 0.0)
+    return weights, covered.sum(axis=1)
+
+
+def first_furlongs(matrix, length, n=FURLONGS) -> np.ndarray:
+    weights, covered = _head_weights(
+        matrix, np.asarray(length, dtype=float), n * SECTION)
+    head = np.where(weights > 0, matrix, 0.0)
+    # 対象の区間に欠けがある・距離が足りないときは NaN
+    missing = np.any((weights > 0) & np.isnan(matrix), axis=1) \
+        | (covered < n * SECTION)
+    return np.where(missing, np.nan, np.round(np.sum(head * weights, axis=1), 1))
+
+
+def last_furlongs(matrix, n=FURLONGS) -> np.ndarray:
+    # 右端の n 区間（どれか欠けていれば NaN）
+    return np.round(matrix[:, -n:].sum(axis=1), 1)
+
+
+def pace_shape(pace_diff: np.ndarray, threshold=PACE_THRESHOLD) -> pd.Categorical:
+    shapes = np.where(pace_diff <= -threshold, "H",
+                      np.where(pace_diff >= threshold, "S", "M"))
+    return pd.Categorical(np.where(np.isnan(pace_diff), None, shapes),
+                          categories=["H", "M", "S"])
+
+
+def _norms(races: pd.DataFrame, values: dict[str, np.ndarray],
+           window_days=NORM_DAYS) -> dict[str, np.ndarray]:
+    # 競馬場（race_id の 5, 6 桁目）・芝ダ・距離ごとの、開催日の前日までの平均
+    codes = pd.DataFrame({
+        "place": races["race_id"].astype(str).str.slice(4, 6),
+        "kind": races["kind"].astype(str),
+        "length": races["length"].to_numpy(dtype=float, na_value=np.nan),
+    }).groupby(["place", "kind", "length"], dropna=False, sort=False) \
+        .ngroup().to_numpy()
+    days = races["race_date"].to_numpy(dtype="datetime64[D]").astype(np.int64)
+    sums = _form(codes, days, {
+        **{name: np.nan_to_num(value) for name, value in values.items()},
+        **{f"{name}_n": (~np.isnan(value)).astype(float)
+           for name, value in values.items()},
+    }, window_days)
+    return {name: _ratio(sums[name], sums[f"{name}_n"]) for name in values}
+
+
+# races: PACE_COLUMNS の列を持つ1レース1行の表（DataFrame or pyarrow.Table）
+# 1レース1行の DataFrame（race_id、PACE_FEATURES、pace）を返す
+def pace_features(races, window_days=NORM_DAYS) -> pd.DataFrame:
+    if isinstance(races, pa.Table):
+        laps = races["laps"]
+        races = races.drop_columns(["laps"]).to_pandas(date_as_object=False)
+    else:
+        laps = races["laps"]
+    matrix = lap_matrix(laps)
+    length = races["length"].to_numpy(dtype=float, na_value=np.nan)
+
+    features = {"first_3f": first_furlongs(matrix, length),
+                "last_3f": last_furlongs(matrix)}
+    features["pace_diff"] = np.round(features["first_3f"] - features["last_3f"], 1)
+    norms = _norms(races, features, window_days) \
+        if races["race_date"].notna().all() else \
+        {name: np.full(len(races), np.nan) for name in features}
+    for name in list(features):
+        features[f"{name}_dev"] = np.round(features[name] - norms[name], 2)
+
+    return pd.DataFrame({
+        "race_id": races["race_id"].to_numpy(),
+        **{name: features[name] for name in PACE_FEATURES},
+        "pace": pace_shape(features["pace_diff"]),
+    })
+
+
+# RaceDataset の race_info 全部（years を指定するとその年だけ）のペース
+# 平均との差は読んだ範囲のレースだけから求めるので、years の最初の方は NaN が多くなる
+def load_pace(dataset: RaceDataset = None, years=None) -> pd.DataFrame:
+    dataset = dataset or RaceDataset()
+    races = dataset.to_table("race_info", columns=PACE_COLUMNS, years=years)
+    races = races.filter(pc.is_valid(races["race_date"]))
+    return pace_features(races)
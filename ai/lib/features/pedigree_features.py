@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+
+from lib.features.feature_store import DISTANCE_BANDS, _form, _ratio
+from lib.pedigree.pedigree_graph import PedigreeGraph, position_code
+
+
+# 父・母父・父系ごとの産駒の成績（開催日の前日までの SIRE_DAYS 日間）
+# 出走馬の父・母父・父系の祖先は PedigreeGraph.ancestor_matrix の列を引くだけで、
+# 集計は騎手・調教師と同じ日ごとの累積和なので、出馬表の全馬をまとめて求められる
+#   sire:          父
+#   damsire:       母父
+#   sire_line:     父系（父の父の父）
+#   sire_kind:     父 × 今回の芝ダ
+#   sire_distance: 父 × 今回の距離の区分
+
+SIRE_DAYS = 365 * 5
+SIRE_LINE = "sss"
+PEDIGREE_KEYS = ("sire", "damsire", "sire_line", "sire_kind", "sire_distance")
+PEDIGREE_FEATURES = tuple(
+    f"{key}_{name}" for key in PEDIGREE_KEYS
+    for name in ("starts", "win_rate", "top3_rate"))
+
+
+# runs: FeatureStore.load_runs の形（horse_id, race_date, rank, kind, length）
+# runs の各行（targets を指定するとその行だけ）の (race_id, umaban, PEDIGREE_FEATURES)
+def pedigree_features(runs: pd.DataFrame, graph: PedigreeGraph,
+                      targets=None, window_days=SIRE_DAYS) -> pd.DataFrame:
+    days = runs["race_date"].to_numpy(dtype="datetime64[D]").astype(np.int64)
+    rank = runs["rank"].to_numpy(dtype=float, na_value=np.nan)
+    length = runs["length"].to_numpy(dtype=float, na_value=np.nan)
+    finished = ~np.isnan(rank)
+    values = {"starts": finished.astype(float),
+              "wins": np.where(finished, rank == 1, 0.0),
+              "top3": np.where(finished, rank <= 3, 0.0)}
+
+    # 出走馬ごとの父・母父・父系の整数 ID（分からなければ -1）
+    matrix = graph.ancestor_matrix(graph.index(runs["horse_id"].to_numpy(dtype=object)),
+                                   len(SIRE_LINE))
+    ancestors = {"sire": matrix[:, position_code("s")],
+                 "damsire": matrix[:, position_code("ds")],
+                 "sire_line": matrix[:, position_code(SIRE_LINE)]}
+    keys = {
+        **{name: [ancestor] for name, ancestor in ancestors.items()},
+        "sire_kind": [ancestors["sire"],
+                      runs["kind"].astype(object).fillna("").to_numpy()],
+        "sire_distance": [ancestors["sire"], np.searchsorted(DISTANCE_BANDS, length)],
+    }
+
+    features = {}
+    for key in PEDIGREE_KEYS:
+        codes = pd.DataFrame(dict(enumerate(keys[key]))) \
+            .groupby(list(range(len(keys[key]))), sort=False).ngroup().to_numpy()
+        form = _form(codes, days, values, window_days)
+        # 祖先の分からない馬は集計しない
+        missing = keys[key][0] < 0
+        for name in form:
+            form[name][missing] = np.nan
+        features[f"{key}_starts"] = form["starts"]
+        features[f"{key}_win_rate"] = _ratio(form["wins"], form["starts"])
+        features[f"{key}_top3_rate"] = _ratio(form["top3"], form["starts"])
+
+    frame = pd.DataFrame({
+        "race_id": runs["race_id"].array,
+        "umaban": runs["umaban"].array,
+        **{name: features[name] for name in PEDIGREE_FEATURES},
+    })
+    if targets is not None:
+        frame = frame[np.asarray(targets)].reset_index(drop=True)
+    return frame
@@ -0,0 +1,234 @@
+import json
+import os
+import threading
+import time
+import traceback
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# 取得・解析・投入の各段階の時間・件数・エラーを集計する
+#   stage_seconds{stage, kind}: 段階ごとの時間のヒストグラム
+#     rate_wait: 取得間隔の待ち、selenium_get / selenium_wait: ページの読み込みと要素の待ち、
+#     http_fetch: HTTP での取得、save: ページの保存、read: 保存済みのページの読み込み、
+#     parse: 解析、db_copy: COPY と反映、db_commit: コミット
+#   page_bytes{kind}:            取得したページの大きさ（バイト）のヒストグラム
+#   http_responses_total{host, status}
+#   errors_total{stage, kind, type}: 段階ごと・例外の型ごとのエラー数
+#   rows_total{table}:           投入した行数
+# 値はプロセスごとに持つ。プロセスプールで動かす処理は collect で包み、
+# 結果と一緒に返した差分を親プロセスで merge_collected する
+# MetricsExporter が JSON lines（{worker}.jsonl に追記）と
+# Prometheus の textfile（{worker}.prom を置き換え）に定期的に書き出す
+
+PREFIX = "keibaai_"
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1, 2.5, 5, 10, 30, 60)
+BYTES_BUCKETS = tuple(1024 * 4 ** i for i in range(8))
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Metrics():
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (名前, ラベル) → 値
+        self.counters = {}
+        # (名前, ラベル) → [バケットの上限, バケットごとの件数（最後は上限なし）, 合計, 件数]
+        self.histograms = {}
+
+    def count(self, name, value=1, **labels) -> None:
+        key = _key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels) -> None:
+        key = _key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [
+                    tuple(buckets), [0] * (len(buckets) + 1), 0.0, 0]
+            histogram[1][bisect_left(histogram[0], value)] += 1
+            histogram[2] += value
+            histogram[3] += 1
+
+    def error(self, stage, e: BaseException, **labels) -> None:
+        self.count("errors_total", stage=stage, type=type(e).__name__, **labels)
+
+    # with の中の時間を stage_seconds に記録する（例外は errors_total に数えてそのまま投げる）
+    @contextmanager
+    def timer(self, stage, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.error(stage, e, **labels)
+            raise
+        finally:
+            self.observe("stage_seconds", time.perf_counter() - start,
+                         stage=stage, **labels)
+
+    def _snapshot(self) -> dict:
+        return {
+            "counters": [[name, dict(labels), value]
+                         for (name, labels), value in self.counters.items()],
+            "histograms": [[name, dict(labels), list(buckets), list(counts), total, n]
+                           for (name, labels), (buckets, counts, total, n)
+                           in self.histograms.items()],
+        }
+
+    # pickle・JSON にできる形（merge で足し込める）
+    def snapshot(self) -> dict:
+        with self.lock:
+            return self._snapshot()
+
+    # snapshot を返して値を空にする
+    def drain(self) -> dict:
+        with self.lock:
+            snapshot = self._snapshot()
+            self.counters = {}
+            self.histograms = {}
+        return snapshot
+
+    def merge(self, snapshot: dict) -> None:
+        with self.lock:
+            for name, labels, value in snapshot["counters"]:
+                key = _key(name, labels)
+                self.counters[key] = self.counters.get(key, 0) + value
+            for name, labels, buckets, counts, total, n in snapshot["histograms"]:
+                key = _key(name, labels)
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    self.histograms[key] = [tuple(buckets), list(counts), total, n]
+                    continue
+                histogram[1] = [a + b for a, b in zip(histogram[1], counts)]
+                histogram[2] += total
+                histogram[3] += n
+
+    def to_json_line(self, worker) -> str:
+        snapshot = self.snapshot()
+        return json.dumps({
+            "time": time.time(),
+            "worker": worker,
+            "pid": os.getpid(),
+            "counters": [{"name": name, "labels": labels, "value": value}
+                         for name, labels, value in snapshot["counters"]],
+            "histograms": [{"name": name, "labels": labels, "buckets": buckets,
+                            "counts": counts, "sum": total, "count": n}
+                           for name, labels, buckets, counts, total, n
+                           in snapshot["histograms"]],
+        }, ensure_ascii=False)
+
+    # Prometheus のテキスト形式（ラベルに worker を付ける）
+    def to_prometheus(self, worker) -> str:
+        snapshot = self.snapshot()
+        lines = []
+        typed = set()
+
+        def add(name, kind, labels, value):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {PREFIX}{name} {kind}")
+            lines.append(f"{PREFIX}{name}{_labels(labels)} {_number(value)}")
+
+        for name, labels, value in sorted(snapshot["counters"], key=str):
+            add(name, "counter", {"worker": worker, **labels}, value)
+        for name, labels, buckets, counts, total, n in sorted(
+                snapshot["histograms"], key=str):
+            labels = {"worker": worker, **labels}
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {PREFIX}{name} histogram")
+            cumulative = 0
+            for bound, count in zip(list(buckets) + ["+Inf"], counts):
+                cumulative += count
+                lines.append(f"{PREFIX}{name}_bucket"
+                             f"{_labels({**labels, 'le': _number(bound)})} {cumulative}")
+            lines.append(f"{PREFIX}{name}_sum{_labels(labels)} {_number(total)}")
+            lines.append(f"{PREFIX}{name}_count{_labels(labels)} {n}")
+        return "\n".join(lines) + "\n"
+
+
+def _number(value) -> str:
+    if isinstance(value, str):
+        return value
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _labels(labels) -> str:
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in labels.items()) + "}"
+
+
+_metrics = {}
+
+
+# プロセスごとの Metrics（fork で親から引き継いだ値は使わない）
+def get_metrics() -> Metrics:
+    pid = os.getpid()
+    if pid not in _metrics:
+        _metrics[pid] = Metrics()
+    return _metrics[pid]
+
+
+# プロセスプールで func を動かし、(結果, この呼び出しで集計した値) を返す
+# 同じプロセスで呼んだときも、merge_collected で戻すので値は失われない
+# 例外のときの値は、そのプロセスの次の collect で返る
+def collect(func, *args):
+    value = func(*args)
+    return value, get_metrics().drain()
+
+
+def merge_collected(collected):
+    value, snapshot = collected
+    get_metrics().merge(snapshot)
+    return value
+
+
+class MetricsExporter(threading.Thread):
+    # interval 秒ごとと終了時に、directory に {worker}.jsonl と {worker}.prom を書く
+    # 値は起動からの累積（Prometheus の counter / histogram と同じ）
+    # .prom は一時ファイルに書いてから置き換えるので、node_exporter の textfile collector が
+    # 書きかけのファイルを読むことはない
+    INTERVAL = 60
+
+    def __init__(self, directory, worker, interval=INTERVAL, metrics=None):
+        super().__init__(daemon=True)
+        self.directory = directory
+        self.worker = worker
+        self.interval = interval
+        self.metrics = metrics or get_metrics()
+        self.stopped = threading.Event()
+
+    def write(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, self.worker)
+        with open(f"{base}.jsonl", "a") as f:
+            f.write(self.metrics.to_json_line(self.worker) + "\n")
+        with open(f"{base}.prom.tmp", "w") as f:
+            f.write(self.metrics.to_prometheus(self.worker))
+        os.replace(f"{base}.prom.tmp", f"{base}.prom")
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.write()
+            except Exception:
+                print(traceback.format_exc())
+
+    # 止めて、最後の値を書き出す
+    def stop(self) -> None:
+        self.stopped.set()
+        if self.is_alive():
+            self.join()
+        self.write()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,219 @@
+import os
+from typing import Iterable, Iterator
+
+import numpy as np
+import pandas as pd
+
+from lib.dao.horse_dao import HorseDAO
+from lib.dao.race_result_dao import DSN
+
+
+# 血統表（data/ped/ を解析した pedigree）と馬のページの父母をつないだ血統のグラフ
+# 馬を 0.. の整数 ID にして、父・母を整数の配列で持つ
+#
+# 祖先は血統表の「位置」を番号にして表す
+#   1 が本人、位置 c の父が 2c、母が 2c + 1
+#   第 g 世代の位置は 2^g .. 2^(g+1) - 1（"s" = 2, "d" = 3, "ds"（母父） = 6）
+# ancestor_matrix は (馬, 位置) → 祖先の整数 ID の行列で、
+# 祖先の列挙・共通の祖先・インブリード係数はどれもこの行列の列の比較で求める
+
+GENERATIONS = 5
+
+
+def position_code(position: str) -> int:
+    # 血統表の位置（"sd" など）→ 位置の番号
+    code = 1
+    for side in position:
+        code = code * 2 + (side == "d")
+    return code
+
+
+def position_name(code: int) -> str:
+    return "".join("sd"[int(bit)] for bit in bin(code)[3:])
+
+
+def _generations(codes) -> np.ndarray:
+    # 位置の番号の世代（本人が 0）
+    return np.floor(np.log2(np.asarray(codes))).astype(np.int64)
+
+
+class PedigreeGraph():
+    ROOT = "data/pedigree"
+
+    def __init__(self, ids: np.ndarray, sire: np.ndarray, dam: np.ndarray):
+        self.ids = pd.Index(ids)
+        self.sire = sire.astype(np.int32)
+        self.dam = dam.astype(np.int32)
+        self._children = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    # (子, 父母の別 's' / 'd', 親) の組から作る
+    # 同じ子の同じ側に違う親が出てきたときは、一番多く出てきた親にする
+    @classmethod
+    def from_edges(cls, edges: Iterable[tuple[str, str, str]]) -> "PedigreeGraph":
+        edges = pd.DataFrame.from_records(
+            list(edges), columns=["child_id", "side", "parent_id"])
+        edges = edges.groupby(["child_id", "side", "parent_id"], sort=False) \
+            .size().rename("n").reset_index() \
+            .sort_values("n", ascending=False, kind="stable") \
+            .drop_duplicates(["child_id", "side"])
+        codes, ids = pd.factorize(pd.concat(
+            [edges["child_id"], edges["parent_id"]], ignore_index=True))
+        child, parent = codes[:len(edges)], codes[len(edges):]
+        parents = {}
+        for side in ("s", "d"):
+            is_side = (edges["side"] == side).to_numpy()
+            parents[side] = np.full(len(ids), -1, dtype=np.int32)
+            parents[side][child[is_side]] = parent[is_side]
+        return cls(np.asarray(ids, dtype=object), parents["s"], parents["d"])
+
+    @classmethod
+    def from_db(cls, dsn=DSN) -> "PedigreeGraph":
+        return cls.from_edges(HorseDAO(dsn).iter_parent_edges())
+
+    def save(self, root=ROOT) -> str:
+        os.makedirs(root, exist_ok=True)
+        path = os.path.join(root, "graph.npz")
+        np.savez(path + ".tmp.npz", ids=self.ids.to_numpy(dtype=str),
+                 sire=self.sire, dam=self.dam)
+        os.replace(path + ".tmp.npz", path)
+        return path
+
+    @classmethod
+    def load(cls, root=ROOT) -> "PedigreeGraph":
+        with np.load(os.path.join(root, "graph.npz")) as data:
+            return cls(data["ids"].astype(object), data["sire"], data["dam"])
+
+    # horse_id → 整数 ID（グラフにない馬は -1）
+    def index(self, horse_ids) -> np.ndarray:
+        return self.ids.get_indexer(pd.Index(np.atleast_1d(horse_ids))) \
+            .astype(np.int32)
+
+    # nodes（整数 ID）ごとの、位置 0 .. 2^(generations+1) - 1 の祖先（いなければ -1、列 0 は使わない）
+    def ancestor_matrix(self, nodes=None, generations=GENERATIONS) -> np.ndarray:
+        nodes = np.arange(len(self), dtype=np.int32) if nodes is None \
+            else np.asarray(nodes, dtype=np.int32)
+        # 最後に -1 を足しておくと、-1（いない馬）の親は -1 になる
+        sire = np.append(self.sire, np.int32(-1))
+        dam = np.append(self.dam, np.int32(-1))
+        matrix = np.full((len(nodes), 2 ** (generations + 1)), -1, dtype=np.int32)
+        matrix[:, 1] = nodes
+        for generation in range(1, generations + 1):
+            children = matrix[:, 2 ** (generation - 1):2 ** generation]
+            block = matrix[:, 2 ** generation:2 ** (generation + 1)]
+            block[:, 0::2] = sire[children]
+            block[:, 1::2] = dam[children]
+        return matrix
+
+    def _chunks(self, nodes, chunk_size) -> Iterator[np.ndarray]:
+        nodes = np.arange(len(self), dtype=np.int32) if nodes is None \
+            else np.asarray(nodes, dtype=np.int32)
+        for start in range(0, len(nodes), chunk_size):
+            yield nodes[start:start + chunk_size]
+
+    # nodes ごとの祖先の (horse, ancestor, generation, n_paths)（どれも整数の配列）
+    #   generation: 一番近い経路の世代、n_paths: generations 世代までに出てくる回数
+    def closure(self, nodes=None, generations=GENERATIONS) -> pd.DataFrame:
+        nodes = np.arange(len(self), dtype=np.int32) if nodes is None \
+            else np.asarray(nodes, dtype=np.int32)
+        matrix = self.ancestor_matrix(nodes, generations)[:, 2:]
+        rows, columns = np.nonzero(matrix >= 0)
+        frame = pd.DataFrame({
+            "horse": nodes[rows],
+            "ancestor": matrix[rows, columns],
+            "generation": _generations(columns + 2).astype(np.int16),
+        })
+        return frame.groupby(["horse", "ancestor"], sort=False) \
+            .agg(generation=("generation", "min"),
+                 n_paths=("generation", "size")).reset_index()
+
+    # pedigree_closure に投入するタプル（chunk_size 頭ずつ求める）
+    def closure_tuples(self, nodes=None, generations=GENERATIONS,
+                       chunk_size=100000) -> Iterator[tuple]:
+        ids = self.ids.to_numpy()
+        for chunk in self._chunks(nodes, chunk_size):
+            closure = self.closure(chunk, generations)
+            yield from zip(ids[closure["horse"].to_numpy()],
+                           ids[closure["ancestor"].to_numpy()],
+                           closure["generation"].tolist(),
+                           closure["n_paths"].tolist())
+
+    def _child_index(self) -> tuple[np.ndarray, np.ndarray]:
+        # 親 → 子の CSR（indptr、子の整数 ID）
+        if self._children is None:
+            parents = np.concatenate([self.sire, self.dam])
+            children = np.tile(np.arange(len(self), dtype=np.int32), 2)
+            known = parents >= 0
+            parents, children = parents[known], children[known]
+            order = np.argsort(parents, kind="stable")
+            indptr = np.zeros(len(self) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(parents, minlength=len(self)), out=indptr[1:])
+            self._children = (indptr, children[order])
+        return self._children
+
+    # horse_id の子孫の (horse_id, generation)。generations を指定するとその世代まで
+    # 1世代ずつ、その世代の馬全部の子を CSR からまとめて取り出す
+    def descendants(self, horse_id, generations=None) -> pd.DataFrame:
+        indptr, children = self._child_index()
+        depth = np.full(len(self), -1, dtype=np.int32)
+        frontier = self.index(horse_id)
+        frontier = frontier[frontier >= 0]
+        generation = 0
+        while len(frontier) and (generations is None or generation < generations):
+            generation += 1
+            starts, ends = indptr[frontier], indptr[frontier + 1]
+            counts = ends - starts
+            offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+            found = np.unique(children[offsets + np.arange(counts.sum())])
+            frontier = found[depth[found] < 0]
+            depth[frontier] = generation
+        nodes = np.flatnonzero(depth > 0)
+        return pd.DataFrame({"horse_id": self.ids.to_numpy()[nodes],
+                             "generation": depth[nodes]}) \
+            .sort_values(["generation", "horse_id"], ignore_index=True)
+
+    # 2頭の共通の祖先の (ancestor_id, position_1, position_2)（経路ごとに1行）
+    def common_ancestors(self, horse_id_1, horse_id_2,
+                         generations=GENERATIONS) -> pd.DataFrame:
+        matrix = self.ancestor_matrix(self.index([horse_id_1, horse_id_2]),
+                                      generations)
+        first, second = matrix[0, 1:], matrix[1, 1:]
+        i, j = np.nonzero((first[:, None] == second[None, :]) & (first[:, None] >= 0))
+        return pd.DataFrame({
+            "ancestor_id": self.ids.to_numpy()[first[i]],
+            "position_1": [position_name(code) for code in i + 1],
+            "position_2": [position_name(code) for code in j + 1],
+        })
+
+    # nodes ごとのインブリード係数（Wright の式、generations 世代の血統表の範囲）
+    #   F = Σ (1/2)^(n1 + n2 + 1)
+    #   父側の位置 c1（n1 = 世代 - 1）と母側の位置 c2 に同じ祖先がいる組ごとに足す
+    #   2本の経路が祖先以外の同じ馬を通る組（その馬のクロスとして数える）は除く
+    #   祖先自身のインブリード係数は 0 とみなす
+    def inbreeding(self, nodes=None, generations=GENERATIONS,
+                   chunk_size=100000) -> np.ndarray:
+        codes = np.arange(2, 2 ** (generations + 1))
+        sire_side = codes[(codes >> (_generations(codes) - 1)) == 2]
+        dam_side = codes[(codes >> (_generations(codes) - 1)) == 3]
+        dam_generations = _generations(dam_side)
+        results = []
+        for chunk in self._chunks(nodes, chunk_size):
+            matrix = self.ancestor_matrix(chunk, generations)
+            f = np.zeros(len(chunk))
+            for c1 in sire_side:
+                g1 = _generations(c1)
+                same = (matrix[:, dam_side] == matrix[:, [c1]]) \
+                    & (matrix[:, [c1]] >= 0)
+                rows, k = np.nonzero(same)
+                c2, g2 = dam_side[k], dam_generations[k]
+                # 経路の途中の馬（祖先の子 .. 父・母）が重なっていないか
+                valid = np.ones(len(rows), dtype=bool)
+                for shift1 in range(1, g1):
+                    for shift2 in range(1, generations):
+                        valid &= ~((shift2 < g2) & (matrix[rows, c1 >> shift1]
+                                                    == matrix[rows, c2 >> shift2]))
+                np.add.at(f, rows[valid], 0.5 ** (g1 + g2[valid] - 1))
+            results.append(f)
+        return np.concatenate(results) if results else np.zeros(0)
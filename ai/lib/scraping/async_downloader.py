@@ -0,0 +1,85 @@
+import asyncio
+import traceback
+from urllib.parse import urlparse
+
+from tqdm import tqdm
+
+from lib.metrics.metrics import BYTES_BUCKETS, get_metrics
+from lib.scraping.http_fetcher import HttpFetcher
+from lib.scraping.page_validator import validate_page
+from lib.scraping.rate_limit import HostRateLimiter
+from lib.scraping.retry import RetryPolicy
+from lib.storage.page_store import PageStore
+
+
+class AsyncDownloader():
+    # concurrency 件のリクエストを同時に発行する
+    # 取得間隔はホストごとのトークンバケットで制御し、既に保存済みのページは待たない
+    # 失敗は retry で再試行し、諦めたページは on_failure(kind, key, url, e) に渡す
+    def __init__(self, http: HttpFetcher, rate_limiter: HostRateLimiter,
+                 store: PageStore, concurrency=8, manifest=None, retry=None,
+                 on_failure=None):
+        self.http = http
+        self.rate_limiter = rate_limiter
+        self.store = store
+        self.concurrency = concurrency
+        self.manifest = manifest
+        self.retry = retry or RetryPolicy()
+        self.on_failure = on_failure
+
+    def _fetch_and_save(self, url, kind, key):
+        metrics = get_metrics()
+        with metrics.timer("http_fetch", kind=kind):
+            source = self.http.fetch(url)
+        # エラーページなどは保存せずに再試行する
+        validate_page(kind, source)
+        metrics.observe("page_bytes", len(source.encode("utf-8")),
+                        BYTES_BUCKETS, kind=kind)
+        with metrics.timer("save", kind=kind):
+            self.store.write(kind, key, source)
+            if self.manifest:
+                self.manifest.record_fetched(kind, key, source)
+
+    async def _download(self, url, kind, key, force=False):
+        if not force and self.store.exists(kind, key):
+            return
+        async def attempt():
+            with get_metrics().timer("rate_wait", kind=kind):
+                await self.rate_limiter.acquire(urlparse(url).hostname)
+            await asyncio.to_thread(self._fetch_and_save, url, kind, key)
+
+        try:
+            await self.retry.acall(attempt, kind)
+        except Exception as e:
+            print(traceback.format_exc())
+            if self.on_failure:
+                self.on_failure(kind, key, url, e)
+
+    async def _worker(self, queue, pbar, force):
+        while True:
+            job = await queue.get()
+            try:
+                if job is None:
+                    return
+                url, kind, key = job
+                await self._download(url, kind, key, force)
+                pbar.update(1)
+            finally:
+                queue.task_done()
+
+    async def download_all(self, jobs, desc=None, total=None, force=False,
+                           progress=True):
+        # キューの長さを制限し、ジョブ一覧をすべてメモリに載せない
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        with tqdm(desc=desc, total=total, disable=not progress) as pbar:
+            workers = [asyncio.create_task(self._worker(queue, pbar, force))
+                       for _ in range(self.concurrency)]
+            for job in jobs:
+                await queue.put(job)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+
+    # jobs: (url, kind, key) のイテラブル
+    def run(self, jobs, desc=None, total=None, force=False, progress=True):
+        asyncio.run(self.download_all(jobs, desc, total, force, progress))
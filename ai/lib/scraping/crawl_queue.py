@@ -0,0 +1,91 @@
+import socket
+import threading
+
+from tqdm import tqdm
+
+from lib.dao.crawl_task_dao import CrawlTaskDAO
+from lib.storage.page_store import PageStore
+
+
+def worker_name(id):
+    return f"{socket.gethostname()}-{id}"
+
+
+class LeaseHeartbeat(threading.Thread):
+    # 処理中はバックグラウンドで定期的に、hold() で渡したタスクのリースを延長する
+    # ワーカーが落ちると延長が止まり、リース切れのタスクは他のワーカーが拾う
+    def __init__(self, kind, worker, lease_seconds, interval):
+        super().__init__(daemon=True)
+        self.kind = kind
+        self.worker = worker
+        self.lease_seconds = lease_seconds
+        self.interval = interval
+        self.keys = []
+        self.stopped = threading.Event()
+
+    # 延長するタスク（確保したバッチ）を差し替える
+    def hold(self, keys):
+        self.keys = list(keys)
+
+    def run(self):
+        dao = CrawlTaskDAO()
+        while not self.stopped.wait(self.interval):
+            keys = self.keys
+            if keys:
+                dao.heartbeat(self.kind, self.worker, keys, self.lease_seconds)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.join()
+
+
+class CrawlQueue():
+    BATCH_SIZE = 50
+    LEASE_SECONDS = 600
+    HEARTBEAT_INTERVAL = 60
+
+    def __init__(self, kind, worker, store: PageStore, batch_size=BATCH_SIZE,
+                 lease_seconds=LEASE_SECONDS):
+        self.kind = kind
+        self.worker = worker
+        self.store = store
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.dao = CrawlTaskDAO()
+
+    # キューが空になるまでタスクを確保して download(keys) を呼ぶ
+    # refetch の立っているタスクは download(keys, force=True) で取り直す
+    # ページが保存されていれば完了とする
+    def run(self, download, desc=None):
+        with tqdm(desc=desc, total=self.dao.count_remaining(self.kind)) as pbar, \
+                LeaseHeartbeat(self.kind, self.worker, self.lease_seconds,
+                               self.HEARTBEAT_INTERVAL) as heartbeat:
+            while True:
+                tasks = self.dao.claim(self.kind, self.worker,
+                                       self.batch_size, self.lease_seconds)
+                if not tasks:
+                    break
+                keys = [key for key, _ in tasks]
+                heartbeat.hold(keys)
+                fetch = [key for key, refetch in tasks if not refetch]
+                refetch = [key for key, refetch in tasks if refetch]
+                if fetch:
+                    download(fetch)
+                if refetch:
+                    download(refetch, force=True)
+
+                done = [key for key in keys
+                        if self.store.exists(self.kind, key)]
+                failed = [key for key in keys
+                          if not self.store.exists(self.kind, key)]
+                if done:
+                    self.dao.complete(self.kind, self.worker, done)
+                if failed:
+                    self.dao.fail(self.kind, self.worker, failed,
+                                  "page was not saved")
+                heartbeat.hold([])
+                pbar.update(len(keys))
@@ -0,0 +1,69 @@
+from datetime import datetime, time, timedelta
+from typing import NamedTuple
+
+from dateutil.relativedelta import relativedelta
+
+
+class FreshnessRule(NamedTuple):
+    # 対象日から settle 経ってから取得したページはもう変わらない（取り直さない）
+    settle: relativedelta
+    # まだ確定していないページを取り直すまでの時間
+    #   対象日が near 以内（過去・近い将来）なら ttl、それより先なら far_ttl
+    ttl: timedelta
+    far_ttl: timedelta
+    near: relativedelta
+
+
+# 対象日が確定するまでの期間（crawl_state の settled_keys / unsettled_keys にも使う）
+SETTLE_INTERVALS = {
+    "race_calendar": "1 month",  # 対象日は月初。月が終わるまでは開催日が増える
+    "race_list": "1 day",        # 対象日は開催日。当日まではレースが追加・変更される
+}
+
+
+def parse_interval(text) -> relativedelta:
+    n, unit = text.split()
+    return relativedelta(**{unit.rstrip("s") + "s": int(n)})
+
+
+# ページの種類ごとの条件（ここにない種類は、一度取得したら取り直さない）
+FRESHNESS_RULES = {
+    "race_calendar": FreshnessRule(
+        parse_interval(SETTLE_INTERVALS["race_calendar"]),
+        timedelta(days=1), timedelta(days=7), relativedelta(months=1)),
+    "race_list": FreshnessRule(
+        parse_interval(SETTLE_INTERVALS["race_list"]),
+        timedelta(hours=1), timedelta(days=1), relativedelta(days=7)),
+}
+
+
+def _naive(value: datetime) -> datetime:
+    # crawl_state の timestamptz はローカル時刻に揃える
+    if value.tzinfo is not None:
+        return value.astimezone().replace(tzinfo=None)
+    return value
+
+
+class FreshnessPolicy():
+    # 保存済みのページを取り直すかどうかを、ページの対象日と取得日時から決める
+    #   対象日から settle 経った後に取得したページ: 確定しているので取り直さない
+    #   それより前に取得したページ: 取得から ttl / far_ttl 経っていたら取り直す
+    #   取得日時が分からないページ: 対象日から settle 経っていれば取り直さない
+    def __init__(self, rules=None):
+        self.rules = FRESHNESS_RULES if rules is None else rules
+
+    def is_fresh(self, kind, entity_date, fetched_at, now=None) -> bool:
+        rule = self.rules.get(kind)
+        if rule is None or entity_date is None:
+            return True
+        now = now or datetime.now()
+        if not isinstance(entity_date, datetime):
+            entity_date = datetime.combine(entity_date, time())
+        settled_at = entity_date + rule.settle
+        if fetched_at is None:
+            return settled_at <= now
+        fetched_at = _naive(fetched_at)
+        if fetched_at >= settled_at:
+            return True
+        ttl = rule.ttl if entity_date <= now + rule.near else rule.far_ttl
+        return now - fetched_at < ttl
@@ -0,0 +1,49 @@
+from bs4 import BeautifulSoup, SoupStrainer
+
+
+class HtmlParser():
+    # engine: BeautifulSoup のツリービルダー（html.parser は標準ライブラリ、lxml は C 実装）
+    # partial: parts に指定した要素の部分木だけを組み立てる
+    # cache: ParseCache を指定すると、cached() の結果をページの内容で引けるようにする
+    ENGINES = ("html.parser", "lxml")
+
+    def __init__(self, engine="html.parser", partial=False, cache=None):
+        if engine not in self.ENGINES:
+            raise ValueError(f"unknown parser engine: {engine}")
+        self.engine = engine
+        self.partial = partial
+        self.cache = cache
+
+    # parts: ("class", "RaceList_NameBox") や ("id", "All_Result_Table") のタプル
+    @classmethod
+    def _strainer(cls, parts):
+        def match(name, attrs):
+            for attr, value in parts:
+                attr_value = attrs.get(attr)
+                if attr_value is None:
+                    continue
+                if attr == "class":
+                    # パース中の class 属性は分割前の文字列
+                    if isinstance(attr_value, str):
+                        attr_value = attr_value.split()
+                    if value in attr_value:
+                        return True
+                elif attr_value == value:
+                    return True
+            return False
+        return SoupStrainer(match)
+
+    def parse(self, contents, parts=None) -> BeautifulSoup:
+        if self.partial and parts:
+            return BeautifulSoup(contents, self.engine,
+                                 parse_only=self._strainer(parts))
+        return BeautifulSoup(contents, self.engine)
+
+    # contents を解析して値を求める処理 parse() の結果を返す
+    # cache があれば、同じ内容・同じ kind のバージョンのページは解析せずに保存済みの結果を返す
+    # 結果にページの ID を含めるときは key も指定する（内容が同じエラーページなどを区別する）
+    def cached(self, kind, version, contents, parse, key=""):
+        if self.cache is None:
+            return parse()
+        return self.cache.get_or_parse(kind, version, contents, parse,
+                                       f"{self.engine}:{self.partial}:{key}")
@@ -0,0 +1,83 @@
+import re
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from lib.metrics.metrics import get_metrics
+
+
+class HttpFetcher():
+    # サーバ側でレンダリングされるページ（db.netkeiba.com）を
+    # ブラウザを介さずに取得する
+    USER_AGENT = (
+        "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
+        "(KHTML, like Gecko) Chrome/130.0.0.0 Safari/537.36"
+    )
+    META_CHARSET = re.compile(
+        rb"""<meta[^>]+charset=["']?([A-Za-z0-9_\-]+)""", re.IGNORECASE)
+    # HTML 上の表記 → Python のコーデック名
+    CHARSETS = {
+        "euc-jp": "euc_jp",
+        "x-euc-jp": "euc_jp",
+        "shift_jis": "cp932",
+        "sjis": "cp932",
+        "utf-8": "utf-8",
+        "utf8": "utf-8",
+    }
+
+    def __init__(self, proxy=None, pool_size=10, timeout=10):
+        self.timeout = timeout
+        self.session = requests.Session()
+        # keep-alive で接続を使い回す
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "User-Agent": self.USER_AGENT,
+            "Accept-Encoding": "gzip, deflate",
+            "Accept-Language": "ja,en;q=0.8",
+        })
+        if proxy:
+            self.session.proxies.update({
+                "http": f"http://{proxy}:3128",
+                "https": f"http://{proxy}:3128",
+            })
+
+    def close(self):
+        self.session.close()
+
+    def fetch(self, url) -> str:
+        res = self.session.get(url, timeout=self.timeout)
+        host = urlparse(url).hostname
+        metrics = get_metrics()
+        metrics.count("http_responses_total", host=host, status=res.status_code)
+        # 圧縮を展開した後の本文の大きさ
+        metrics.count("http_bytes_total", len(res.content), host=host)
+        res.raise_for_status()
+        return self.decode(res.content, res.headers.get("Content-Type"))
+
+    # Content-Type ヘッダ → <meta charset> → UTF-8 の順に文字コードを決める
+    @classmethod
+    def detect_charset(cls, content: bytes, content_type=None) -> str:
+        charset = None
+        if content_type:
+            match = re.search(r"charset=([A-Za-z0-9_\-]+)", content_type)
+            if match:
+                charset = match.group(1)
+        if not charset:
+            match = cls.META_CHARSET.search(content[:4096])
+            if match:
+                charset = match.group(1).decode("ascii")
+        if not charset:
+            return "utf-8"
+        return cls.CHARSETS.get(charset.lower(), charset.lower())
+
+    @classmethod
+    def decode(cls, content: bytes, content_type=None) -> str:
+        charset = cls.detect_charset(content, content_type)
+        try:
+            return content.decode(charset, errors="replace")
+        except LookupError:
+            return content.decode("utf-8", errors="replace")
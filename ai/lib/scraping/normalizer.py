@@ -0,0 +1,210 @@
+from collections import Counter
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from lib.dao.race_result_dao import RaceResult_Row
+
+
+class RaceResultNormalizer():
+    # RaceResult_Row をまとめて DataFrame にし、列ごとに型を変換する
+    # 変換できなかった値（空欄や "---" などの欠損を除く）は列ごとに数える
+    # 目的は型の付いた列と変換できなかった値の集計で、速さではない
+    # （DataFrame の作成・タプルへの変換を含めると、1行ずつ変換するより遅い。
+    #   bench/bench_normalizer.py）
+
+    # RaceResult_Row の属性 → 列名
+    FIELDS = {
+        "race_id": "race_id",
+        "rank": "rank",
+        "waku": "waku",
+        "umaban": "umaban",
+        "horse_name": "horse_name",
+        "horse_sex": "horse_sex",
+        "horse_age": "horse_age",
+        "jockey_weight": "jockey_weight",
+        "jockey_name": "jockey_name",
+        "time_1": "time",
+        "time_2": "chakusa",
+        "odds_1": "popular",
+        "odds_2": "odds",
+        "time_3": "agari",
+        "passage_rate": "passage_rate",
+        "trainer_place": "trainer_place",
+        "trainer_name": "trainer_name",
+        "horse_weight": "horse_weight",
+        "horse_weight_delta": "horse_weight_delta",
+        "horse_id": "horse_id",
+        "jockey_id": "jockey_id",
+        "trainer_id": "trainer_id",
+    }
+    INT_COLUMNS = ("rank", "waku", "umaban", "horse_age", "popular",
+                   "horse_weight", "horse_weight_delta")
+    FLOAT_COLUMNS = ("jockey_weight", "odds", "agari")
+    # 欠損として扱う表記
+    MISSING = ("", "---", "**", "計不")
+    # 着順が数字でないときの表記（変換できなくても不正な値ではない）
+    RANK_STATUSES = ("取消", "除外", "中止", "失格")
+    # 着差の表記 → 馬身
+    MARGINS = {
+        "同着": 0.0,
+        "ハナ": 0.05,
+        "アタマ": 0.1,
+        "クビ": 0.2,
+        "大": 10.0,
+    }
+    N_CORNERS = 4
+
+    @classmethod
+    def to_frame(cls, rows: Iterable[RaceResult_Row]) -> pd.DataFrame:
+        fields = tuple(cls.FIELDS)
+        return pd.DataFrame.from_records(
+            (tuple(getattr(row, f) for f in fields) for row in rows),
+            columns=list(cls.FIELDS.values()))
+
+    # 変換後の DataFrame と、列ごとの変換できなかった値の件数を返す
+    # 列ごとに pyarrow の文字列の配列にし、欠損の判定・数値への変換・正規表現での分解を
+    # pyarrow.compute でまとめて行い、最後に欠損を扱える Int64 / Float64 の列にする
+    def normalize(self, raw: pd.DataFrame) -> tuple[pd.DataFrame, dict[str, Counter]]:
+        frame = {column: raw[column] for column in raw.columns}
+        rejects = {}
+        missing = pa.array(self.MISSING)
+
+        # 欠損の表記を null にそろえた文字列の配列（解析時に前後の空白は除いてある）
+        def strings_of(column):
+            strings = pa.array(raw[column].to_numpy(dtype=object),
+                               type=pa.string(), from_pandas=True)
+            return pc.if_else(pc.is_in(strings, value_set=missing), None, strings)
+
+        def reject(column, strings, converted, allowed=()):
+            bad = pc.is_valid(strings).to_numpy(zero_copy_only=False) & np.isnan(converted)
+            if bad.any():
+                counter = Counter(strings.filter(bad).to_pylist())
+                for value in allowed:
+                    counter.pop(value, None)
+                if counter:
+                    rejects[column] = counter
+
+        # ほとんどのバッチは全部数値なので、先にそのまま変換してみる
+        def to_numbers(strings):
+            try:
+                numbers = pc.cast(strings, pa.float64())
+            except pa.ArrowInvalid:
+                numeric = pc.match_substring_regex(strings, self.NUMBER_PATTERN)
+                numbers = pc.cast(pc.if_else(numeric, strings, None), pa.float64())
+            return numbers.to_numpy(zero_copy_only=False)
+
+        def as_int(numbers):
+            nan = np.isnan(numbers)
+            return pd.arrays.IntegerArray(
+                np.where(nan, 0, numbers).astype("int64"), nan)
+
+        def as_float(numbers):
+            nan = np.isnan(numbers)
+            return pd.arrays.FloatingArray(np.where(nan, 0, numbers), nan)
+
+        for column in self.INT_COLUMNS:
+            strings = strings_of(column)
+            numbers = to_numbers(strings)
+            frame[column] = as_int(numbers)
+            reject(column, strings, numbers,
+                   self.RANK_STATUSES if column == "rank" else ())
+        rank = frame["rank"].to_numpy(dtype=float, na_value=np.nan)
+
+        for column in self.FLOAT_COLUMNS:
+            strings = strings_of(column)
+            numbers = to_numbers(strings)
+            frame[column] = as_float(numbers)
+            reject(column, strings, numbers)
+
+        # タイム: 1:34.5 → 94.5 秒
+        strings = strings_of("time")
+        parts = pc.extract_regex(strings, self.TIME_PATTERN)
+        numbers = (np.nan_to_num(self._group(parts, "minutes")) * 60
+                   + self._group(parts, "seconds"))
+        frame["time_sec"] = as_float(numbers)
+        reject("time", strings, numbers)
+
+        # 着差: 1.1/2 → 1.5 馬身、クビ → 0.2 馬身（1着は空欄なので 0）
+        strings = strings_of("chakusa")
+        parts = pc.extract_regex(strings, self.MARGIN_PATTERN)
+        fraction = self._group(parts, "num") / self._group(parts, "den")
+        numbers = np.where(
+            pc.is_valid(parts).to_numpy(zero_copy_only=False),
+            np.nan_to_num(self._group(parts, "whole")) + np.nan_to_num(fraction),
+            np.nan)
+        named = pc.fill_null(
+            pc.index_in(strings, value_set=pa.array(list(self.MARGINS))), -1).to_numpy()
+        numbers = np.where(named >= 0,
+                           np.array(list(self.MARGINS.values()))[named], numbers)
+        numbers[pc.is_null(strings).to_numpy(zero_copy_only=False) & (rank == 1)] = 0.0
+        frame["margin"] = as_float(numbers)
+        reject("chakusa", strings, numbers)
+
+        # コーナー通過順: 3-3-2-1 → corner_1..corner_4
+        # 通過するコーナーの数はコースで違うので、最後のコーナーを corner_4 にそろえる
+        strings = strings_of("passage_rate")
+        valid = pc.fill_null(
+            pc.match_substring_regex(strings, self.CORNERS_PATTERN), False)
+        strings = pc.if_else(valid, strings, None)
+        positions = pc.split_pattern(strings, "-")
+        lengths = pc.fill_null(pc.list_value_length(positions), 0).to_numpy()
+        flat = pc.list_flatten(positions).to_numpy(zero_copy_only=False).astype(float)
+        # 各値の、その行の最後のコーナーから数えた位置（0 が最後のコーナー）
+        rows = np.repeat(np.arange(len(lengths)), lengths)
+        from_end = np.repeat(np.cumsum(lengths), lengths) - 1 - np.arange(len(flat))
+        keep = from_end < self.N_CORNERS
+        corners = np.full((len(raw), self.N_CORNERS), np.nan)
+        corners[rows[keep], self.N_CORNERS - 1 - from_end[keep]] = flat[keep]
+        for i in range(self.N_CORNERS):
+            frame[f"corner_{i + 1}"] = as_int(corners[:, i])
+        # DB の smallint[] 用の配列リテラル
+        frame["corners"] = pc.binary_join_element_wise(
+            "{", pc.replace_substring(strings, "-", ","), "}", "").to_numpy(
+                zero_copy_only=False)
+        reject("passage_rate", strings_of("passage_rate"),
+               np.where(valid.to_numpy(zero_copy_only=False), 0.0, np.nan))
+
+        return pd.DataFrame(frame, index=raw.index), rejects
+
+    # normalize() で pyarrow.compute に渡す正規表現（RE2）
+    #   タイム: 1:34.5 / 59.9、着差: 1.1/2 / 3/4 / 2、通過順: 3-3-2-1
+    TIME_PATTERN = r"^(?:(?P<minutes>\d+):)?(?P<seconds>\d+(?:\.\d+)?)$"
+    MARGIN_PATTERN = r"^(?P<whole>\d+)?(?:\.?(?P<num>\d)/(?P<den>\d))?$"
+    CORNERS_PATTERN = r"^\d+(?:-\d+)*$"
+    NUMBER_PATTERN = r"^[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?$"
+
+    # extract_regex の結果の name の部分を数値にする（一致しない・空は NaN）
+    @staticmethod
+    def _group(parts, name) -> np.ndarray:
+        group = pc.struct_field(parts, name)
+        group = pc.if_else(pc.equal(group, ""), None, group)
+        return pc.cast(group, pa.float64()).to_numpy(zero_copy_only=False)
+
+    # columns の順のタプル（欠損は None）。RaceResultDAO の投入メソッドにそのまま渡せる
+    @classmethod
+    def to_tuples(cls, frame: pd.DataFrame, columns) -> Iterable[tuple]:
+        values = []
+        for column in columns:
+            array = frame[column].array
+            if isinstance(array, pd.arrays.NumpyExtensionArray):
+                array = array.to_numpy()
+                values.append(np.where(pd.isna(array), None, array).tolist())
+            else:
+                values.append(array.to_numpy(dtype=object, na_value=None).tolist())
+        return zip(*values)
+
+
+def merge_rejects(total: dict[str, Counter], rejects: dict[str, Counter]) -> None:
+    for column, counter in rejects.items():
+        total.setdefault(column, Counter()).update(counter)
+
+
+def report_rejects(rejects: dict[str, Counter], n_samples=5) -> None:
+    for column, counter in sorted(rejects.items()):
+        samples = ", ".join(f"{value!r} x{n}"
+                            for value, n in counter.most_common(n_samples))
+        print(f"rejected {column}: {sum(counter.values())} ({samples})")
@@ -0,0 +1,89 @@
+from typing import NamedTuple
+
+from lib.metrics.metrics import get_metrics
+
+
+class InvalidPageException(Exception):
+    # lib.scraping.retry.classify での分類（再試行する）
+    error_class = "invalid_page"
+
+    def __init__(self, kind, reason):
+        super().__init__(f"{kind}: {reason}")
+        self.kind = kind
+        self.reason = reason
+
+
+class PageRule(NamedTuple):
+    min_bytes: int
+    max_bytes: int
+    # すべて含まれていること（解析に使う要素の class / id）
+    required: tuple[str, ...]
+
+
+# ページの種類ごとの条件
+PAGE_RULES = {
+    "race_calendar": PageRule(2_000, 5_000_000, ("Calendar_Table",)),
+    "race_list": PageRule(2_000, 5_000_000, ("RaceList_DataItem",)),
+    "race_result": PageRule(5_000, 5_000_000,
+                            ("RaceList_NameBox", "All_Result_Table")),
+    "horse": PageRule(3_000, 5_000_000, ("horse_title", "db_prof_table")),
+    "ped": PageRule(3_000, 5_000_000, ("blood_table",)),
+}
+
+# エラーページ・アクセス制限・ボット判定のページに現れる文字列
+BLOCKED_FINGERPRINTS = (
+    "アクセスが集中",
+    "しばらく時間をおいて",
+    "ただいまアクセスが",
+    "不正なアクセス",
+    "Access Denied",
+    "403 Forbidden",
+    "503 Service",
+    "Just a moment...",
+    "cf-browser-verification",
+    "captcha",
+)
+# 最後まで読み込めたページの終わり（ここから後ろだけを見る）
+TAIL_BYTES = 512
+
+
+# ページの内容を確かめ、保存してよければ None、よくなければその理由を返す
+#   too_small / too_large: 大きさが PAGE_RULES の範囲外
+#   truncated:             </html> で終わっていない（読み込みが途中で切れた）
+#   blocked:{文字列}:       エラーページ・アクセス制限のページ
+#   missing:{文字列}:       解析に使う要素がない
+# 文字列の検索だけで HTML は解析しないので、保存済みのページ全体の監査にも使える
+def check_page(kind, source: str):
+    rule = PAGE_RULES.get(kind)
+    if rule is None:
+        return None
+    size = len(source.encode("utf-8"))
+    if size < rule.min_bytes:
+        # 小さいページはエラーページのことが多いので、先に理由を探す
+        return _blocked(source) or "too_small"
+    if size > rule.max_bytes:
+        return "too_large"
+    if "</html>" not in source[-TAIL_BYTES:].lower():
+        return "truncated"
+    for marker in rule.required:
+        if marker not in source:
+            return _blocked(source) or f"missing:{marker}"
+    return None
+
+
+def _blocked(source: str):
+    lowered = source.lower()
+    for fingerprint in BLOCKED_FINGERPRINTS:
+        if fingerprint.lower() in lowered:
+            return f"blocked:{fingerprint}"
+    return None
+
+
+# 保存してよいページならそのまま返し、よくなければ InvalidPageException を投げる
+def validate_page(kind, source: str) -> str:
+    reason = check_page(kind, source)
+    if reason:
+        get_metrics().count("invalid_pages_total", kind=kind,
+                            reason=reason.split(":")[0])
+        raise InvalidPageException(kind, reason)
+    return source
@@ -0,0 +1,271 @@
+import concurrent.futures
+import os
+import queue
+import threading
+import traceback
+from abc import ABC, abstractmethod
+from collections import Counter
+from functools import partial
+from itertools import islice
+
+from tqdm import tqdm
+
+from lib.dao.horse_dao import HorseDAO
+from lib.dao.race_result_dao import RaceResultDAO
+from lib.metrics.metrics import collect, get_metrics, merge_collected
+from lib.scraping.html_parser import HtmlParser
+from lib.scraping.normalizer import merge_rejects, report_rejects
+from lib.scraping.race_result_batch import RaceResultBatch
+from lib.scraping.scraping import Scraper
+from lib.storage.page_store import PageStore
+
+
+class ParseLoadPipeline(ABC):
+    # 保存済みのページを解析しながら DB に流し込む
+    #   プロセスプール: chunksize ページずつ解析し、DB に入れる値だけを返す
+    #   メインスレッド: 同時に投入しておくタスクを max_pending に抑える
+    #   書き込みスレッド: 長さ queue_size のキューから受け取り COPY でまとめて投入する
+    # 解析済みの結果を全部メモリに溜めないので、対象が多くても使用メモリは一定
+    #
+    # サブクラスは KIND、DESC、DAO と _parse / _load を定義する
+    # _parse は (key, 親テーブルのタプル or None, [子テーブルのタプル]) を返す
+    # チャンク単位でまとめて変換したいときは _pack / _payload_size も定義する
+    KIND = None
+    DESC = None
+    DAO = None
+    CHUNKSIZE = 64
+    QUEUE_SIZE = 8
+
+    def __init__(self, store: PageStore, parser: HtmlParser = None,
+                 dao_factory=None, chunksize=CHUNKSIZE,
+                 queue_size=QUEUE_SIZE, max_workers=None,
+                 load_chunk_size=RaceResultDAO.CHUNK_SIZE, manifest=None):
+        self.store = store
+        self.manifest = manifest
+        self.parser = parser or HtmlParser()
+        self.dao_factory = dao_factory or self.DAO
+        self.chunksize = chunksize
+        self.queue_size = queue_size
+        self.max_workers = max_workers
+        self.load_chunk_size = load_chunk_size
+        self.error = None
+        self.rejects = {}
+
+    @classmethod
+    @abstractmethod
+    def _parse(cls, store, parser, key):
+        pass
+
+    # チャンク分の _parse の結果を (keys, payload, 列ごとの変換できなかった値) にまとめる
+    # payload はキューで書き込みスレッドに渡り、_load がまとめて受け取る
+    # 既定の payload は ([親テーブルのタプル], [子テーブルのタプル])
+    @classmethod
+    def _pack(cls, results) -> tuple[list, object, dict[str, Counter]]:
+        keys = [key for key, _, _ in results]
+        heads = [head for _, head, _ in results if head is not None]
+        rows = [row for _, _, child_rows in results for row in child_rows]
+        return keys, (heads, rows), {}
+
+    # payload の行数（これが load_chunk_size に達したら投入する）
+    @classmethod
+    def _payload_size(cls, payload) -> int:
+        heads, rows = payload
+        return len(heads) + len(rows)
+
+    # 既定の payload のリストを ([親テーブルのタプル], [子テーブルのタプル]) にする
+    @classmethod
+    def _merge(cls, payloads) -> tuple[list, list]:
+        return ([head for heads, _ in payloads for head in heads],
+                [row for _, rows in payloads for row in rows])
+
+    # payload のリストを投入し、(親テーブルの行数, 子テーブルの行数) を返す
+    @abstractmethod
+    def _load(self, dao, payloads) -> tuple[int, int]:
+        pass
+
+    # 全部投入し終えた後の処理
+    def _finish(self, dao) -> None:
+        pass
+
+    @classmethod
+    def _parse_chunk(cls, store, parser, keys):
+        results = []
+        for key in keys:
+            # 取得できなかったページ（crawl_failure に記録済み）は飛ばす
+            if not store.exists(cls.KIND, key):
+                get_metrics().count("missing_pages_total", kind=cls.KIND)
+                continue
+            try:
+                result = cls._parse(store, parser, key)
+            except Exception:
+                print(f"Exception: {cls.KIND}/{key}")
+                print(traceback.format_exc())
+                continue
+            if result:
+                results.append(result)
+        return cls._pack(results)
+
+    def _writer(self, q, counts):
+        dao = self.dao_factory()
+        keys = []
+        payloads = []
+        size = 0
+
+        def flush():
+            nonlocal size
+            n_heads, n_rows = self._load(dao, payloads)
+            counts[0] += n_heads
+            counts[1] += n_rows
+            if self.manifest:
+                for key in keys:
+                    self.manifest.record_loaded(self.KIND, key)
+            keys.clear()
+            payloads.clear()
+            size = 0
+
+        while True:
+            item = q.get()
+            if item is None:
+                break
+            # 書き込みに失敗した後もキューは読み続け、解析側を止めない
+            if self.error:
+                continue
+            try:
+                chunk_keys, payload, rejects = item
+                merge_rejects(self.rejects, rejects)
+                keys.extend(chunk_keys)
+                payloads.append(payload)
+                size += self._payload_size(payload)
+                if size >= self.load_chunk_size:
+                    flush()
+            except Exception as e:
+                self.error = e
+                print(traceback.format_exc())
+
+        if not self.error:
+            try:
+                if keys:
+                    flush()
+                self._finish(dao)
+            except Exception as e:
+                self.error = e
+                print(traceback.format_exc())
+        if self.manifest:
+            self.manifest.flush()
+
+    # 投入した (親テーブルの行数, 子テーブルの行数) を返す
+    def run(self, keys, total=None) -> tuple[int, int]:
+        # 子プロセスで集計した値（get_metrics()）はチャンクの結果と一緒に受け取る
+        parse_chunk = partial(collect, partial(type(self)._parse_chunk,
+                                               self.store, self.parser))
+        q = queue.Queue(maxsize=self.queue_size)
+        counts = [0, 0]
+        writer = threading.Thread(target=self._writer, args=(q, counts))
+        writer.start()
+
+        it = iter(keys)
+        try:
+            max_workers = self.max_workers or os.cpu_count() or 1
+            with concurrent.futures.ProcessPoolExecutor(max_workers) as executor, \
+                    tqdm(total=total, desc=self.DESC) as pbar:
+                max_pending = max_workers * 2
+                # future → 担当するページ数
+                pending = {}
+                while True:
+                    while len(pending) < max_pending:
+                        chunk = list(islice(it, self.chunksize))
+                        if not chunk:
+                            break
+                        pending[executor.submit(parse_chunk, chunk)] = len(chunk)
+                    if not pending:
+                        break
+                    done, _ = concurrent.futures.wait(
+                        pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        q.put(merge_collected(future.result()))
+                        pbar.update(pending.pop(future))
+                    if self.error:
+                        break
+        finally:
+            q.put(None)
+            writer.join()
+
+        if self.error:
+            raise self.error
+        report_rejects(self.rejects)
+        return counts[0], counts[1]
+
+
+class RaceResultPipeline(ParseLoadPipeline):
+    KIND = "race_result"
+    DESC = "レース結果の取得"
+    DAO = RaceResultDAO
+
+    # (race_id, RaceResult) を返す
+    @classmethod
+    def _parse(cls, store, parser, race_id):
+        result = Scraper._scrape_race_result_drivefunc(store, parser, race_id)
+        if result:
+            return race_id, result
+
+    # チャンク分のレースを RaceResultBatch にし、型の変換もまとめて行う
+    # 列ごとの配列で渡すので、プロセス間の pickle も投入も1行ずつのタプルより軽い
+    @classmethod
+    def _pack(cls, results):
+        batch, rejects = RaceResultBatch.from_results(
+            result for _, result in results)
+        return [race_id for race_id, _ in results], batch, rejects
+
+    @classmethod
+    def _payload_size(cls, batch):
+        return len(batch.races) + len(batch.rows) + len(batch.payouts)
+
+    def _load(self, dao, batches):
+        batch = RaceResultBatch.concat(batches)
+        n_races = dao.insert_race_info_frame(batch.races, self.load_chunk_size)
+        n_rows = dao.insert_race_result_frame(batch.rows, self.load_chunk_size)
+        dao.insert_payout_frame(batch.payouts, self.load_chunk_size)
+        return n_races, n_rows
+
+    def _finish(self, dao):
+        dao.fill_race_dates()
+
+
+class HorsePipeline(ParseLoadPipeline):
+    KIND = "horse"
+    DESC = "馬の解析"
+    DAO = HorseDAO
+
+    @classmethod
+    def _parse(cls, store, parser, horse_id):
+        horse, history = Scraper._scrape_horse_drivefunc(
+            store, parser, horse_id)
+        return (
+            horse_id,
+            HorseDAO._horse_values(horse),
+            [HorseDAO._horse_history_values(row) for row in history],
+        )
+
+    def _load(self, dao, payloads):
+        heads, rows = self._merge(payloads)
+        return (dao.insert_horse_tuples(heads, self.load_chunk_size),
+                dao.insert_horse_history_tuples(rows, self.load_chunk_size))
+
+
+class PedigreePipeline(ParseLoadPipeline):
+    KIND = "ped"
+    DESC = "血統表の解析"
+    DAO = HorseDAO
+
+    @classmethod
+    def _parse(cls, store, parser, horse_id):
+        rows = Scraper._scrape_ped_drivefunc(store, parser, horse_id)
+        return (
+            horse_id,
+            None,
+            [HorseDAO._pedigree_values(row) for row in rows],
+        )
+
+    def _load(self, dao, payloads):
+        _, rows = self._merge(payloads)
+        return 0, dao.insert_pedigree_tuples(rows, self.load_chunk_size)
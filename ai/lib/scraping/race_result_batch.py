@@ -0,0 +1,119 @@
+from collections import Counter
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from lib.dao.race_result_dao import RaceResult, RaceResultDAO
+from lib.scraping.normalizer import RaceResultNormalizer
+
+
+class RaceResultBatch():
+    # 複数レースの解析結果を列ごとの配列で持つ
+    #   races: 1レース1行（RaceResultDAO.RACE_INFO_COLUMNS）
+    #   rows:  1頭1行（RaceResultNormalizer で型を変換した列）
+    #   offsets: races の i 番目のレースの着順は rows[offsets[i]:offsets[i + 1]]
+    #   payouts: 払い戻し1件1行（RaceResultDAO.PAYOUT_COLUMNS）
+    # 文字列の列は category 型（コード + 重複のない値）にして、
+    # 騎手名や調教師名のように同じ値が多い列のメモリと pickle の量を減らす
+    __slots__ = ("races", "rows", "offsets", "payouts")
+
+    def __init__(self, races: pd.DataFrame, rows: pd.DataFrame,
+                 offsets: np.ndarray, payouts: pd.DataFrame):
+        self.races = races
+        self.rows = rows
+        self.offsets = offsets
+        self.payouts = payouts
+
+    def __len__(self):
+        return len(self.rows)
+
+    @classmethod
+    def _compact(cls, frame: pd.DataFrame) -> pd.DataFrame:
+        for column in frame.columns:
+            if frame[column].dtype == object:
+                frame[column] = frame[column].astype("category")
+        return frame
+
+    # (RaceResultBatch, 列ごとの変換できなかった値) を返す
+    @classmethod
+    def from_results(cls, results: Iterable[RaceResult],
+                     normalizer: RaceResultNormalizer = None
+                     ) -> tuple["RaceResultBatch", dict[str, Counter]]:
+        normalizer = normalizer or RaceResultNormalizer()
+        results = [result for result in results if result]
+
+        races = pd.DataFrame.from_records(
+            [RaceResultDAO._race_info_values(result.race_info)
+             for result in results],
+            columns=list(RaceResultDAO.RACE_INFO_COLUMNS))
+        for column in ("no", "length"):
+            races[column] = races[column].astype("Int64")
+
+        raw = normalizer.to_frame(
+            row for result in results for row in result.race_order)
+        rows, rejects = normalizer.normalize(raw)
+        race_of_row = np.repeat(np.arange(len(results)),
+                                [len(result.race_order) for result in results])
+        # 馬番は race_result の主キーなので、馬番のない行は落として変換できなかった値に数える
+        #   数字でない馬番は normalize() で数えてあるので、欠損の分だけ足す
+        dropped = rows["umaban"].isna().to_numpy()
+        if dropped.any():
+            values = raw["umaban"][dropped]
+            missing = values[values.isna() | values.isin(normalizer.MISSING)]
+            if len(missing):
+                rejects.setdefault("umaban", Counter()).update(missing.tolist())
+            rows = rows[~dropped].reset_index(drop=True)
+            race_of_row = race_of_row[~dropped]
+        offsets = np.zeros(len(results) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(race_of_row, minlength=len(results)),
+                  out=offsets[1:])
+
+        payouts = pd.DataFrame.from_records(
+            [values for result in results
+             for values in RaceResultDAO._payout_values(result.race_id, result.payout)],
+            columns=list(RaceResultDAO.PAYOUT_COLUMNS))
+        for column in ("horse_1", "horse_2", "horse_3", "payout", "ninki"):
+            payouts[column] = payouts[column].astype("Int64")
+
+        return cls(cls._compact(races), cls._compact(rows), offsets,
+                   cls._compact(payouts)), rejects
+
+    @classmethod
+    def _concat_frames(cls, frames: list[pd.DataFrame]) -> pd.DataFrame:
+        frames = [frame.copy() for frame in frames]
+        # category 型は値の集合がそろっていないと object 型に戻るので先にそろえる
+        for column in frames[0].columns:
+            if isinstance(frames[0][column].dtype, pd.CategoricalDtype):
+                categories = union_categoricals(
+                    [frame[column] for frame in frames],
+                    ignore_order=True).categories
+                for frame in frames:
+                    frame[column] = frame[column].cat.set_categories(categories)
+        return pd.concat(frames, ignore_index=True)
+
+    @classmethod
+    def concat(cls, batches: list["RaceResultBatch"]) -> "RaceResultBatch":
+        if len(batches) == 1:
+            return batches[0]
+        offsets = [batches[0].offsets]
+        for batch in batches[1:]:
+            offsets.append(batch.offsets[1:] + offsets[-1][-1])
+        return cls(cls._concat_frames([batch.races for batch in batches]),
+                   cls._concat_frames([batch.rows for batch in batches]),
+                   np.concatenate(offsets),
+                   cls._concat_frames([batch.payouts for batch in batches]))
+
+    # i 番目のレースの (races の行, 着順の DataFrame)
+    def race(self, i) -> tuple[pd.Series, pd.DataFrame]:
+        return (self.races.iloc[i],
+                self.rows.iloc[self.offsets[i]:self.offsets[i + 1]])
+
+    # 文字列の列を object 型に戻した (races, rows, payouts)
+    def to_pandas(self) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+        def expand(frame):
+            return frame.astype({
+                column: object for column in frame.columns
+                if isinstance(frame[column].dtype, pd.CategoricalDtype)})
+        return expand(self.races), expand(self.rows), expand(self.payouts)
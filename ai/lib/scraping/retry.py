@@ -0,0 +1,111 @@
+import asyncio
+import random
+import time
+
+import requests
+from selenium.common.exceptions import (InvalidSessionIdException,
+                                        TimeoutException, WebDriverException)
+
+from lib.metrics.metrics import get_metrics
+
+# 取得の失敗の分類
+#   timeout:      ページの読み込み・要素の待ち・HTTP の時間切れ
+#   connection:   接続できない、接続が切れた
+#   rate_limited: 429（Retry-After があればその秒数以上待つ）
+#   server_error: 5xx
+#   page_load:    読み込めたが必要な要素がない（PageLoadException など error_class を持つ例外）
+#   invalid_page: エラーページ・途中で切れたページ（lib.scraping.page_validator）
+#   session:      Selenium のセッションが切れた（SeleniumPool が作り直したセッションで再試行する）
+#   not_found / client_error: 404 / それ以外の 4xx（再試行しない）
+#   unknown:      上のどれでもない（解析・保存の不具合など。再試行しない）
+RETRYABLE = ("timeout", "connection", "rate_limited", "server_error",
+             "page_load", "invalid_page", "session")
+
+
+def classify(e: BaseException) -> str:
+    error_class = getattr(e, "error_class", None)
+    if error_class:
+        return error_class
+    if isinstance(e, requests.HTTPError) and e.response is not None:
+        status = e.response.status_code
+        if status == 404:
+            return "not_found"
+        if status == 429:
+            return "rate_limited"
+        if status >= 500:
+            return "server_error"
+        return "client_error"
+    if isinstance(e, (requests.Timeout, TimeoutException)):
+        return "timeout"
+    if isinstance(e, InvalidSessionIdException):
+        return "session"
+    if isinstance(e, (requests.ConnectionError, ConnectionError)):
+        return "connection"
+    if isinstance(e, WebDriverException):
+        return "session" if "session" in str(e).lower() else "connection"
+    return "unknown"
+
+
+def _retry_after(e: BaseException) -> float:
+    response = getattr(e, "response", None)
+    if response is None:
+        return 0.0
+    try:
+        return float(response.headers.get("Retry-After", 0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class RetryPolicy():
+    # 再試行できる失敗は指数バックオフ（full jitter）で max_attempts 回まで試す
+    #   attempt 回目の失敗の後の待ち: [0, min(cap, base * 2 ** (attempt - 1))) の一様乱数
+    # 複数ワーカーが同じ時刻にそろって再試行しないよう、待ち時間はばらつかせる
+    MAX_ATTEMPTS = 4
+    BASE = 2.0
+    CAP = 60.0
+
+    def __init__(self, max_attempts=MAX_ATTEMPTS, base=BASE, cap=CAP,
+                 rng=None):
+        self.max_attempts = max_attempts
+        self.base = base
+        self.cap = cap
+        self.rng = rng or random.Random()
+
+    def delay(self, attempt, e: BaseException = None) -> float:
+        delay = self.rng.uniform(0, min(self.cap, self.base * 2 ** (attempt - 1)))
+        if e is not None:
+            delay = max(delay, min(self.cap, _retry_after(e)))
+        return delay
+
+    # 再試行するなら待つ秒数、しないなら None
+    def _next(self, attempt, e, kind):
+        error_class = classify(e)
+        if error_class not in RETRYABLE or attempt >= self.max_attempts:
+            return None
+        get_metrics().count("retries_total", kind=kind, error=error_class)
+        return self.delay(attempt, e)
+
+    # func() の結果を返す。諦めたときは最後の例外をそのまま投げる
+    def call(self, func, kind=None):
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return func()
+            except Exception as e:
+                delay = self._next(attempt, e, kind)
+                if delay is None:
+                    raise
+            time.sleep(delay)
+
+    async def acall(self, func, kind=None):
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return await func()
+            except Exception as e:
+                delay = self._next(attempt, e, kind)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
@@ -1,24 +1,40 @@
-import os
+import math
 import re
-import time
 import traceback
-from datetime import datetime, timedelta
-from urllib.parse import urlencode
+from datetime import date as date_type, datetime, timedelta
+from urllib.parse import urlencode, urlparse
 import concurrent.futures
+from functools import partial
 
-from bs4 import BeautifulSoup
 from dateutil.relativedelta import relativedelta
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait
 from tqdm import tqdm
-from tqdm.contrib import tenumerate
 
-from lib.dao.race_result_dao import RaceInfo, RaceResult_Row, RaceResult, RaceResultDAO
+from lib.dao.crawl_task_dao import CrawlTaskDAO
+from lib.dao.horse_dao import Horse, HorseHistory_Row, Pedigree_Row
+from lib.dao.race_result_dao import (HaronTime, PayoutRow, RaceInfo,
+                                    RaceResult_Row, RaceResult, RaceResultDAO,
+                                    lap_seconds)
+from lib.metrics.metrics import (BYTES_BUCKETS, collect, get_metrics,
+                                 merge_collected)
+from lib.scraping.async_downloader import AsyncDownloader
+from lib.scraping.crawl_queue import CrawlQueue, worker_name
+from lib.scraping.freshness import SETTLE_INTERVALS, FreshnessPolicy
+from lib.scraping.html_parser import HtmlParser
+from lib.scraping.http_fetcher import HttpFetcher
+from lib.scraping.page_validator import check_page, validate_page
+from lib.scraping.rate_limit import HostRateLimiter
+from lib.scraping.retry import RetryPolicy, classify
+from lib.scraping.selenium_pool import SeleniumPool
+from lib.storage.page_store import get_page_store
 
 
 class ScrapingException(Exception):
+    # lib.scraping.retry.classify での分類（再試行する）
+    error_class = "page_load"
+
     def __init__(self, arg=""):
         self.arg = arg
 
@@ -38,99 +54,324 @@ class Downloader:
     HORSE_DETAIL = "https://db.netkeiba.com/horse"
     PED_DETAIL = "https://db.netkeiba.com/horse/ped"
 
-    def __init__(self, id, proxy=None):
+    # ブラウザを使わずに HTTP で取得するホスト（サーバ側でレンダリング済み）
+    HTTP_HOSTS = ("db.netkeiba.com",)
+
+    # rate: ホストごとの1秒あたりのリクエスト数、burst: 連続して送れる数
+    # concurrency > 1 のとき db.netkeiba.com のページを asyncio で並行取得する
+    # manifest: 取得したページを記録する CrawlStateDAO（省略可）
+    # retry: 失敗したときの再試行（RetryPolicy）
+    # dead_letters: 再試行しても取得できなかったページを記録する CrawlFailureDAO（省略可）
+    # selenium: race.netkeiba.com のページを読み込む SeleniumPool
+    #   （省略すると id 番の Selenium サーバにセッション1つで接続する）
+    # freshness: 保存済みの開催日・レース一覧のページを取り直すかを決める FreshnessPolicy
+    def __init__(self, id, proxy=None, rate=1 / WAIT_TIME, burst=1,
+                 concurrency=1, store=None, manifest=None, retry=None,
+                 dead_letters=None, selenium=None, freshness=None):
+        self.id = id
+        self.proxy = proxy
+        self.store = store or get_page_store()
+        self.manifest = manifest
+        self.retry = retry or RetryPolicy()
+        self.dead_letters = dead_letters
+        self.freshness = freshness or FreshnessPolicy()
+        # preload_fetched_at() で読み込んだ (kind, key) → 取得日時（記録がなければ None）
+        self._fetched_at = {}
+        self.concurrency = concurrency
+        self.http = HttpFetcher(proxy, pool_size=max(10, concurrency))
+        self.rate_limiter = HostRateLimiter(rate, burst)
+        # Selenium は JavaScript でレンダリングされる race.netkeiba.com のページ
+        # にだけ必要なので、セッションは初めて使うときに接続する
+        self.selenium = selenium or SeleniumPool(
+            self.command_executor(id), proxy=proxy)
+
+    @classmethod
+    def command_executor(cls, id):
         PORT = 4444 + id
-        # COMMAND_EXECUTOR = f"http://selenium:{PORT}/wd/hub"
-        COMMAND_EXECUTOR = f"http://host.docker.internal:{PORT}/wd/hub"
-        options = webdriver.ChromeOptions()
-        # options.add_argument('--headless=new')
-        # options.add_argument('--disable-gpu')
-        # options.add_argument('--no-sandbox')
-        # options.add_argument('--disable-dev-shm-usage')
-        # options.add_argument('--disable-extensions')
-        # prefs = {'profile.managed_default_content_settings.images': 2}
-        # options.add_experimental_option('prefs', prefs)
-        if proxy:
-            options.add_argument(f"--proxy-server={proxy}:3128")
-        self.driver = webdriver.Remote(
-            command_executor=COMMAND_EXECUTOR, options=options
-        )
+        # return f"http://selenium:{PORT}/wd/hub"
+        return f"http://host.docker.internal:{PORT}/wd/hub"
 
     def __del__(self):
         try:
-            self.driver.quit()
+            self.http.close()
+            self.selenium.close()
         except ImportError:
             pass  # do nothing
 
-    def _download_source_from_race(self, base, params, filename, force=False):
-        if force or not os.path.isfile(filename):
+    # URL のホストから取得方法を選ぶ
+    def _use_http(self, url):
+        return urlparse(url).hostname in self.HTTP_HOSTS
+
+    def _save(self, kind, key, source):
+        metrics = get_metrics()
+        metrics.observe("page_bytes", len(source.encode("utf-8")),
+                        BYTES_BUCKETS, kind=kind)
+        with metrics.timer("save", kind=kind):
+            self.store.write(kind, key, source)
+            if self.manifest:
+                self.manifest.record_fetched(kind, key, source)
+
+    # fetch() を再試行しながら呼び、取得したページを保存する
+    # エラーページ・途中で切れたページは保存せずに再試行する（validate_page）
+    # 諦めたページは dead_letters に理由と一緒に記録し、False を返す
+    def _download(self, kind, key, url, fetch) -> bool:
+        try:
+            source = self.retry.call(lambda: validate_page(kind, fetch()), kind)
+            self._save(kind, key, source)
+            return True
+        except Exception as e:
+            print(traceback.format_exc())
+            self._dead_letter(kind, key, url, e)
+            return False
+
+    def _dead_letter(self, kind, key, url, e):
+        error_class = classify(e)
+        get_metrics().count("dead_letters_total", kind=kind, error=error_class)
+        if self.dead_letters:
             try:
-                url = f"{base}?{urlencode(params)}"
-                self.driver.get(url)
+                self.dead_letters.record(
+                    kind, key, url, error_class,
+                    "".join(traceback.format_exception_only(e)).strip())
+            except Exception:
+                print(traceback.format_exc())
+
+    # まとめて取得するページの取得日時を、manifest から1回の問い合わせで読み込んでおく
+    def preload_fetched_at(self, kind, keys) -> None:
+        if not self.manifest or kind not in self.freshness.rules:
+            return
+        keys = list(keys)
+        fetched_at = self.manifest.fetched_at_many(kind, keys)
+        for key in keys:
+            self._fetched_at[(kind, key)] = fetched_at.get(key)
+
+    def _last_fetched_at(self, kind, key):
+        if (kind, key) in self._fetched_at:
+            # 一度判定したら取り直している可能性があるので捨てる
+            return self._fetched_at.pop((kind, key))
+        return self.manifest.fetched_at(kind, key) if self.manifest else None
+
+    # 保存済みで、取り直さなくてよいページか
+    # 取得日時は manifest の記録、なければ保存先の更新日時を使う
+    # FreshnessPolicy の対象でない種類は、保存済みかどうかだけで決める
+    def _is_fresh(self, kind, key, entity_date=None) -> bool:
+        if not self.store.exists(kind, key):
+            return False
+        if kind not in self.freshness.rules or entity_date is None:
+            return True
+        fetched_at = self._last_fetched_at(kind, key)
+        if fetched_at is None:
+            fetched_at = self.store.modified_at(kind, key)
+        if self.freshness.is_fresh(kind, entity_date, fetched_at):
+            return True
+        get_metrics().count("stale_pages_total", kind=kind)
+        return False
+
+    # 段階ごとの時間・エラーは get_metrics() の stage_seconds / errors_total に記録する
+    # entity_date: ページの対象日（月初・開催日）。まだ確定していないページは
+    #   FreshnessPolicy の ttl が過ぎていれば取り直す
+    def _download_source_from_race(self, base, params, kind, key, force=False,
+                                   entity_date=None):
+        if force or not self._is_fresh(kind, key, entity_date):
+            url = f"{base}?{urlencode(params)}"
+            self._download(kind, key, url,
+                           lambda: self._get_rendered_page(base, url, kind))
+
+    # Selenium で読み込み、必要な要素が表示されてからのページを返す
+    # 切れたセッションはプールが捨て、再試行のときに接続し直す
+    def _get_rendered_page(self, base, url, kind):
+        metrics = get_metrics()
+        with self.selenium.session() as driver:
+            with metrics.timer("rate_wait", kind=kind):
+                self.rate_limiter.wait(urlparse(url).hostname)
+            with metrics.timer("selenium_get", kind=kind):
+                driver.get(url)
+            with metrics.timer("selenium_wait", kind=kind):
                 if base == self.RACE_LIST:
-                    elem = WebDriverWait(self.driver, 10).until(
+                    elem = WebDriverWait(driver, 10).until(
                         EC.visibility_of_element_located((By.ID, 'RaceTopRace')))
                     if not elem:
                         raise PageLoadException(url)
                 elif base == self.RACE_RESULT:
-                    elem = WebDriverWait(self.driver, 10).until(
+                    elem = WebDriverWait(driver, 10).until(
                         EC.visibility_of_element_located((By.CLASS_NAME, "RaceList_NameBox")))
                     if not elem:
                         raise PageLoadException(url)
-
-                with open(filename, "w") as f:
-                    f.write(self.driver.page_source)
-
-            except Exception:
-                print(traceback.format_exc())
-            finally:
-                time.sleep(1)
-
-    def _download_source_from_db(self, base, id, filename, force=False):
-        if force or not os.path.isfile(filename):
-            try:
-                url = f"{base}/{id}/"
-                self.driver.get(url)
-
-                with open(filename, "w") as f:
-                    f.write(self.driver.page_source)
-
-            except Exception:
-                print(traceback.format_exc())
-            finally:
-                time.sleep(1)
-
-    def download_kaisai_dates(self, kaisai_year_month, filename):
+            with metrics.timer("selenium_source", kind=kind):
+                return driver.page_source
+
+    def _download_source_from_db(self, base, id, kind, force=False):
+        if force or not self.store.exists(kind, id):
+            url = f"{base}/{id}/"
+            self._download(kind, id, url, lambda: self._get_db_page(url, kind))
+
+    def _get_db_page(self, url, kind):
+        metrics = get_metrics()
+        with metrics.timer("rate_wait", kind=kind):
+            self.rate_limiter.wait(urlparse(url).hostname)
+        if self._use_http(url):
+            with metrics.timer("http_fetch", kind=kind):
+                return self.http.fetch(url)
+        with self.selenium.session() as driver:
+            with metrics.timer("selenium_get", kind=kind):
+                driver.get(url)
+            with metrics.timer("selenium_source", kind=kind):
+                return driver.page_source
+
+    def download_kaisai_dates(self, kaisai_year_month, force=False):
         params = {
             "year": int(kaisai_year_month.year),
             "month": int(kaisai_year_month.month),
         }
-        self._download_source_from_race(self.RACE_CARENDAR, params, filename)
+        self._download_source_from_race(
+            self.RACE_CARENDAR, params, "race_calendar",
+            calendar_key(kaisai_year_month), force,
+            date_type(kaisai_year_month.year, kaisai_year_month.month, 1))
 
-    def download_race_list(self, kaisai_date, filename):
+    def download_race_list(self, kaisai_date, force=False):
         params = {
             "kaisai_date": kaisai_date.strftime("%Y%m%d")
         }
 
-        self._download_source_from_race(self.RACE_LIST, params, filename)
+        self._download_source_from_race(
+            self.RACE_LIST, params, "race_list", race_list_key(kaisai_date),
+            force, date_type(kaisai_date.year, kaisai_date.month, kaisai_date.day))
 
-    def download_race_result(self, race_id, filename):
+    def download_race_result(self, race_id, force=False):
         params = {
             "race_id": race_id
         }
-        self._download_source_from_race(self.RACE_RESULT, params, filename)
-
-    def download_horse_detail(self, horse_id, filename):
-        self._download_source_from_db(self.HORSE_DETAIL, horse_id, filename)
-
-    def download_ped_detail(self, horse_id, filename):
-        self._download_source_from_db(self.PED_DETAIL, horse_id, filename)
+        self._download_source_from_race(
+            self.RACE_RESULT, params, "race_result", race_id, force)
+
+    def download_horse_detail(self, horse_id, force=False):
+        self._download_source_from_db(
+            self.HORSE_DETAIL, horse_id, "horse", force)
+
+    def download_ped_detail(self, horse_id, force=False):
+        self._download_source_from_db(self.PED_DETAIL, horse_id, "ped", force)
+
+    def _download_sources_from_db(self, base, kind, ids, desc=None, total=None,
+                                  progress=True, force=False):
+        if self.concurrency > 1:
+            downloader = AsyncDownloader(
+                self.http, self.rate_limiter, self.store, self.concurrency,
+                self.manifest, self.retry, self._dead_letter)
+            downloader.run(((f"{base}/{id}/", kind, id) for id in ids),
+                           desc=desc, total=total, force=force,
+                           progress=progress)
+        else:
+            for id in tqdm(ids, desc=desc, total=total, disable=not progress):
+                self._download_source_from_db(base, id, kind, force)
+
+    def download_horse_details(self, horse_ids, desc=None, total=None,
+                               progress=True, force=False):
+        self._download_sources_from_db(
+            self.HORSE_DETAIL, "horse", horse_ids, desc, total, progress,
+            force)
+
+    def download_ped_details(self, horse_ids, desc=None, total=None,
+                             progress=True, force=False):
+        self._download_sources_from_db(
+            self.PED_DETAIL, "ped", horse_ids, desc, total, progress, force)
+
+    # Selenium のセッション数だけ並行に func(item) を呼ぶ
+    def _download_concurrently(self, func, items, desc=None, progress=False):
+        items = list(items)
+        with tqdm(total=len(items), desc=desc, disable=not progress) as pbar:
+            if self.selenium.size <= 1:
+                for item in items:
+                    func(item)
+                    pbar.update(1)
+                return
+            with concurrent.futures.ThreadPoolExecutor(self.selenium.size) as executor:
+                for _ in executor.map(func, items):
+                    pbar.update(1)
+
+    def download_race_lists(self, kaisai_dates, force=False, desc=None):
+        if not force:
+            self.preload_fetched_at(
+                "race_list", [race_list_key(d) for d in kaisai_dates])
+        self._download_concurrently(
+            lambda kaisai_date: self.download_race_list(kaisai_date, force),
+            kaisai_dates, desc, progress=True)
+
+    def download_race_results(self, race_ids, force=False):
+        self._download_concurrently(
+            lambda race_id: self.download_race_result(race_id, force),
+            race_ids)
+
+    # ページの種類とキー（PageStore と同じもの）で取得する
+    def download_by_key(self, kind, key, force=False):
+        if kind == "race_calendar":
+            year, month = key.split("-")
+            self.download_kaisai_dates(datetime(int(year), int(month), 1), force)
+        elif kind == "race_list":
+            self.download_race_list(datetime.strptime(key, "%Y-%m-%d"), force)
+        elif kind == "race_result":
+            self.download_race_result(key, force)
+        elif kind == "horse":
+            self.download_horse_detail(key, force)
+        elif kind == "ped":
+            self.download_ped_detail(key, force)
+        else:
+            raise ValueError(f"unknown kind: {kind}")
+
+    def _has_valid_page(self, kind, key) -> bool:
+        return (self.store.exists(kind, key)
+                and check_page(kind, self.store.read(kind, key)) is None)
+
+    # dead_letters に残っているページだけを取得し直し、(取得できた数, 残った数) を返す
+    # 保存済みでも内容がおかしいページ（tools.audit_pages で記録したもの）は上書きする
+    # 正しいページがあるもの（他のワーカーが取得済みのものも）は解決済みにする
+    def retry_failed(self, kinds=None, error_classes=None) -> tuple[int, int]:
+        failures = self.dead_letters.unresolved(kinds, error_classes)
+        resolved = 0
+        for kind, key in tqdm(failures, desc="失敗したページの再取得"):
+            if not self._has_valid_page(kind, key):
+                self.download_by_key(kind, key, force=True)
+            if self._has_valid_page(kind, key):
+                resolved += self.dead_letters.resolve(kind, [key])
+        if self.manifest:
+            self.manifest.flush()
+        return resolved, len(failures) - resolved
 
 
 class Scraper():
-    def __init__(self, downloader, period):
+    # ページごとに解析に必要な部分木（HtmlParser の partial 用）
+    CALENDAR_PARTS = (("class", "Calendar_Table"),)
+    RACE_LIST_PARTS = (("class", "RaceList_DataItem"),)
+    RACE_RESULT_PARTS = (
+        ("class", "RaceList_NameBox"),
+        ("id", "All_Result_Table"),
+        ("class", "FullWrap"),
+        ("class", "Race_HaronTime"),
+    )
+    HORSE_PARTS = (
+        ("class", "horse_title"),
+        ("class", "db_prof_table"),
+        ("class", "blood_table"),
+        ("class", "db_h_race_results"),
+    )
+    PED_PARTS = (("class", "blood_table"),)
+    # 解析結果の形式・内容を変えたら、その種類のバージョンを上げる
+    # （HtmlParser の cache に保存した古いバージョンの結果は使われなくなる）
+    PARSER_VERSIONS = {
+        "race_calendar": 1,
+        "race_list": 1,
+        "race_result": 1,
+    }
+
+    # incremental: crawl_state を見て、新しいもの・変わったものだけを処理する
+    def __init__(self, downloader, period, store=None, parser=None,
+                 manifest=None, incremental=False):
         self.downloader = downloader
         self.period = period
+        self.store = store or downloader.store
+        self.parser = parser or HtmlParser()
+        self.manifest = manifest or downloader.manifest
+        self.incremental = incremental
+        if incremental and not self.manifest:
+            raise ValueError("incremental mode requires a manifest")
         self.kaisai_dates = []
         self.race_id_list = []
         self.race_results: list[RaceResult] = []
@@ -258,7 +499,8 @@ class Scraper():
                             tmp_id = match[0]
                             tmp.trainer_id = tmp_id
 
-                result.append(tmp)
+                    # 列のそろっていない行（空の行など）は着順に入れない
+                    result.append(tmp)
 
         return result
 
@@ -299,10 +541,6 @@ class Scraper():
                         target_elems = td_elems[0].find_all("ul")
 
                     for i in range(count):
-                        tmp = {}
-                        tmp["payout"] = cls._my_trim(payout_text_list[i]) + "円"
-                        tmp["ninki"] = cls._my_trim(span_elems[i].text)
-
                         target_str = ""
                         if class_name == "tansho" or class_name == "fukusho":
                             target_str = cls._my_trim(target_elems[i*3].text)
@@ -315,9 +553,10 @@ class Scraper():
                             # 先頭の文字を削除
                             target_str = target_str.lstrip("-")
 
-                        tmp["result"] = target_str
-
-                        row_list.append(tmp)
+                        row_list.append(PayoutRow(
+                            cls._my_trim(payout_text_list[i]) + "円",
+                            cls._my_trim(span_elems[i].text),
+                            target_str))
 
                 result[class_name] = row_list
 
@@ -353,12 +592,191 @@ class Scraper():
 
         if len(row_list) > 0:
             for i in range(len(row_list[0])):
-                tmp = {}
-                tmp["header"] = row_list[0][i]
-                tmp["haron_time_1"] = row_list[1][i]
-                tmp["haron_time_2"] = row_list[2][i]
+                result.append(HaronTime(
+                    row_list[0][i], row_list[1][i], row_list[2][i]))
+
+        return result
+
+    # 馬のプロフィールの抽出
+    @classmethod
+    def _get_horse_profile(cls, soup, horse_id):
+        result = Horse()
+        result.horse_id = horse_id
+
+        elem_base = soup.find(class_="horse_title")
+        if elem_base:
+            tmp_elem = elem_base.find("h1")
+            if tmp_elem:
+                result.name = cls._my_trim(tmp_elem.text)
+
+            # 現役　牡3歳　鹿毛
+            tmp_elem = elem_base.find("p", class_="txt_01")
+            if tmp_elem:
+                tmp_data_list = cls._my_trim(tmp_elem.text).split()
+                if len(tmp_data_list) >= 3:
+                    result.status = tmp_data_list[0]
+                    result.sex = tmp_data_list[1][:1]
+                    result.coat_color = tmp_data_list[2]
+
+        elem_base = soup.find("table", class_="db_prof_table")
+        if elem_base:
+            for tr_elem in elem_base.find_all("tr"):
+                th_elem = tr_elem.find("th")
+                td_elem = tr_elem.find("td")
+                if not th_elem or not td_elem:
+                    continue
+                header = cls._my_trim(th_elem.text)
+                text = cls._my_trim(td_elem.text)
+
+                if header == "生年月日":
+                    result.birthday = text
+                elif header == "産地":
+                    result.birthplace = text
+                elif header == "セリ取引価格":
+                    result.sale_price = text
+                elif header.startswith("獲得賞金") and result.prize_total is None:
+                    result.prize_total = text
+                elif header == "通算成績":
+                    result.record = text
+                elif header in ("調教師", "馬主", "生産者"):
+                    a_tag = td_elem.find("a", href=True)
+                    if not a_tag:
+                        continue
+                    name = cls._my_trim(a_tag.text)
+                    match = re.findall(
+                        r"\/(?:trainer|owner|breeder)\/(?:result\/recent\/)?(\w+)\/",
+                        a_tag.attrs['href'])
+                    tmp_id = match[0] if len(match) > 0 else None
+                    if header == "調教師":
+                        result.trainer_id, result.trainer_name = tmp_id, name
+                    elif header == "馬主":
+                        result.owner_id, result.owner_name = tmp_id, name
+                    else:
+                        result.breeder_id, result.breeder_name = tmp_id, name
 
-                result.append(tmp)
+        # 父・母・母父は2代血統表から
+        for row in cls._get_blood_table(soup, horse_id):
+            if row.position == "s":
+                result.sire_id = row.ancestor_id
+            elif row.position == "d":
+                result.dam_id = row.ancestor_id
+            elif row.position == "ds":
+                result.damsire_id = row.ancestor_id
+
+        return result
+
+    # 競走成績の見出し → HorseHistory_Row の属性
+    HORSE_HISTORY_HEADERS = {
+        "日付": "date",
+        "開催": "kaisai",
+        "天気": "weather",
+        "R": "race_no",
+        "レース名": "race_name",
+        "頭数": "field_size",
+        "枠番": "waku",
+        "馬番": "umaban",
+        "オッズ": "odds",
+        "人気": "popular",
+        "着順": "rank",
+        "騎手": "jockey_name",
+        "斤量": "jockey_weight",
+        "距離": "course",
+        "馬場": "state",
+        "タイム": "time",
+        "着差": "chakusa",
+        "通過": "passage_rate",
+        "ペース": "pace",
+        "上り": "agari",
+        "馬体重": "horse_weight",
+        "賞金": "prize",
+    }
+
+    # 競走成績の抽出
+    # 列の構成は表示設定で変わるので、見出しの名前で列を対応づける
+    @classmethod
+    def _get_horse_history(cls, soup, horse_id):
+        result = []
+        elem_base = soup.find("table", class_="db_h_race_results")
+        if elem_base:
+            th_elems = elem_base.find_all("th")
+            headers = [cls.HORSE_HISTORY_HEADERS.get(cls._my_trim(th_elem.text))
+                       for th_elem in th_elems]
+
+            for tr_elem in elem_base.find_all("tr"):
+                td_elems = tr_elem.find_all("td")
+                if len(td_elems) != len(headers):
+                    continue
+
+                tmp = HorseHistory_Row()
+                tmp.horse_id = horse_id
+                for attr, td_elem in zip(headers, td_elems):
+                    if attr:
+                        setattr(tmp, attr, cls._my_trim(td_elem.text))
+
+                    if attr == "race_name":
+                        # レースID
+                        a_tag = td_elem.find("a", href=True)
+                        if a_tag:
+                            match = re.findall(r"\/race\/(\w+)\/", a_tag.attrs['href'])
+                            if len(match) > 0:
+                                tmp.race_id = match[0]
+                    elif attr == "jockey_name":
+                        # 騎手ID
+                        a_tag = td_elem.find("a", href=True)
+                        if a_tag:
+                            match = re.findall(
+                                r"\/jockey\/(?:result\/recent\/)?(\w+)\/",
+                                a_tag.attrs['href'])
+                            if len(match) > 0:
+                                tmp.jockey_id = match[0]
+
+                if tmp.race_id:
+                    result.append(tmp)
+
+        return result
+
+    # 血統表の抽出（馬のページは2代、血統のページは5代）
+    # セルは父方を先にたどる順に並んでいるので、rowspan から世代を求め、
+    # 直前の1つ上の世代の祖先の父（s）、母（d）の順に割り当てる
+    @classmethod
+    def _get_blood_table(cls, soup, horse_id):
+        result = []
+        elem_base = soup.find("table", class_="blood_table")
+        if elem_base:
+            tr_elems = elem_base.find_all("tr")
+            n_rows = len(tr_elems)
+
+            # 世代ごとの直前の位置、位置ごとの割り当て済みの親の数
+            last_position = {0: ""}
+            n_parents = {}
+            for tr_elem in tr_elems:
+                for td_elem in tr_elem.find_all("td", recursive=False):
+                    try:
+                        rowspan = int(td_elem.attrs.get("rowspan", 1))
+                    except ValueError:
+                        rowspan = 1
+                    generation = round(math.log2(n_rows / rowspan))
+                    child = last_position.get(generation - 1)
+                    if child is None or n_parents.get(child, 0) >= 2:
+                        continue
+
+                    tmp = Pedigree_Row()
+                    tmp.horse_id = horse_id
+                    tmp.generation = generation
+                    tmp.position = child + ("s" if n_parents.get(child, 0) == 0 else "d")
+                    n_parents[child] = n_parents.get(child, 0) + 1
+                    last_position[generation] = tmp.position
+
+                    for a_tag in td_elem.find_all("a", href=True):
+                        match = re.findall(
+                            r"^(?:https?:\/\/db\.netkeiba\.com)?\/horse\/(?:ped\/)?(\w+)\/?$",
+                            a_tag.attrs['href'])
+                        if len(match) > 0:
+                            tmp.ancestor_id = match[0]
+                            tmp.ancestor_name = cls._my_trim(a_tag.text)
+                            break
+
+                    result.append(tmp)
 
         return result
 
@@ -383,120 +801,287 @@ class Scraper():
         text = text.replace("\n", "")
         return text.strip()
 
+    # ページを保存済みのものだけを返す
+    # 取得できなかったページ（crawl_failure に記録済み、--retry-failed で取得し直す）は飛ばす
+    def _saved(self, kind, items, key=lambda item: item):
+        saved = [item for item in items if self.store.exists(kind, key(item))]
+        if len(saved) < len(items):
+            get_metrics().count("missing_pages_total", len(items) - len(saved),
+                                kind=kind)
+            print(f"{kind}: {len(items) - len(saved)} pages are missing")
+        return saved
+
     def scrape_race_calendar(self):
-        save_dir = "data/race_calendar"
+        kind = "race_calendar"
         year_month_list = self._generate_date_list(
             self.period[0], self.period[1], relativedelta(months=1))
 
+        # 月が終わってから取得・解析した月はもう変わらないので飛ばす
+        # それ以外の月は Downloader の FreshnessPolicy で取り直すかを決める
+        settled = set()
+        if self.incremental:
+            settled = self.manifest.settled_keys(kind, SETTLE_INTERVALS[kind])
+
+        self.downloader.preload_fetched_at(
+            kind, [calendar_key(year_month) for year_month in year_month_list
+                   if calendar_key(year_month) not in settled])
         for year_month in tqdm(year_month_list, desc="開催日の取得"):
-            filename = f"{save_dir}/{year_month.year}-{year_month.month}.html"
-            self.downloader.download_kaisai_dates(year_month, filename)
+            key = calendar_key(year_month)
+            if key in settled:
+                continue
+            self.downloader.download_kaisai_dates(year_month)
+            # 取得できなかった月（crawl_failure に記録済み）は飛ばす
+            if not self.store.exists(kind, key):
+                continue
 
             try:
-                with open(filename, "r") as contents:
-                    bs_obj = BeautifulSoup(contents, "html.parser")
-
-                    table = bs_obj.find("table", class_="Calendar_Table")
-                    for week in table.find_all("tr", class_="Week"):
-                        for day in week.find_all("td", class_="RaceCellBox"):
-                            date = day.find("a", href=True)
-                            if date:
-                                kaisai_date = datetime.strptime(
-                                    date["href"][-8:], "%Y%m%d")
-                                if kaisai_date < datetime.today():
-                                    self.kaisai_dates.append(kaisai_date)
+                for kaisai_date in self._scrape_race_calendar_drivefunc(
+                        self.store, self.parser, key):
+                    if kaisai_date < datetime.today():
+                        self.kaisai_dates.append(kaisai_date)
+                        if self.manifest:
+                            self.manifest.record_discovered(
+                                "race_list", race_list_key(kaisai_date),
+                                kaisai_date.date())
+                if self.manifest:
+                    self.manifest.record_discovered(
+                        kind, key, date_type(year_month.year, year_month.month, 1))
+                    self.manifest.record_parsed(kind, key)
             except Exception:
-                print(f"Exception: {filename}")
+                print(f"Exception: {kind}/{key}")
                 print(traceback.format_exc())
                 break
 
+        if self.manifest:
+            self.manifest.flush()
+        if self.incremental:
+            # 飛ばした月の分も含め、レース一覧がまだ確定していない開催日
+            self.kaisai_dates = [
+                datetime(d.year, d.month, d.day)
+                for _, d in self.manifest.unsettled_keys(
+                    "race_list", SETTLE_INTERVALS["race_list"],
+                    self.period[0], self.period[1])]
+
+    # 開催日の一覧（まだ開催していない日も含む）を返す
+    @classmethod
+    def _scrape_race_calendar_drivefunc(cls, store, parser, key):
+        kind = "race_calendar"
+        metrics = get_metrics()
+        with metrics.timer("read", kind=kind):
+            contents = store.read(kind, key)
+        with metrics.timer("parse", kind=kind):
+            return parser.cached(kind, cls.PARSER_VERSIONS[kind], contents,
+                                 lambda: cls._get_kaisai_dates(parser, contents))
+
+    @classmethod
+    def _get_kaisai_dates(cls, parser, contents):
+        result = []
+        bs_obj = parser.parse(contents, cls.CALENDAR_PARTS)
+
+        table = bs_obj.find("table", class_="Calendar_Table")
+        for week in table.find_all("tr", class_="Week"):
+            for day in week.find_all("td", class_="RaceCellBox"):
+                date = day.find("a", href=True)
+                if date:
+                    result.append(datetime.strptime(date["href"][-8:], "%Y%m%d"))
+        return result
+
     @classmethod
-    def _scrape_race_list_drivefunc(cls, kaisai_date):
-        save_dir = "data/race_list"
+    def _scrape_race_list_drivefunc(cls, store, parser, kaisai_date):
+        kind = "race_list"
+        key = race_list_key(kaisai_date)
+        # self.downloader.download_race_list(kaisai_date)
+
+        metrics = get_metrics()
+        with metrics.timer("read", kind=kind):
+            contents = store.read(kind, key)
+        with metrics.timer("parse", kind=kind):
+            return parser.cached(kind, cls.PARSER_VERSIONS[kind], contents,
+                                 lambda: cls._get_race_ids(parser, contents))
 
+    @classmethod
+    def _get_race_ids(cls, parser, contents):
         href_patarn = r"\.\./race/result.html\?race_id=(.*)&rf=race_list"
-        filename = f"{save_dir}/{kaisai_date.year}-{kaisai_date.month}-{kaisai_date.day}.html"
-        # self.downloader.download_race_list(kaisai_date, filename)
-
-        with open(filename, "r") as contents:
-            bs_obj = BeautifulSoup(contents, "html.parser")
-
-            lst = []
-            if bs_obj:
-                elems = bs_obj.find_all(
-                    "li", class_="RaceList_DataItem")
-                for elem in elems:
-                    # 最初のaタグ
-                    a_tag = elem.find("a")
-                    if a_tag:
-                        href = a_tag.attrs['href']
-                        match = re.findall(href_patarn, href)
-                        if len(match) > 0:
-                            item_id = match[0]
-                            lst.append(item_id)
-            return lst
+        bs_obj = parser.parse(contents, cls.RACE_LIST_PARTS)
+
+        lst = []
+        if bs_obj:
+            elems = bs_obj.find_all(
+                "li", class_="RaceList_DataItem")
+            for elem in elems:
+                # 最初のaタグ
+                a_tag = elem.find("a")
+                if a_tag:
+                    href = a_tag.attrs['href']
+                    match = re.findall(href_patarn, href)
+                    if len(match) > 0:
+                        item_id = match[0]
+                        lst.append(item_id)
+        return lst
 
     def scrape_race_list(self):
+        if self.incremental:
+            # 確定していない開催日のうち、ttl が過ぎたものだけを取り直す
+            self.downloader.download_race_lists(
+                self.kaisai_dates, desc="レース一覧のダウンロード")
+
+        kaisai_dates = self._saved(
+            "race_list", self.kaisai_dates, race_list_key)
+        # 子プロセスで集計した値は結果と一緒に受け取る
+        drivefunc = partial(collect, partial(Scraper._scrape_race_list_drivefunc,
+                                             self.store, self.parser))
         with concurrent.futures.ProcessPoolExecutor() as executor:
-            results = list(tqdm(executor.map(Scraper._scrape_race_list_drivefunc,
-                           self.kaisai_dates), total=len(self.kaisai_dates),
-                           desc="レース一覧の取得"))
+            results = [merge_collected(result) for result in tqdm(
+                executor.map(drivefunc, kaisai_dates),
+                total=len(kaisai_dates), desc="レース一覧の取得")]
 
-        for result in results:
+        for kaisai_date, result in zip(kaisai_dates, results):
             for item in result:
                 self.race_id_list.append(item)
+                if self.manifest:
+                    self.manifest.record_discovered(
+                        "race_result", item, kaisai_date.date())
+            if self.manifest:
+                self.manifest.record_parsed(
+                    "race_list", race_list_key(kaisai_date))
+
+        if self.manifest:
+            self.manifest.flush()
+        if self.incremental:
+            # 過去の実行で投入しそびれたレースも含め、未投入のレース
+            self.race_id_list = self.manifest.unloaded_keys(
+                "race_result", self.period[0], self.period[1])
 
     @classmethod
-    def _scrape_race_result_drivefunc(cls, race_id):
-        save_dir = "data/race_result"
-        filename = f"{save_dir}/{race_id}.html"
-        # self.downloader.download_race_result(race_id, filename)
+    def _scrape_race_result_drivefunc(cls, store, parser, race_id):
+        kind = "race_result"
+        # self.downloader.download_race_result(race_id)
+
+        metrics = get_metrics()
+        with metrics.timer("read", kind=kind):
+            contents = store.read(kind, race_id)
+        with metrics.timer("parse", kind=kind):
+            return parser.cached(kind, cls.PARSER_VERSIONS[kind], contents,
+                                 lambda: cls._get_race_result(parser, race_id, contents),
+                                 race_id)
 
-        with open(filename, "r") as contents:
-            soup = BeautifulSoup(contents, "html.parser")
+    @classmethod
+    def _get_race_result(cls, parser, race_id, contents):
+        soup = parser.parse(contents, cls.RACE_RESULT_PARTS)
 
-            if soup:
-                result = RaceResult()
-                result.race_id = race_id
-                result.race_info = cls._get_race_info(soup)
-                result.race_order = cls._get_order(soup)
-                result.payout = cls._get_payout(soup)
-                result.rap_pace = cls._get_rap_pace(soup)
+        if soup:
+            result = RaceResult()
+            result.race_id = race_id
+            result.race_info = cls._get_race_info(soup)
+            result.race_order = cls._get_order(soup)
+            result.payout = cls._get_payout(soup)
+            result.rap_pace = cls._get_rap_pace(soup)
+            result.race_info.laps = lap_seconds(result.rap_pace)
 
-                result.race_info.race_id = race_id
-                for order in result.race_order:
-                    order.race_id = race_id
+            result.race_info.race_id = race_id
+            for order in result.race_order:
+                order.race_id = race_id
 
-                # self.race_results.append(result)
-                return result
+            # self.race_results.append(result)
+            return result
 
     def scrape_race_result(self):
+        race_ids = self._saved("race_result", self.race_id_list)
+        drivefunc = partial(collect, partial(Scraper._scrape_race_result_drivefunc,
+                                             self.store, self.parser))
         with concurrent.futures.ProcessPoolExecutor() as executor:
-            results = list(tqdm(executor.map(Scraper._scrape_race_result_drivefunc,
-                           self.race_id_list), total=len(self.race_id_list),
-                           desc="レース結果の取得"))
+            results = [merge_collected(result) for result in tqdm(
+                executor.map(drivefunc, race_ids),
+                total=len(race_ids), desc="レース結果の取得")]
 
         for result in results:
             if result:
                 self.race_results.append(result)
 
-    def scrape_horse(self, id):
-        save_dir = "data/horse"
-        dao = RaceResultDAO()
-        for i, horse_id in tenumerate(dao.get_horse_id(), desc="馬の取得"):
-            if i % 1 == id:
-                hid = horse_id[0]
-                filename = f"{save_dir}/{hid}.html"
-                self.downloader.download_horse_detail(hid, filename)
-
-    def scrape_ped(self, id):
-        save_dir = "data/ped"
-        dao = RaceResultDAO()
-        for i, horse_id in tenumerate(dao.get_horse_id(), desc="血統表の取得"):
-            if i % 1 == id:
-                hid = horse_id[0]
-                filename = f"{save_dir}/{hid}.html"
-                self.downloader.download_ped_detail(hid, filename)
+    # scrape_race_result() で解析したレースを DB に投入し、crawl_state に投入済みと記録する
+    # （--incremental で、次回から投入済みのレースを解析し直さないため）
+    def load_race_results(self, dao=None):
+        dao = dao or RaceResultDAO()
+        dao.insert_race_infos(result.race_info for result in self.race_results)
+        dao.insert_race_results(
+            row for result in self.race_results for row in result.race_order)
+        dao.insert_payouts(self.race_results)
+        dao.fill_race_dates()
+        if self.manifest:
+            for result in self.race_results:
+                self.manifest.record_loaded("race_result", result.race_id)
+            self.manifest.flush()
+
+    # (Horse, [HorseHistory_Row]) を返す
+    @classmethod
+    def _scrape_horse_drivefunc(cls, store, parser, horse_id):
+        metrics = get_metrics()
+        with metrics.timer("read", kind="horse"):
+            contents = store.read("horse", horse_id)
+        with metrics.timer("parse", kind="horse"):
+            soup = parser.parse(contents, cls.HORSE_PARTS)
+            return (cls._get_horse_profile(soup, horse_id),
+                    cls._get_horse_history(soup, horse_id))
+
+    # [Pedigree_Row] を返す
+    @classmethod
+    def _scrape_ped_drivefunc(cls, store, parser, horse_id):
+        metrics = get_metrics()
+        with metrics.timer("read", kind="ped"):
+            contents = store.read("ped", horse_id)
+        with metrics.timer("parse", kind="ped"):
+            soup = parser.parse(contents, cls.PED_PARTS)
+            return cls._get_blood_table(soup, horse_id)
+
+    # レース結果ページの取得を crawl_task で複数ワーカーに分配する
+    def scrape_race_result_pages(self, id):
+        queue = CrawlQueue("race_result", worker_name(id), self.store)
+        queue.dao.enqueue("race_result", self.race_id_list)
+        queue.run(self.downloader.download_race_results,
+                  desc="レース結果のダウンロード")
+        if self.manifest:
+            self.manifest.flush()
+
+    # 馬・血統表の取得は crawl_task で複数ワーカーに分配する
+    # enqueue=False のときは積み済みのキューをそのまま処理する
+    def scrape_horse(self, id, enqueue=True):
+        queue = CrawlQueue("horse", worker_name(id), self.store)
+        if enqueue:
+            queue.dao.enqueue_horse_ids("horse")
+        if self.incremental:
+            # 前回取得した後に出走した馬は取り直す
+            queue.dao.requeue_raced_horses("horse")
+        queue.run(
+            lambda horse_ids, force=False: self.downloader.download_horse_details(
+                horse_ids, progress=False, force=force),
+            desc="馬の取得")
+        if self.manifest:
+            self.manifest.flush()
+
+    def scrape_ped(self, id, enqueue=True):
+        queue = CrawlQueue("ped", worker_name(id), self.store)
+        if enqueue:
+            queue.dao.enqueue_horse_ids("ped")
+        queue.run(
+            lambda horse_ids, force=False: self.downloader.download_ped_details(
+                horse_ids, progress=False, force=force),
+            desc="血統表の取得")
+        if self.manifest:
+            self.manifest.flush()
+
+    # 馬と血統表をまとめて取得する（馬の列挙は1回だけ）
+    def scrape_horse_and_ped(self, id):
+        CrawlTaskDAO().enqueue_horse_ids(("horse", "ped"))
+        self.scrape_horse(id, enqueue=False)
+        self.scrape_ped(id, enqueue=False)
+
+
+def calendar_key(year_month):
+    return f"{year_month.year}-{year_month.month}"
+
+
+def race_list_key(kaisai_date):
+    return f"{kaisai_date.year}-{kaisai_date.month}-{kaisai_date.day}"
 
 
 def str_to_date(x): return datetime.strptime(x, "%Y%m%d")
@@ -0,0 +1,152 @@
+import queue
+import threading
+import traceback
+from contextlib import contextmanager
+
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+
+from lib.metrics.metrics import get_metrics
+from lib.scraping.retry import classify
+
+
+# 読み込まないリソース（Chrome の content settings、2 = ブロック）
+BLOCKED_CONTENT = ("images", "media_stream", "notifications", "geolocation",
+                   "plugins", "popups")
+# allowed_hosts に指定する既定値（広告・計測のスクリプトを読まない）
+ALLOWED_HOSTS = ("netkeiba.com", "*.netkeiba.com")
+
+
+# ページの取得に必要なものだけを読み込む Chrome の設定
+#   pageLoadStrategy eager: DOMContentLoaded で get() から戻る（要素は WebDriverWait で待つ）
+#   block_resources: 画像・プラグインなどを読まない
+#   allowed_hosts: 指定するとこれ以外のホストの名前解決を失敗させる
+#     （プロキシを使うときは名前解決をプロキシ側で行うので効かない）
+def chrome_options(proxy=None, headless=True, block_resources=True,
+                   allowed_hosts=None):
+    options = webdriver.ChromeOptions()
+    options.page_load_strategy = "eager"
+    if headless:
+        options.add_argument("--headless=new")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--disable-extensions")
+    options.add_argument("--mute-audio")
+    if block_resources:
+        options.add_argument("--blink-settings=imagesEnabled=false")
+        options.add_experimental_option("prefs", {
+            f"profile.managed_default_content_settings.{name}": 2
+            for name in BLOCKED_CONTENT})
+    if allowed_hosts:
+        rules = ", ".join(f"EXCLUDE {host}" for host in allowed_hosts)
+        options.add_argument(f"--host-resolver-rules=MAP * ~NOTFOUND, {rules}")
+    if proxy:
+        options.add_argument(f"--proxy-server={proxy}:3128")
+    return options
+
+
+class BrowserSession():
+    # webdriver.Remote のセッション1つと、そのセッションで読み込んだページ数
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+
+    # ページの JavaScript のヒープ（MB、分からなければ 0）
+    def heap_mb(self) -> float:
+        try:
+            used = self.driver.execute_script(
+                "return performance.memory ? performance.memory.usedJSHeapSize : 0")
+            return (used or 0) / (1 << 20)
+        except WebDriverException:
+            return 0.0
+
+    def quit(self) -> None:
+        try:
+            self.driver.quit()
+        except Exception:
+            pass
+
+
+class SeleniumPool():
+    # 1プロセスから複数の Selenium セッションを並行に使う
+    #   session(): 空いているセッションを借りる（なければ返されるまで待つ）
+    #   セッションは初めて借りるときに作り、max_pages ページ読み込んだか
+    #   ヒープが max_heap_mb を超えたら作り直す（Chrome のメモリの増加を抑える）
+    #   セッションが切れた・接続できないときは捨て、次に借りたときに接続し直す
+    # Selenium サーバ側のセッション数の上限（SE_NODE_MAX_SESSIONS）を size 以上にしておく
+    SIZE = 1
+    MAX_PAGES = 200
+    MAX_HEAP_MB = 512
+
+    def __init__(self, command_executor, size=SIZE, proxy=None,
+                 max_pages=MAX_PAGES, max_heap_mb=MAX_HEAP_MB, options=None,
+                 factory=None):
+        self.command_executor = command_executor
+        self.size = size
+        self.max_pages = max_pages
+        self.max_heap_mb = max_heap_mb
+        self.options = options or (lambda: chrome_options(proxy))
+        self.factory = factory or self._remote
+        # 空いているセッション（まだ作っていないものは None）
+        self._idle = queue.LifoQueue()
+        for _ in range(size):
+            self._idle.put(None)
+        self._lock = threading.Lock()
+        self._sessions: set[BrowserSession] = set()
+
+    def _remote(self):
+        return webdriver.Remote(command_executor=self.command_executor,
+                                options=self.options())
+
+    def _create(self) -> BrowserSession:
+        with get_metrics().timer("selenium_session", kind="create"):
+            session = BrowserSession(self.factory())
+        with self._lock:
+            self._sessions.add(session)
+        return session
+
+    def _discard(self, session: BrowserSession, reason) -> None:
+        get_metrics().count("selenium_sessions_recycled_total", reason=reason)
+        with self._lock:
+            self._sessions.discard(session)
+        session.quit()
+
+    def _expired(self, session: BrowserSession):
+        if session.pages >= self.max_pages:
+            return "pages"
+        if self.max_heap_mb and session.heap_mb() > self.max_heap_mb:
+            return "memory"
+        return None
+
+    # with pool.session() as driver: で使う
+    @contextmanager
+    def session(self):
+        session = self._idle.get()
+        try:
+            if session is None:
+                session = self._create()
+            yield session.driver
+        except Exception as e:
+            # 切れたセッションは捨てる（次に借りたときに作り直す）
+            if session is not None and classify(e) in ("session", "connection"):
+                self._discard(session, classify(e))
+                session = None
+            raise
+        finally:
+            if session is not None:
+                session.pages += 1
+                reason = self._expired(session)
+                if reason:
+                    self._discard(session, reason)
+                    session = None
+            self._idle.put(session)
+
+    def close(self) -> None:
+        with self._lock:
+            sessions, self._sessions = list(self._sessions), set()
+        for session in sessions:
+            try:
+                session.quit()
+            except Exception:
+                print(traceback.format_exc())
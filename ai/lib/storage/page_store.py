@@ -0,0 +1,256 @@
+import glob
+import mmap
+import os
+import socket
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+import zstandard
+
+
+# ダウンロードしたページの保存先
+# kind はページの種類（race_calendar / race_list / race_result / horse / ped）、
+# key はその中での ID（race_id、horse_id など）
+class PageStore(ABC):
+    @abstractmethod
+    def exists(self, kind, key) -> bool:
+        pass
+
+    @abstractmethod
+    def read(self, kind, key) -> str:
+        pass
+
+    @abstractmethod
+    def write(self, kind, key, source) -> None:
+        pass
+
+    @abstractmethod
+    def keys(self, kind) -> list[str]:
+        pass
+
+    # 保存した日時（分からなければ None）
+    def modified_at(self, kind, key):
+        return None
+
+    def close(self) -> None:
+        pass
+
+
+class FilePageStore(PageStore):
+    # 1ページ1ファイル（data/{kind}/{key}.html）
+    ROOT = "data"
+
+    def __init__(self, root=ROOT):
+        self.root = root
+
+    def __reduce__(self):
+        return (get_page_store, ("file", self.root))
+
+    def path(self, kind, key):
+        return f"{self.root}/{kind}/{key}.html"
+
+    def exists(self, kind, key) -> bool:
+        return os.path.isfile(self.path(kind, key))
+
+    def read(self, kind, key) -> str:
+        with open(self.path(kind, key), "r") as f:
+            return f.read()
+
+    def write(self, kind, key, source) -> None:
+        with open(self.path(kind, key), "w") as f:
+            f.write(source)
+
+    def modified_at(self, kind, key):
+        return datetime.fromtimestamp(os.path.getmtime(self.path(kind, key)))
+
+    def keys(self, kind) -> list[str]:
+        return sorted(os.path.basename(path)[:-len(".html")]
+                      for path in glob.glob(f"{self.root}/{kind}/*.html"))
+
+
+class PackPageStore(PageStore):
+    # ページを zstd で圧縮し、大きなセグメントファイルに追記していく
+    #   {root}/{kind}/{writer}-{n}.seg  圧縮済みページを連結したもの
+    #   {root}/{kind}/{writer}.idx      "key\tsegment\toffset\tlength\twritten_at" の追記ログ
+    #                                   （written_at は書き込んだ時刻の ns。古い形式の行にはない）
+    # 書き込みはワーカー（writer）ごとに別ファイルなので、複数ワーカーが同時に書ける
+    # 同じ key が複数回書かれた場合は written_at が最も新しいもの
+    # （同じ時刻なら同じ idx の後の行）が有効になる
+    ROOT = "data/pack"
+    SEGMENT_SIZE = 1 << 30
+    LEVEL = 3
+
+    def __init__(self, root=ROOT, writer=None, level=LEVEL):
+        self.root = root
+        self.writer = writer or f"{socket.gethostname()}-{os.getpid()}"
+        self.level = level
+        self._index: dict[str, dict[str, tuple[str, int, int, int]]] = {}
+        self._maps: dict[str, mmap.mmap] = {}
+        # 張り直す前のマップ（他のスレッドが読んでいるかもしれないので close() で閉じる）
+        self._stale_maps: list[mmap.mmap] = []
+        self._segments = {}
+        self._idx_files = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def __reduce__(self):
+        return (get_page_store, ("pack", self.root))
+
+    def __del__(self):
+        self.close()
+
+    def close(self) -> None:
+        for f, _ in self._segments.values():
+            f.close()
+        for f in self._idx_files.values():
+            f.close()
+        for mm in list(self._maps.values()) + self._stale_maps:
+            mm.close()
+        self._segments = {}
+        self._idx_files = {}
+        self._maps = {}
+        self._stale_maps = []
+
+    # zstd のコンテキストはスレッドごとに持つ
+    def _compressor(self):
+        if not hasattr(self._local, "cctx"):
+            self._local.cctx = zstandard.ZstdCompressor(level=self.level)
+        return self._local.cctx
+
+    def _decompressor(self):
+        if not hasattr(self._local, "dctx"):
+            self._local.dctx = zstandard.ZstdDecompressor()
+        return self._local.dctx
+
+    def _dir(self, kind):
+        return f"{self.root}/{kind}"
+
+    def _load_index(self, kind):
+        index = {}
+        for idx_path in sorted(glob.glob(f"{self._dir(kind)}/*.idx")):
+            with open(idx_path, "r") as f:
+                for line in f:
+                    # 書き込み途中で落ちた行は読み飛ばす
+                    if not line.endswith("\n"):
+                        continue
+                    parts = line[:-1].split("\t")
+                    if len(parts) == 4:
+                        parts.append("0")
+                    if len(parts) != 5:
+                        continue
+                    key, segment, offset, length, written_at = parts
+                    entry = (segment, int(offset), int(length), int(written_at))
+                    if key not in index or index[key][3] <= entry[3]:
+                        index[key] = entry
+        return index
+
+    # key → (segment, offset, length, written_at)
+    def index(self, kind) -> dict[str, tuple[str, int, int, int]]:
+        if kind not in self._index:
+            with self._lock:
+                if kind not in self._index:
+                    self._index[kind] = self._load_index(kind)
+        return self._index[kind]
+
+    # 他のワーカーが追記した分を読み込み直す
+    def refresh(self, kind=None) -> None:
+        with self._lock:
+            if kind is None:
+                self._index = {}
+            else:
+                self._index.pop(kind, None)
+
+    def exists(self, kind, key) -> bool:
+        return key in self.index(kind)
+
+    def _map(self, kind, segment, end):
+        path = f"{self._dir(kind)}/{segment}"
+        mm = self._maps.get(path)
+        # 追記中のセグメントはマップした後に伸びているので張り直す
+        if mm is None or len(mm) < end:
+            with self._lock:
+                mm = self._maps.get(path)
+                if mm is None or len(mm) < end:
+                    # 古いマップは他のスレッドが読んでいる可能性があるので、
+                    # ここでは閉じずに close() まで残す
+                    if mm is not None:
+                        self._stale_maps.append(mm)
+                    with open(path, "rb") as f:
+                        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    self._maps[path] = mm
+        return mm
+
+    def read_bytes(self, kind, key) -> bytes:
+        segment, offset, length, _ = self.index(kind)[key]
+        mm = self._map(kind, segment, offset + length)
+        return self._decompressor().decompress(mm[offset:offset + length])
+
+    def read(self, kind, key) -> str:
+        return self.read_bytes(kind, key).decode("utf-8")
+
+    def modified_at(self, kind, key):
+        written_at = self.index(kind)[key][3]
+        return datetime.fromtimestamp(written_at / 1e9) if written_at else None
+
+    def _segment_for_write(self, kind):
+        entry = self._segments.get(kind)
+        if entry and entry[0].tell() < self.SEGMENT_SIZE:
+            return entry
+        if entry:
+            entry[0].close()
+            n = int(entry[1].rsplit("-", 1)[1].split(".")[0]) + 1
+        else:
+            os.makedirs(self._dir(kind), exist_ok=True)
+            existing = glob.glob(f"{self._dir(kind)}/{self.writer}-*.seg")
+            n = max((int(path.rsplit("-", 1)[1].split(".")[0])
+                     for path in existing), default=0)
+        segment = f"{self.writer}-{n:05d}.seg"
+        f = open(f"{self._dir(kind)}/{segment}", "ab")
+        entry = (f, segment)
+        self._segments[kind] = entry
+        return entry
+
+    def write(self, kind, key, source) -> None:
+        self.write_bytes(kind, key, source.encode("utf-8"))
+
+    def write_bytes(self, kind, key, source: bytes) -> None:
+        data = self._compressor().compress(source)
+        with self._lock:
+            f, segment = self._segment_for_write(kind)
+            offset = f.tell()
+            written_at = time.time_ns()
+            f.write(data)
+            f.flush()
+            # 本体を書いてから索引を書く（索引にあるページは必ず読める）
+            idx = self._idx_files.get(kind)
+            if idx is None:
+                idx = open(f"{self._dir(kind)}/{self.writer}.idx", "a")
+                self._idx_files[kind] = idx
+            idx.write(f"{key}\t{segment}\t{offset}\t{len(data)}\t{written_at}\n")
+            idx.flush()
+            if kind in self._index:
+                self._index[kind][key] = (segment, offset, len(data), written_at)
+
+    def keys(self, kind) -> list[str]:
+        return sorted(self.index(kind))
+
+
+PAGE_STORES = {
+    "file": FilePageStore,
+    "pack": PackPageStore,
+}
+
+_opened_stores = {}
+
+
+# プロセスごとに同じ保存先は1つだけ開く
+# （ProcessPoolExecutor に渡したときも、子プロセス側で索引を読み直すのは1回だけ）
+def get_page_store(name="file", root=None, **kwargs) -> PageStore:
+    cls = PAGE_STORES[name]
+    root = root or cls.ROOT
+    cache_key = (name, root)
+    if cache_key not in _opened_stores:
+        _opened_stores[cache_key] = cls(root, **kwargs)
+    return _opened_stores[cache_key]
@@ -0,0 +1,80 @@
+import glob
+import hashlib
+import os
+import pickle
+import shutil
+
+from lib.storage.page_store import PackPageStore
+
+
+class ParseCache():
+    # ページの解析結果を、ページの内容のハッシュをキーにして保存しておく
+    #   {root}/{kind}/v{version}/  PackPageStore と同じ形式（zstd で圧縮して追記）
+    # 値は解析結果の pickle（レコードは __getstate__ で値のタプルだけになる）
+    # 過去のページは変わらないので、2回目以降の解析はページを読んでハッシュを求めるだけになる
+    # 解析処理を変えたときは kind ごとのバージョンを上げる（他の kind の結果はそのまま使える）
+    ROOT = "data/parse_cache"
+
+    def __init__(self, root=ROOT, writer=None):
+        self.root = root
+        self.pages = PackPageStore(root, writer)
+        self.hits = 0
+        self.misses = 0
+
+    def __reduce__(self):
+        return (get_parse_cache, (self.root,))
+
+    def close(self) -> None:
+        self.pages.close()
+
+    @classmethod
+    def _kind(cls, kind, version):
+        return f"{kind}/v{version}"
+
+    # salt: 同じページでも結果が変わりうる設定（解析エンジンなど）
+    @classmethod
+    def key(cls, contents: str, salt="") -> str:
+        digest = hashlib.blake2b(salt.encode("utf-8"), digest_size=16)
+        digest.update(contents.encode("utf-8"))
+        return digest.hexdigest()
+
+    # contents の解析結果（保存されていなければ parse() で求めて保存する）
+    # 解析で例外が起きたときは保存しない
+    def get_or_parse(self, kind, version, contents: str, parse, salt=""):
+        name = self._kind(kind, version)
+        key = self.key(contents, salt)
+        if self.pages.exists(name, key):
+            try:
+                value = pickle.loads(self.pages.read_bytes(name, key))
+                self.hits += 1
+                return value
+            except Exception:
+                # 読めない値は解析し直して書き直す
+                pass
+        value = parse()
+        self.misses += 1
+        self.pages.write_bytes(name, key,
+                               pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        return value
+
+    # kind の version 以外の保存済みの結果を消し、消したディレクトリを返す
+    def prune(self, kind, version) -> list[str]:
+        keep = os.path.join(self.root, self._kind(kind, version))
+        removed = []
+        for path in sorted(glob.glob(os.path.join(self.root, kind, "v*"))):
+            if os.path.normpath(path) != os.path.normpath(keep):
+                shutil.rmtree(path)
+                removed.append(path)
+        return removed
+
+
+_opened_caches = {}
+
+
+# プロセスごとに同じ保存先は1つだけ開く
+# 書き込むファイルはプロセスごとに別なので、fork で親から引き継いだものは使わない
+def get_parse_cache(root=None) -> ParseCache:
+    cache_key = (root or ParseCache.ROOT, os.getpid())
+    if cache_key not in _opened_caches:
+        _opened_caches[cache_key] = ParseCache(cache_key[0])
+    return _opened_caches[cache_key]
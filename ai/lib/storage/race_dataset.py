@@ -0,0 +1,403 @@
+import io
+import os
+from datetime import datetime
+from typing import Iterable, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+import psycopg2
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from lib.dao.race_result_dao import DSN
+
+
+def category():
+    return pa.dictionary(pa.int32(), pa.string())
+
+
+class DatasetTable(NamedTuple):
+    name: str
+    # 出力する列を返す SELECT（{where} に期間の条件が入る）
+    query: Optional[str]
+    # 期間を絞るときの日付の列（SQL）
+    date_column: str
+    keys: tuple
+    schema: pa.Schema
+    # 書き足すときに開催日ではなく、前回の書き出し以降に投入された（crawl_state の
+    # loaded_at が新しい）この種類のキー（keys[0]）で絞る
+    loaded_kind: Optional[str] = None
+
+
+RACE_INFO = DatasetTable(
+    name="race_info",
+    query="""
+    SELECT race_id, no, kind, length, direction, name, start, weather, state,
+           course, etc_1, etc_2, etc_3, etc_4, etc_5, etc_6, etc_7, etc_8,
+           race_date, laps
+    FROM race_info {where}
+    """,
+    date_column="race_date",
+    keys=("race_id",),
+    schema=pa.schema([
+        ("race_id", pa.string()),
+        ("no", pa.int8()),
+        ("kind", category()),
+        ("length", pa.int16()),
+        ("direction", category()),
+        ("name", pa.string()),
+        ("start", category()),
+        ("weather", category()),
+        ("state", category()),
+        ("course", category()),
+        *[(f"etc_{i}", category()) for i in range(1, 9)],
+        ("race_date", pa.date32()),
+        # 区間ごとのラップタイム（秒）。行列にするのは lib.features.pace.lap_matrix
+        ("laps", pa.list_(pa.float32())),
+    ]),
+)
+
+RACE_RESULT = DatasetTable(
+    name="race_result",
+    query="""
+    SELECT r.race_id, i.race_date, rank, waku, umaban, horse_name, horse_sex,
+           horse_age, jockey_weight::float8, jockey_name, time, chakusa,
+           popular, odds::float8, agari::float8, passage_rate, trainer_place,
+           trainer_name, horse_weight, horse_weight_delta, horse_id,
+           jockey_id, trainer_id, time_sec::float8, margin::float8, corners
+    FROM race_result r LEFT JOIN race_info i ON i.race_id = r.race_id {where}
+    """,
+    date_column="i.race_date",
+    keys=("race_id", "umaban"),
+    schema=pa.schema([
+        ("race_id", pa.string()),
+        ("race_date", pa.date32()),
+        ("rank", pa.int8()),
+        ("waku", pa.int8()),
+        ("umaban", pa.int8()),
+        ("horse_name", pa.string()),
+        ("horse_sex", category()),
+        ("horse_age", pa.int8()),
+        ("jockey_weight", pa.float64()),
+        ("jockey_name", category()),
+        ("time", pa.string()),
+        ("chakusa", category()),
+        ("popular", pa.int8()),
+        ("odds", pa.float64()),
+        ("agari", pa.float64()),
+        ("passage_rate", pa.string()),
+        ("trainer_place", category()),
+        ("trainer_name", category()),
+        ("horse_weight", pa.int16()),
+        ("horse_weight_delta", pa.int16()),
+        ("horse_id", pa.string()),
+        ("jockey_id", category()),
+        ("trainer_id", category()),
+        ("time_sec", pa.float64()),
+        ("margin", pa.float64()),
+        # corners を RaceResultNormalizer と同じく最後のコーナーを corner_4 にそろえて展開
+        *[(f"corner_{i}", pa.int8()) for i in range(1, 5)],
+    ]),
+)
+
+HORSE_HISTORY = DatasetTable(
+    name="horse_history",
+    query="""
+    SELECT horse_id, race_id, date, kaisai, weather, race_no, race_name,
+           field_size, waku, umaban, odds::float8, popular, rank, jockey_id,
+           jockey_name, jockey_weight::float8, course, state, time, chakusa,
+           passage_rate, pace, agari::float8, horse_weight, prize::float8
+    FROM horse_history {where}
+    """,
+    date_column="date",
+    keys=("horse_id", "race_id"),
+    # 新しく取得した馬は過去のレースもまとめて入るので、開催日では絞れない
+    loaded_kind="horse",
+    schema=pa.schema([
+        ("horse_id", pa.string()),
+        ("race_id", pa.string()),
+        ("date", pa.date32()),
+        ("kaisai", category()),
+        ("weather", category()),
+        ("race_no", pa.int8()),
+        ("race_name", pa.string()),
+        ("field_size", pa.int8()),
+        ("waku", pa.int8()),
+        ("umaban", pa.int8()),
+        ("odds", pa.float64()),
+        ("popular", pa.int8()),
+        ("rank", pa.int8()),
+        ("jockey_id", category()),
+        ("jockey_name", category()),
+        ("jockey_weight", pa.float64()),
+        ("course", category()),
+        ("state", category()),
+        ("time", pa.string()),
+        ("chakusa", category()),
+        ("passage_rate", pa.string()),
+        ("pace", pa.string()),
+        ("agari", pa.float64()),
+        ("horse_weight", pa.string()),
+        ("prize", pa.float64()),
+    ]),
+)
+
+RACE_PAYOUT = DatasetTable(
+    name="race_payout",
+    query="""
+    SELECT p.race_id, i.race_date, bet_type, combination, horse_1, horse_2,
+           horse_3, payout, ninki
+    FROM race_payout p LEFT JOIN race_info i ON i.race_id = p.race_id {where}
+    """,
+    date_column="i.race_date",
+    keys=("race_id", "bet_type", "combination"),
+    schema=pa.schema([
+        ("race_id", pa.string()),
+        ("race_date", pa.date32()),
+        ("bet_type", category()),
+        ("combination", pa.string()),
+        ("horse_1", pa.int8()),
+        ("horse_2", pa.int8()),
+        ("horse_3", pa.int8()),
+        ("payout", pa.int32()),
+        ("ninki", pa.int16()),
+    ]),
+)
+
+TABLES = {table.name: table for table in (RACE_INFO, RACE_RESULT, RACE_PAYOUT,
+                                          HORSE_HISTORY)}
+
+# pandas に変換するときの型（欠損を扱える型、文字列は Arrow のまま持つ型にする）
+PANDAS_TYPES = {
+    pa.int8(): pd.Int8Dtype(),
+    pa.int16(): pd.Int16Dtype(),
+    pa.int32(): pd.Int32Dtype(),
+    pa.int64(): pd.Int64Dtype(),
+    pa.float64(): pd.Float64Dtype(),
+    pa.string(): pd.StringDtype("pyarrow"),
+}
+
+
+def _corners(column, n_corners=4) -> list[pa.Array]:
+    # smallint[] のリテラル {3,3,2,1} を、最後のコーナーを n_corners 番目にそろえた列にする
+    lists = pc.split_pattern(pc.utf8_trim(column, "{}"), ",") \
+        .cast(pa.list_(pa.int8()))
+    if isinstance(lists, pa.ChunkedArray):
+        lists = lists.combine_chunks()
+    values = lists.values.to_numpy(zero_copy_only=False)
+    offsets = lists.offsets.to_numpy()
+    starts, ends = offsets[:-1], offsets[1:]
+    valid = lists.is_valid().to_numpy(zero_copy_only=False)
+    corners = []
+    for i in range(n_corners):
+        index = ends - (n_corners - i)
+        ok = valid & (index >= starts)
+        picked = values[np.where(ok, index, 0)] if len(values) else np.zeros(len(ok))
+        corners.append(pa.array(picked, type=pa.int8(), mask=~ok))
+    return corners
+
+
+class RaceDataset():
+    # 学習用に DB のテーブルを Parquet に書き出したもの
+    #   {root}/{table}/year={年}/part-0.parquet
+    # race_id の先頭4桁（年）でファイルを分け、ファイルの中は次の2桁（競馬場）ごとの
+    # 行グループにする（place 列）。年で絞るとそのファイルしか開かず、
+    # 競馬場で絞ると行グループの統計で他の競馬場を読み飛ばす
+    # （競馬場ごとにファイルを分けると、ファイル数が10倍になって全件の読み込みが遅くなる）
+    # 追記は年ごとに既存のファイルと主キーでまとめて書き直すので、
+    # 同じ開催日を何度書き出しても行は重複しない
+    ROOT = "data/dataset"
+    # 前回の書き出し日時（_ で始まるので pyarrow.dataset は読み飛ばす）
+    EXPORTED_AT = "_exported_at"
+    PARTITIONING = ds.partitioning(pa.schema([("year", pa.int16())]),
+                                   flavor="hive")
+
+    # tables: 書き出すテーブルの定義（DB から書き出さないもの（query が None）も置ける）
+    def __init__(self, root=ROOT, tables=None):
+        self.root = root
+        self.tables = tables or TABLES
+
+    def path(self, name, year):
+        return f"{self.root}/{name}/year={year}/part-0.parquet"
+
+    @classmethod
+    def conform(cls, table: DatasetTable, data) -> pa.Table:
+        # DB から読んだ文字列や pandas の DataFrame を table.schema の型にそろえる
+        if isinstance(data, pd.DataFrame):
+            data = pa.Table.from_pandas(data, preserve_index=False)
+        columns = {}
+        if "corners" in data.column_names and "corner_1" not in data.column_names:
+            for i, corner in enumerate(_corners(data["corners"])):
+                columns[f"corner_{i + 1}"] = corner
+        for field in table.schema:
+            column = columns.get(field.name)
+            if column is None and field.name in data.column_names:
+                column = data[field.name]
+            if column is None:
+                column = pa.nulls(len(data), field.type)
+            elif pa.types.is_dictionary(field.type) \
+                    and not pa.types.is_dictionary(column.type):
+                column = pc.dictionary_encode(column.cast(pa.string()))
+            elif pa.types.is_list(field.type) and pa.types.is_string(column.type):
+                # 配列のリテラル {12.3,11.8} を値のリストにする
+                column = pc.split_pattern(pc.utf8_trim(column, "{}"), ",")
+            columns[field.name] = column.cast(field.type)
+        return pa.Table.from_arrays([columns[field.name] for field in table.schema],
+                                    schema=table.schema)
+
+    @classmethod
+    def _key(cls, table: DatasetTable, data: pa.Table):
+        if len(table.keys) == 1:
+            return data[table.keys[0]]
+        return pc.binary_join_element_wise(
+            *[data[key].cast(pa.string()) for key in table.keys], "\t")
+
+    # rows を書き足す。既にある行は主キーが同じなら rows の方で置き換える
+    # 書き直した年の数を返す
+    def append(self, name, rows) -> int:
+        table = self.tables[name]
+        rows = self.conform(table, rows)
+        if len(rows) == 0:
+            return 0
+        years = pc.utf8_slice_codeunits(rows["race_id"], 0, 4)
+
+        for year in pc.unique(years).to_pylist():
+            part = rows.filter(pc.equal(years, year))
+            path = self.path(name, int(year))
+            if os.path.exists(path):
+                old = pq.read_table(path, columns=table.schema.names,
+                                    schema=table.schema)
+                old = old.filter(pc.invert(pc.is_in(
+                    self._key(table, old), value_set=self._key(table, part))))
+                part = pa.concat_tables([old, part]).unify_dictionaries()
+            # 分類の列（dictionary 型）は並べ替えられないので文字列に戻したキーで並べる
+            keys = pa.table({key: part[key].cast(pa.string())
+                             if pa.types.is_dictionary(part[key].type) else part[key]
+                             for key in table.keys})
+            part = part.take(pc.sort_indices(
+                keys, sort_keys=[(key, "ascending") for key in table.keys])) \
+                .combine_chunks()
+            places = pc.utf8_slice_codeunits(part["race_id"], 4, 6)
+            part = part.append_column("place", places)
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # race_id の順に並べてあるので、競馬場ごとに続いている
+            with pq.ParquetWriter(path + ".tmp", part.schema) as writer:
+                for place in pc.unique(places).to_pylist():
+                    writer.write_table(part.filter(pc.equal(places, place)))
+            os.replace(path + ".tmp", path)
+        return len(pc.unique(years))
+
+    def dataset(self, name) -> ds.Dataset:
+        schema = self.tables[name].schema.append(pa.field("place", pa.string()))
+        return ds.dataset(f"{self.root}/{name}", format="parquet",
+                          schema=schema.append(pa.field("year", pa.int16())),
+                          partitioning=self.PARTITIONING)
+
+    # 条件に合う行を読む
+    #   years / places: 年・競馬場（"05" など）の絞り込み
+    #   filter: pyarrow.compute の式（例: pc.field("race_date") >= date(2020, 1, 1)）
+    #           Parquet の行グループの統計で読み飛ばせる部分は読まない
+    def to_table(self, name, columns=None, years: Iterable[int] = None,
+                 places: Iterable[str] = None, filter=None) -> pa.Table:
+        if not os.path.isdir(f"{self.root}/{name}"):
+            return self.tables[name].schema.empty_table()
+        conditions = []
+        if years is not None:
+            conditions.append(pc.field("year").isin(list(years)))
+        if places is not None:
+            conditions.append(pc.field("place").isin(list(places)))
+        if filter is not None:
+            conditions.append(filter)
+        expression = None
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+        return self.dataset(name).to_table(columns=columns, filter=expression)
+
+    # to_table の結果を pandas で。分類の列は category 型、整数は Int 型、日付は datetime64 になる
+    def read(self, name, columns=None, years=None, places=None,
+             filter=None) -> pd.DataFrame:
+        return self.to_table(name, columns, years, places, filter).to_pandas(
+            types_mapper=PANDAS_TYPES.get, date_as_object=False)
+
+    # 書き出し済みの最後の開催日（なければ None）
+    def last_date(self, name="race_info"):
+        table = self.tables[name]
+        column = table.schema.field(table.date_column.split(".")[-1]).name
+        dates = self.to_table(name, columns=[column])[column]
+        return pc.max(dates).as_py() if len(dates) else None
+
+    # 前回 name を書き出した日時（なければ None）
+    def exported_at(self, name) -> Optional[datetime]:
+        path = f"{self.root}/{name}/{self.EXPORTED_AT}"
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return datetime.fromisoformat(f.read().strip())
+
+    # 次に書き足すときの起点（テーブルごと）
+    #   loaded_kind のあるテーブルは前回の書き出し日時、それ以外は最後の開催日
+    def watermark(self, name):
+        if self.tables[name].loaded_kind:
+            return self.exported_at(name)
+        return self.last_date(name)
+
+    # 開催日のないまま書き出した行のキー（keys[0]）
+    def undated_keys(self, name) -> list:
+        table = self.tables[name]
+        column = table.schema.field(table.date_column.split(".")[-1]).name
+        keys = self.to_table(name, columns=[table.keys[0]],
+                             filter=pc.field(column).is_null())[table.keys[0]]
+        return pc.unique(keys).to_pylist()
+
+    # since 以降の行に絞る WHERE 句とそのパラメータ
+    #   loaded_kind のあるテーブル: since 以降に投入されたキーの行
+    #   それ以外: since 以降の開催日の行と、開催日のない行
+    #     （開催日のないまま書き出した行も、後で開催日が埋まったら書き直す）
+    def _where(self, table: DatasetTable, since) -> tuple[str, list]:
+        if since is None:
+            return "", []
+        if table.loaded_kind:
+            return (f"WHERE {table.keys[0]} IN (SELECT key FROM crawl_state "
+                    "WHERE kind = %s AND loaded_at >= %s)",
+                    [table.loaded_kind, since])
+        alias, _, _ = table.date_column.rpartition(".")
+        key = f"{alias}.{table.keys[0]}" if alias else table.keys[0]
+        return (f"WHERE ({table.date_column} >= %s "
+                f"OR {table.date_column} IS NULL OR {key} = ANY(%s))",
+                [since, self.undated_keys(table.name)])
+
+    # DB から name のテーブルを書き出す。since 以降の分だけ（None なら全件）
+    # (行数, 書き直した年の数) を返す
+    def export(self, name, dsn=DSN, since=None) -> tuple[int, int]:
+        table = self.tables[name]
+        where, params = self._where(table, since)
+        conn = psycopg2.connect(dsn)
+        try:
+            with conn.cursor() as curs:
+                # 書き出しを始めた時刻を記録する（書き出し中に投入された分は次回も対象になる）
+                curs.execute("SELECT now()")
+                exported_at = curs.fetchone()[0]
+                query = curs.mogrify(table.query.format(where=where),
+                                     params).decode()
+                buffer = io.BytesIO()
+                curs.copy_expert(
+                    f"COPY ({query}) TO STDOUT "
+                    "WITH (FORMAT csv, HEADER, NULL '\\N')", buffer)
+        finally:
+            conn.close()
+
+        buffer.seek(0)
+        rows = pa_csv.read_csv(buffer, convert_options=pa_csv.ConvertOptions(
+            column_types={name: pa.string()
+                          for name in table.schema.names + ["corners"]},
+            null_values=["\\N"], strings_can_be_null=True,
+            quoted_strings_can_be_null=False))
+        n_years = self.append(name, rows)
+        os.makedirs(f"{self.root}/{name}", exist_ok=True)
+        with open(f"{self.root}/{name}/{self.EXPORTED_AT}", "w") as f:
+            f.write(exported_at.isoformat())
+        return len(rows), n_years
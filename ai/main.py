@@ -1,8 +1,21 @@
 import argparse
+import atexit
 from datetime import datetime
 import lib.scraping.scraping as scraping
 from lib.scraping.scraping import Downloader, Scraper
+from lib.dao.crawl_failure_dao import CrawlFailureDAO
+from lib.dao.crawl_state_dao import CrawlStateDAO
 from lib.dao.race_result_dao import RaceResultDAO
+from lib.scraping.crawl_queue import worker_name
+from lib.metrics.metrics import MetricsExporter
+from lib.scraping.html_parser import HtmlParser
+from lib.scraping.pipeline import (HorsePipeline, PedigreePipeline,
+                                   RaceResultPipeline)
+from lib.scraping.retry import RetryPolicy
+from lib.scraping.selenium_pool import (ALLOWED_HOSTS, SeleniumPool,
+                                        chrome_options)
+from lib.storage.page_store import PAGE_STORES, get_page_store
+from lib.storage.parse_cache import ParseCache
 
 
 if __name__ == "__main__":
@@ -13,22 +26,106 @@ if __name__ == "__main__":
                         default=datetime.today())
     parser.add_argument("-i", "--id", type=int, default=0)
     parser.add_argument("--proxy", default=None)
+    # ホストごとの取得レート（リクエスト/秒）とバースト
+    parser.add_argument("--rate", type=float, default=1 / Downloader.WAIT_TIME)
+    parser.add_argument("--burst", type=int, default=1)
+    # 同時に発行するリクエスト数（2以上で asyncio による並行取得）
+    parser.add_argument("-c", "--concurrency", type=int, default=1)
+    # レース一覧・結果を並行に読み込む Selenium のセッション数と、
+    # セッションを作り直すまでのページ数
+    parser.add_argument("--sessions", type=int, default=SeleniumPool.SIZE)
+    parser.add_argument("--session-pages", type=int,
+                        default=SeleniumPool.MAX_PAGES)
+    # netkeiba.com 以外のホスト（広告・計測）に接続しない
+    parser.add_argument("--block-third-party", action="store_true")
+    # ページの保存形式（file: 1ページ1ファイル、pack: 圧縮してセグメントに追記）
+    parser.add_argument("--store", choices=list(PAGE_STORES), default="file")
+    parser.add_argument("--store-root", default=None)
+    # HTML の解析エンジンと、必要な部分木だけを解析するか
+    parser.add_argument("--parser", choices=HtmlParser.ENGINES,
+                        default="html.parser")
+    parser.add_argument("--partial-parse", action="store_true")
+    # 解析結果をページの内容のハッシュで保存しておき、変わっていないページは解析しない
+    parser.add_argument("--parse-cache", nargs="?", const=ParseCache.ROOT,
+                        default=None)
+    # crawl_state を見て、新しい開催日・レース・出走した馬だけを処理する
+    parser.add_argument("--incremental", action="store_true")
+    # 失敗したページの取得の試行回数（指数バックオフで再試行する）
+    parser.add_argument("--max-attempts", type=int,
+                        default=RetryPolicy.MAX_ATTEMPTS)
+    # crawl_failure に残っているページだけを取得し直す（種類を指定するとその種類だけ）
+    parser.add_argument("--retry-failed", nargs="*", default=None,
+                        metavar="KIND")
+    # 取得済みの馬・血統表のページを解析して horse / horse_history / pedigree に投入する
+    parser.add_argument("--load-horses", action="store_true")
+    # 段階ごとの時間・件数・エラー数を {worker}.jsonl と {worker}.prom に書き出す
+    parser.add_argument("--metrics-dir", default=None)
+    parser.add_argument("--metrics-interval", type=float,
+                        default=MetricsExporter.INTERVAL)
     args = parser.parse_args()
 
-    downloader = Downloader(args.id, args.proxy)
+    store_options = {"writer": worker_name(args.id)} \
+        if args.store == "pack" else {}
+    store = get_page_store(args.store, args.store_root, **store_options)
+    manifest = CrawlStateDAO()
+    selenium = SeleniumPool(
+        Downloader.command_executor(args.id), args.sessions,
+        max_pages=args.session_pages,
+        options=lambda: chrome_options(
+            args.proxy,
+            allowed_hosts=ALLOWED_HOSTS if args.block_third_party else None))
+    downloader = Downloader(args.id, args.proxy, args.rate, args.burst,
+                            args.concurrency, store, manifest,
+                            RetryPolicy(args.max_attempts), CrawlFailureDAO(),
+                            selenium)
     scraping_period = (args.start, args.end)
 
-    scraper = Scraper(downloader, scraping_period)
+    parse_cache = ParseCache(args.parse_cache) if args.parse_cache else None
+    html_parser = HtmlParser(args.parser, args.partial_parse, parse_cache)
+    scraper = Scraper(downloader, scraping_period, store, html_parser,
+                      manifest, args.incremental)
+    if args.metrics_dir:
+        exporter = MetricsExporter(args.metrics_dir, worker_name(args.id),
+                                   args.metrics_interval)
+        exporter.start()
+        atexit.register(exporter.stop)
     # scraper.scrape_race_calendar()
     # scraper.scrape_race_list()
+    # scraper.scrape_race_result_pages(args.id)
     # scraper.scrape_race_result()
-    scraper.scrape_horse(args.id)
-    scraper.scrape_ped(args.id)
+    # scraper.load_race_results()
+    # 解析結果をメモリに溜めず、解析しながら DB に投入する場合
+    # RaceResultPipeline(store, html_parser, manifest=manifest).run(
+    #     scraper.race_id_list, total=len(scraper.race_id_list))
+    if args.incremental and args.retry_failed is None:
+        # 新しい開催日・まだ投入していないレースだけを取得・解析・投入する
+        # （投入したレースは crawl_state に記録され、次回は対象から外れる）
+        scraper.scrape_race_calendar()
+        scraper.scrape_race_list()
+        scraper.scrape_race_result_pages(args.id)
+        RaceResultPipeline(store, html_parser, manifest=manifest).run(
+            scraper.race_id_list, total=len(scraper.race_id_list))
+    if args.retry_failed is not None:
+        # 前回までに取得できなかったページだけを取得し直す
+        resolved, remaining = downloader.retry_failed(args.retry_failed or None)
+        print(f"retried: {resolved} resolved, {remaining} remaining")
+        for kind, error_class, count in downloader.dead_letters.summary():
+            print(f"  {kind:<14} {error_class:<14} {count}")
+    else:
+        scraper.scrape_horse_and_ped(args.id)
+    if args.load_horses:
+        # 取得済みの馬・血統表のページを解析して投入する
+        HorsePipeline(store, html_parser, manifest=manifest).run(
+            store.keys("horse"))
+        PedigreePipeline(store, html_parser, manifest=manifest).run(
+            store.keys("ped"))
 
     # scraper.race_results[0].show_race_result()
 
     # race_result_dao = RaceResultDAO()
-    # for results in scraper.race_results:
-    #     race_result_dao.insert_race_info(results.race_info)
-    #     # for result in results.race_order:
-    #     #     race_result_dao.insert_race_result(result)
+    # race_result_dao.insert_race_infos(
+    #     results.race_info for results in scraper.race_results)
+    # race_result_dao.insert_race_results(
+    #     row for results in scraper.race_results for row in results.race_order)
+    # race_result_dao.insert_payouts(scraper.race_results)
+    # race_result_dao.fill_race_dates()
@@ -0,0 +1,15 @@
+CREATE TABLE IF NOT EXISTS crawl_failure(
+    kind            varchar(32)      Not Null,  -- race_calendar / race_list / race_result / horse / ped
+    key             varchar(128)     Not Null,  -- 年月 / 開催日 / race_id / horse_id
+    url             text,
+    error_class     varchar(32)      Not Null,  -- timeout / connection / not_found など（lib/scraping/retry.py）
+    error           text,                       -- 最後の例外
+    failures        integer          Not Null DEFAULT 1,  -- 再試行しても取得できなかった回数
+    first_failed_at timestamptz      Not Null DEFAULT now(),
+    last_failed_at  timestamptz      Not Null DEFAULT now(),
+    resolved_at     timestamptz,                -- 後で取得できた日時
+    PRIMARY KEY (kind, key)
+);
+
+CREATE INDEX IF NOT EXISTS crawl_failure_unresolved_idx
+    ON crawl_failure (kind, key) WHERE resolved_at IS NULL;
@@ -0,0 +1,14 @@
+CREATE TABLE IF NOT EXISTS crawl_state(
+    kind            varchar(32)      Not Null,  -- race_calendar / race_list / race_result / horse / ped
+    key             varchar(128)     Not Null,  -- 年月 / 開催日 / race_id / horse_id
+    entity_date     date,                       -- 月初 / 開催日 / レースの開催日
+    content_hash    char(40),                   -- 最後に取得したページの SHA-1
+    fetched_at      timestamptz,                -- 最後に取得した日時
+    changed_at      timestamptz,                -- ページの内容が最後に変わった日時
+    parsed_at       timestamptz,
+    loaded_at       timestamptz,
+    PRIMARY KEY (kind, key)
+);
+
+CREATE INDEX IF NOT EXISTS crawl_state_date_idx
+    ON crawl_state (kind, entity_date);
@@ -0,0 +1,15 @@
+CREATE TABLE IF NOT EXISTS crawl_task(
+    kind            varchar(32)      Not Null,  -- horse / ped / race_result
+    key             varchar(128)     Not Null,  -- horse_id / race_id
+    status          varchar(16)      Not Null DEFAULT 'pending',  -- pending / running / done / failed
+    worker          varchar(128),
+    lease_until     timestamptz,
+    attempts        integer          Not Null DEFAULT 0,
+    last_error      text,
+    refetch         boolean          Not Null DEFAULT false,  -- 保存済みのページも取り直す
+    updated_at      timestamptz      Not Null DEFAULT now(),
+    PRIMARY KEY (kind, key)
+);
+
+CREATE INDEX IF NOT EXISTS crawl_task_claim_idx
+    ON crawl_task (kind, status, lease_until);
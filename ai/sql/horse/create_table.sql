@@ -0,0 +1,77 @@
+CREATE TABLE IF NOT EXISTS horse(
+    horse_id            varchar(128)     Not Null,
+    name                varchar(128),
+    status              varchar(32),     -- 現役 / 抹消
+    sex                 varchar(8),
+    coat_color          varchar(32),
+    birthday            date,
+    trainer_id          varchar(128),
+    trainer_name        varchar(128),
+    owner_id            varchar(128),
+    owner_name          varchar(128),
+    breeder_id          varchar(128),
+    breeder_name        varchar(128),
+    birthplace          varchar(128),
+    sale_price          varchar(128),
+    prize_total         varchar(255),
+    record              varchar(255),
+    sire_id             varchar(128),
+    dam_id              varchar(128),
+    damsire_id          varchar(128),
+    PRIMARY KEY (horse_id)
+);
+
+CREATE TABLE IF NOT EXISTS horse_history(
+    horse_id            varchar(128)     Not Null,
+    race_id             varchar(128)     Not Null,
+    date                date,
+    kaisai              varchar(128),
+    weather             varchar(32),
+    race_no             integer,
+    race_name           varchar(255),
+    field_size          integer,
+    waku                integer,
+    umaban              integer,
+    odds                decimal,
+    popular             integer,
+    rank                integer,
+    jockey_id           varchar(128),
+    jockey_name         varchar(128),
+    jockey_weight       decimal,
+    course              varchar(32),     -- 芝1600 など
+    state               varchar(32),
+    time                varchar(32),
+    chakusa             varchar(32),
+    passage_rate        varchar(128),
+    pace                varchar(32),
+    agari               decimal,
+    horse_weight        varchar(32),
+    prize               decimal,
+    PRIMARY KEY (horse_id, race_id)
+);
+
+CREATE INDEX IF NOT EXISTS horse_history_race_id_idx ON horse_history (race_id);
+
+CREATE TABLE IF NOT EXISTS pedigree(
+    horse_id            varchar(128)     Not Null,
+    position            varchar(8)       Not Null,  -- s: 父, d: 母, ds: 母父, ...
+    generation          integer          Not Null,
+    ancestor_id         varchar(128),
+    ancestor_name       varchar(255),
+    PRIMARY KEY (horse_id, position)
+);
+
+CREATE INDEX IF NOT EXISTS pedigree_ancestor_id_idx ON pedigree (ancestor_id);
+
+-- 馬ごとの祖先（pedigree と horse の父母から作る閉包、tools/build_pedigree.py で更新）
+-- ancestor_id で引けば、その馬の子孫が1回の検索で分かる
+CREATE TABLE IF NOT EXISTS pedigree_closure(
+    horse_id            varchar(128)     Not Null,
+    ancestor_id         varchar(128)     Not Null,
+    generation          smallint         Not Null,  -- 一番近い経路の世代（父母が 1）
+    n_paths             smallint         Not Null,  -- 経路の数（2 以上はその祖先のクロス）
+    PRIMARY KEY (horse_id, ancestor_id)
+);
+
+CREATE INDEX IF NOT EXISTS pedigree_closure_ancestor_id_idx
+    ON pedigree_closure (ancestor_id, generation);
@@ -16,14 +16,20 @@ CREATe TABLE IF NOT EXISTS race_info(
             etc_5       varchar(255),
             etc_6       varchar(255),
             etc_7       varchar(255),
-            etc_8       varchar(255)
-)
+            etc_8       varchar(255),
+            race_date   date,               -- 開催日（crawl_state から補完）
+            laps        decimal[],          -- ラップタイム（区間ごとの秒、最初の区間は 200m 未満のことがある）
+            PRIMARY KEY (race_id)
+);
 
+CREATE INDEX IF NOT EXISTS race_info_race_date_idx ON race_info (race_date);
+
+-- race_id は「年(4桁) + 場 + 回 + 日 + R」なので、race_id の範囲で年ごとに分割する
 CREATE TABLE IF NOT EXISTS race_result(
     race_id             varchar(128)     Not Null,
     rank                integer,
     waku                integer,
-    umaban              integer,
+    umaban              integer          Not Null,
     horse_name          varchar(128),
     horse_sex           char(1),
     horse_age           integer,
@@ -41,5 +47,45 @@ CREATE TABLE IF NOT EXISTS race_result(
     horse_weight_delta  integer,
     horse_id            varchar(128),
     jockey_id           varchar(128),
-    trainer_id          varchar(128)
-)
+    trainer_id          varchar(128),
+    time_sec            decimal,         -- タイム（秒）
+    margin              decimal,         -- 着差（馬身）
+    corners             smallint[],      -- コーナー通過順
+    PRIMARY KEY (race_id, umaban)
+) PARTITION BY RANGE (race_id);
+
+DO $$
+BEGIN
+    FOR year IN 1986..2035 LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS race_result_%s PARTITION OF race_result '
+            'FOR VALUES FROM (%L) TO (%L)', year, year::text, (year + 1)::text);
+    END LOOP;
+END
+$$;
+
+CREATE TABLE IF NOT EXISTS race_result_default PARTITION OF race_result DEFAULT;
+
+CREATE INDEX IF NOT EXISTS race_result_horse_id_idx ON race_result (horse_id);
+CREATE INDEX IF NOT EXISTS race_result_jockey_id_idx ON race_result (jockey_id);
+CREATE INDEX IF NOT EXISTS race_result_trainer_id_idx ON race_result (trainer_id);
+
+-- 払い戻し（payout は100円あたりの円）
+-- combination は馬番（枠連は枠番）を "-" でつないだもの。馬単・3連単以外は小さい順
+CREATE TABLE IF NOT EXISTS race_payout(
+    race_id             varchar(128)     Not Null,
+    bet_type            varchar(16)      Not Null,  -- tansho / fukusho / ... / tan3
+    combination         varchar(16)      Not Null,
+    horse_1             smallint,
+    horse_2             smallint,
+    horse_3             smallint,
+    payout              integer,
+    ninki               integer,
+    PRIMARY KEY (race_id, bet_type, combination)
+);
+
+-- 型変換した列を追加する前に作ったテーブル向け
+ALTER TABLE race_result ADD COLUMN IF NOT EXISTS time_sec decimal;
+ALTER TABLE race_result ADD COLUMN IF NOT EXISTS margin decimal;
+ALTER TABLE race_result ADD COLUMN IF NOT EXISTS corners smallint[];
+ALTER TABLE race_info ADD COLUMN IF NOT EXISTS laps decimal[];
@@ -0,0 +1,96 @@
+import argparse
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from tqdm import tqdm
+
+from lib.dao.crawl_failure_dao import CrawlFailureDAO
+from lib.dao.race_result_dao import DSN
+from lib.scraping.page_validator import PAGE_RULES, check_page
+from lib.storage.page_store import PAGE_STORES, FilePageStore, get_page_store
+
+
+# 保存済みのページを lib.scraping.page_validator の条件で確かめ、
+# エラーページ・途中で切れたページの一覧を出す
+#   python -m tools.audit_pages                        # 種類・理由ごとの件数
+#   python -m tools.audit_pages --output invalid.tsv   # kind, key, reason の一覧
+#   python -m tools.audit_pages --record               # crawl_failure に記録する
+#     （python main.py --retry-failed で取得し直す）
+#   python -m tools.audit_pages --quarantine           # data/_invalid/{kind}/ に移す（file のみ）
+
+CHUNK_SIZE = 500
+
+
+# 1チャンク分のページを確かめ、よくないページの (key, reason) を返す
+def audit_chunk(store, kind, keys):
+    invalid = []
+    for key in keys:
+        try:
+            reason = check_page(kind, store.read(kind, key))
+        except UnicodeDecodeError:
+            reason = "undecodable"
+        if reason:
+            invalid.append((key, reason))
+    return invalid
+
+
+def audit(store, kind, workers):
+    keys = store.keys(kind)
+    chunks = [keys[i:i + CHUNK_SIZE] for i in range(0, len(keys), CHUNK_SIZE)]
+    invalid = []
+    with ProcessPoolExecutor(workers) as executor:
+        futures = [executor.submit(audit_chunk, store, kind, chunk)
+                   for chunk in chunks]
+        for future in tqdm(futures, desc=f"{kind} の監査"):
+            invalid.extend(future.result())
+    return len(keys), invalid
+
+
+def quarantine(store: FilePageStore, kind, keys):
+    directory = f"{store.root}/_invalid/{kind}"
+    os.makedirs(directory, exist_ok=True)
+    for key in keys:
+        os.replace(store.path(kind, key), f"{directory}/{key}.html")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--store", choices=list(PAGE_STORES), default="file")
+    parser.add_argument("--root", default=None)
+    parser.add_argument("--kind", action="append", choices=list(PAGE_RULES))
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--output", default=None,
+                        help="よくないページの一覧（TSV）の書き出し先")
+    parser.add_argument("--record", action="store_true",
+                        help="crawl_failure に error_class invalid_page で記録する")
+    parser.add_argument("--dsn", default=DSN)
+    parser.add_argument("--quarantine", action="store_true",
+                        help="よくないページを _invalid に移す（--store file のみ）")
+    args = parser.parse_args()
+    if args.quarantine and args.store != "file":
+        parser.error("--quarantine は --store file でのみ使える")
+
+    store = get_page_store(args.store, args.root)
+    results = {}
+    for kind in args.kind or PAGE_RULES:
+        n_pages, invalid = audit(store, kind, args.workers)
+        results[kind] = invalid
+        print(f"{kind}: {len(invalid)} / {n_pages} invalid")
+        reasons = Counter(reason for _, reason in invalid)
+        for reason, count in reasons.most_common():
+            print(f"  {reason:<32} {count}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            for kind, invalid in results.items():
+                for key, reason in invalid:
+                    f.write(f"{kind}\t{key}\t{reason}\n")
+    if args.record:
+        CrawlFailureDAO(args.dsn).record_many(
+            (kind, key, None, "invalid_page", reason)
+            for kind, invalid in results.items() for key, reason in invalid)
+    if args.quarantine:
+        for kind, invalid in results.items():
+            if invalid:
+                quarantine(store, kind, [key for key, _ in invalid])
@@ -0,0 +1,32 @@
+import argparse
+
+import numpy as np
+
+from lib.dao.horse_dao import HorseDAO
+from lib.dao.race_result_dao import DSN
+from lib.pedigree.pedigree_graph import GENERATIONS, PedigreeGraph
+
+
+# pedigree と horse の父母から血統のグラフを作り直し、
+# data/pedigree/graph.npz への保存と pedigree_closure の更新を行う
+#   python -m tools.build_pedigree
+#   python -m tools.build_pedigree --no-closure   # グラフの保存だけ
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dsn", default=DSN)
+    parser.add_argument("--root", default=PedigreeGraph.ROOT)
+    parser.add_argument("--generations", type=int, default=GENERATIONS)
+    parser.add_argument("--no-closure", action="store_true",
+                        help="pedigree_closure を更新しない")
+    args = parser.parse_args()
+
+    graph = PedigreeGraph.from_db(args.dsn)
+    known = (graph.sire >= 0) | (graph.dam >= 0)
+    print(f"graph: {len(graph)} horses ({np.count_nonzero(known)} with parents)"
+          f" -> {graph.save(args.root)}")
+
+    if not args.no_closure:
+        n_rows = HorseDAO(args.dsn).insert_pedigree_closure_tuples(
+            graph.closure_tuples(np.flatnonzero(known), args.generations))
+        print(f"pedigree_closure: {n_rows} rows")
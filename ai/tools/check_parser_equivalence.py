@@ -0,0 +1,74 @@
+import argparse
+import time
+from datetime import datetime
+
+from lib.scraping.html_parser import HtmlParser
+from lib.scraping.scraping import Scraper
+from lib.storage.page_store import PAGE_STORES, get_page_store
+
+
+# 保存済みのページを2つの解析エンジンで解析し、結果が一致するかを確かめる
+#   python -m tools.check_parser_equivalence --engine lxml --partial
+
+
+def as_plain(obj):
+    if isinstance(obj, (list, tuple)):
+        return [as_plain(v) for v in obj]
+    if isinstance(obj, dict):
+        return {k: as_plain(v) for k, v in obj.items()}
+    if hasattr(obj, "__dict__"):
+        return as_plain(vars(obj))
+    if hasattr(obj, "__slots__"):
+        return {k: as_plain(getattr(obj, k)) for k in obj.__slots__}
+    return obj
+
+
+def parse_race_list(store, parser, key):
+    return Scraper._scrape_race_list_drivefunc(
+        store, parser, datetime.strptime(key, "%Y-%m-%d"))
+
+
+def parse_race_result(store, parser, key):
+    return as_plain(Scraper._scrape_race_result_drivefunc(store, parser, key))
+
+
+CHECKS = {
+    "race_list": parse_race_list,
+    "race_result": parse_race_result,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--store", choices=list(PAGE_STORES), default="file")
+    parser.add_argument("--store-root", default=None)
+    parser.add_argument("--engine", choices=HtmlParser.ENGINES, default="lxml")
+    parser.add_argument("--partial", action="store_true")
+    parser.add_argument("-n", "--limit", type=int, default=None)
+    args = parser.parse_args()
+
+    store = get_page_store(args.store, args.store_root)
+    baseline = HtmlParser()
+    candidate = HtmlParser(args.engine, args.partial)
+
+    mismatched = 0
+    for kind, check in CHECKS.items():
+        keys = store.keys(kind)[:args.limit]
+        elapsed = [0.0, 0.0]
+        for key in keys:
+            results = []
+            for i, html_parser in enumerate((baseline, candidate)):
+                start = time.perf_counter()
+                results.append(check(store, html_parser, key))
+                elapsed[i] += time.perf_counter() - start
+            if results[0] != results[1]:
+                mismatched += 1
+                print(f"mismatch: {kind}/{key}")
+        if keys:
+            print(f"{kind}: {len(keys)} pages, "
+                  f"html.parser {len(keys) / elapsed[0]:.1f} pages/s, "
+                  f"{args.engine}{' (partial)' if args.partial else ''} "
+                  f"{len(keys) / elapsed[1]:.1f} pages/s")
+
+    if mismatched:
+        raise SystemExit(f"{mismatched} pages differ")
@@ -0,0 +1,33 @@
+import argparse
+from datetime import date
+
+from lib.dao.race_result_dao import DSN
+from lib.storage.race_dataset import TABLES, RaceDataset
+
+
+# DB のテーブルを学習用の Parquet（lib/storage/race_dataset.py）に書き出す
+# --since を省略すると、テーブルごとに前回の続きだけを書き足す
+#   race_info / race_result / race_payout: 書き出し済みの最後の開催日以降と、開催日のないレース
+#   horse_history: 前回の書き出し以降に投入された馬（crawl_state の loaded_at）
+#   python -m tools.export_dataset --dsn postgresql://...
+#   python -m tools.export_dataset --full            # 全件を書き直す
+#   python -m tools.export_dataset --since 2024-01-01 --tables race_result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dsn", default=DSN)
+    parser.add_argument("--root", default=RaceDataset.ROOT)
+    parser.add_argument("--tables", nargs="+", choices=list(TABLES),
+                        default=list(TABLES))
+    # horse_history はこの日以降に投入された馬
+    parser.add_argument("--since", type=date.fromisoformat)
+    parser.add_argument("--full", action="store_true",
+                        help="開催日で絞らずに全件を書き出す")
+    args = parser.parse_args()
+
+    dataset = RaceDataset(args.root)
+    for name in args.tables:
+        since = None if args.full else args.since or dataset.watermark(name)
+        n_rows, n_years = dataset.export(name, args.dsn, since)
+        print(f"{name:<14} {n_rows:>9} rows {n_years:>5} years"
+              f"  since: {since or 'all'}")
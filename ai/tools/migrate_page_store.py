@@ -0,0 +1,44 @@
+import argparse
+import os
+
+from tqdm import tqdm
+
+from lib.storage.page_store import FilePageStore, PackPageStore
+
+
+# data/{kind}/*.html をパック形式の保存先に取り込む
+# 取り込み済みの key は読み飛ばすので、途中で止めても再実行できる
+#   python -m tools.migrate_page_store --src data --dst data/pack
+
+KINDS = ("race_calendar", "race_list", "race_result", "horse", "ped")
+
+
+def dir_size(path):
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            total += os.path.getsize(os.path.join(dirpath, name))
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--src", default=FilePageStore.ROOT)
+    parser.add_argument("--dst", default=PackPageStore.ROOT)
+    parser.add_argument("--kind", action="append", choices=KINDS)
+    parser.add_argument("--level", type=int, default=PackPageStore.LEVEL)
+    args = parser.parse_args()
+
+    src = FilePageStore(args.src)
+    dst = PackPageStore(args.dst, writer="migrate", level=args.level)
+
+    for kind in args.kind or KINDS:
+        keys = [key for key in src.keys(kind) if not dst.exists(kind, key)]
+        for key in tqdm(keys, desc=kind):
+            dst.write(kind, key, src.read(kind, key))
+
+        before = dir_size(f"{args.src}/{kind}")
+        after = dir_size(f"{args.dst}/{kind}")
+        print(f"{kind}: {before / 2**20:.1f} MiB -> {after / 2**20:.1f} MiB")
+
+    dst.close()
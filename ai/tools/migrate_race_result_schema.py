@@ -0,0 +1,79 @@
+import argparse
+
+import psycopg2
+
+from lib.dao.race_result_dao import DSN, RaceResultDAO
+
+
+# 主キー・インデックスのない旧 race_info / race_result を
+# sql/race_result/create_table.sql の構成（主キー、年ごとの分割）に移す
+# 重複している行は後から投入したものを残し、馬番のない行は捨てる
+# 全体を1トランザクションで行うので、途中で失敗しても元のまま
+#   python -m tools.migrate_race_result_schema --dsn postgresql://...
+
+CREATE_TABLE_SQL = "sql/race_result/create_table.sql"
+
+
+def count(curs, table):
+    curs.execute(f"SELECT count(*) FROM {table}")
+    return curs.fetchone()[0]
+
+
+def is_migrated(curs):
+    curs.execute("""
+    SELECT 1 FROM pg_partitioned_table p
+    JOIN pg_class c ON c.oid = p.partrelid
+    WHERE c.relname = 'race_result' AND pg_table_is_visible(c.oid)
+    """)
+    return curs.fetchone() is not None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dsn", default=DSN)
+    parser.add_argument("--keep-old", action="store_true",
+                        help="旧テーブルを *_old として残す")
+    args = parser.parse_args()
+
+    # 旧テーブルにはラップタイム（laps）の列がない
+    info_columns = ", ".join(c for c in RaceResultDAO.RACE_INFO_COLUMNS
+                             if c != "laps")
+    result_columns = ", ".join(RaceResultDAO.RACE_RESULT_COLUMNS)
+
+    conn = psycopg2.connect(args.dsn)
+    with conn.cursor() as curs:
+        if is_migrated(curs):
+            print("race_result is already partitioned")
+            raise SystemExit(0)
+
+        before = (count(curs, "race_info"), count(curs, "race_result"))
+        curs.execute("ALTER TABLE race_info RENAME TO race_info_old")
+        curs.execute("ALTER TABLE race_result RENAME TO race_result_old")
+        with open(CREATE_TABLE_SQL) as f:
+            curs.execute(f.read())
+
+        curs.execute(f"""
+        INSERT INTO race_info ({info_columns})
+        SELECT DISTINCT ON (race_id) {info_columns}
+        FROM race_info_old
+        ORDER BY race_id, ctid DESC
+        """)
+        curs.execute(f"""
+        INSERT INTO race_result ({result_columns})
+        SELECT DISTINCT ON (race_id, umaban) {result_columns}
+        FROM race_result_old
+        WHERE umaban IS NOT NULL
+        ORDER BY race_id, umaban, ctid DESC
+        """)
+        after = (count(curs, "race_info"), count(curs, "race_result"))
+
+        if not args.keep_old:
+            curs.execute("DROP TABLE race_info_old")
+            curs.execute("DROP TABLE race_result_old")
+    conn.commit()
+    conn.close()
+
+    n_dates = RaceResultDAO(args.dsn).fill_race_dates()
+    print(f"race_info:   {before[0]} -> {after[0]} rows")
+    print(f"race_result: {before[1]} -> {after[1]} rows")
+    print(f"race_date:   {n_dates} rows filled from crawl_state")
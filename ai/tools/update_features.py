@@ -0,0 +1,18 @@
+import argparse
+
+from lib.features.feature_store import FeatureStore
+from lib.storage.race_dataset import RaceDataset
+
+
+# 学習用の Parquet（tools/export_dataset.py で書き出したもの）から、
+# まだ求めていないレースの特徴量を求めて data/features に書き足す
+#   python -m tools.update_features
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset-root", default=RaceDataset.ROOT)
+    parser.add_argument("--root", default=FeatureStore.ROOT)
+    args = parser.parse_args()
+
+    store = FeatureStore(RaceDataset(args.dataset_root), args.root)
+    print(f"features: {store.update()} races added")